@@ -0,0 +1,259 @@
+"""Sales analytics from hourly and daily rollup tables.
+
+HourlySales and DailySales hold orders, units and revenue per time bucket
+for the whole store, for each category and for each product, so reports
+over any date range read a few hundred pre-aggregated rows instead of
+scanning orders and their lines.
+
+The rollups are kept up to date with deltas: checkout queues one for each
+new order, and Commerce.signals queues a negative one when an order is
+cancelled or deleted (and a positive one if it is reinstated). The deltas
+are applied by an outbox job, so checkout only pays for one INSERT.
+Order.sales_recorded says whether an order's lines are in the rollups, so
+only what was added is ever taken away. Orders created outside checkout
+are left out until they are reinstated or rebuild() recomputes everything
+from the order lines, e.g. after a bulk load.
+
+Buckets are hours and days in the current time zone. A product row keeps
+the category the product was in when it sold; rebuild() uses its current
+category. Cancelled orders are not counted.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, When
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from . import outbox
+from .models import Category, DailySales, HourlySales, Order, OrderItem, Product
+from .upserts import increments, upsert
+
+
+GRANULARITIES = ('day', 'hour')
+# Hourly reports are limited to this many days
+MAX_HOURLY_DAYS = 31
+TOP_LIMIT = 10
+REBUILD_BATCH_SIZE = 5000
+
+STORE = Q(category__isnull=True, product__isnull=True)
+CATEGORIES = Q(category__isnull=False, product__isnull=True)
+PRODUCTS = Q(product__isnull=False)
+
+CENTS = Decimal('0.01')
+
+REVENUE = Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def counted(status):
+    return status != 'cancelled'
+
+
+def hour_of(moment):
+    """Start of the local hour containing ``moment``"""
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def order_lines(order):
+    """(product_id, category_id, units, revenue) for each line of a saved order"""
+    return [(product_id, category_id, quantity, quantity * price) for product_id, category_id, quantity, price
+            in OrderItem.objects.filter(order=order).values_list('product_id', 'product__category_id',
+                                                                  'quantity', 'price')]
+
+
+def _queue(order, lines, sign):
+    if lines:
+        outbox.enqueue('record_sales', hour=hour_of(order.created_at).isoformat(), sign=sign,
+                       lines=[[product_id, category_id, units, str(revenue)]
+                              for product_id, category_id, units, revenue in lines])
+
+
+def order_placed(order, lines):
+    """Queue a new order's sales; ``lines`` as returned by order_lines().
+
+    The order must have been created with sales_recorded set, so a later
+    cancellation knows there is something to take away.
+    """
+    if counted(order.status):
+        _queue(order, lines, 1)
+
+
+def _mark(order, recorded):
+    order.sales_recorded = recorded
+    Order.objects.filter(pk=order.pk).update(sales_recorded=recorded)
+
+
+def order_changed(order, old_status):
+    """Take a cancelled order's recorded sales away, or add a reinstated order's"""
+    if counted(order.status) == counted(old_status):
+        return
+    if counted(order.status) and not order.sales_recorded:
+        _queue(order, order_lines(order), 1)
+        _mark(order, True)
+    elif not counted(order.status) and order.sales_recorded:
+        _queue(order, order_lines(order), -1)
+        _mark(order, False)
+
+
+def order_deleted(order):
+    """Called before the order and its lines are deleted"""
+    if order.sales_recorded:
+        _queue(order, order_lines(order), -1)
+
+
+# The partial unique constraint each level of a bucket upserts on
+LEVELS = (
+    ('store', ['bucket'], '"category_id" IS NULL AND "product_id" IS NULL'),
+    ('category', ['bucket', 'category'], '"category_id" IS NOT NULL AND "product_id" IS NULL'),
+    ('product', ['bucket', 'product'], '"product_id" IS NOT NULL'),
+)
+
+
+def _level(category_id, product_id):
+    if product_id is not None:
+        return 'product'
+    return 'store' if category_id is None else 'category'
+
+
+@transaction.atomic
+def apply(hour, lines, sign=1):
+    """Add one order's lines (or take them away, with ``sign`` -1) to its hour and day.
+
+    Lines whose product has since been deleted are skipped, as rebuild()
+    would no longer see them; a line whose category has been deleted goes
+    to the product's current one.
+    """
+    products = dict(Product.objects.filter(pk__in=[line[0] for line in lines]).values_list('pk', 'category_id'))
+    categories = set(Category.objects.filter(pk__in=[line[1] for line in lines]).values_list('pk', flat=True))
+    # Every level counts the order once, however many of its lines it holds
+    deltas = defaultdict(lambda: [1, 0, Decimal('0.00')])
+    for product_id, category_id, units, revenue in lines:
+        if product_id not in products:
+            continue
+        if category_id not in categories:
+            category_id = products[product_id]
+        for key in ((None, None), (category_id, None), (category_id, product_id)):
+            deltas[key][1] += units
+            deltas[key][2] += Decimal(revenue)
+    # One upsert per level and table, adding to the rows already there
+    for model, bucket in ((HourlySales, hour), (DailySales, hour.date())):
+        for level, conflict, where in LEVELS:
+            rows = [{'bucket': bucket, 'category': category_id, 'product': product_id,
+                     'orders': sign * orders, 'units': sign * units, 'revenue': sign * revenue}
+                    for (category_id, product_id), (orders, units, revenue) in deltas.items()
+                    if _level(category_id, product_id) == level]
+            upsert(model, rows, conflict, increments('orders', 'units', 'revenue'), where=where)
+
+
+def _hourly_rows():
+    """HourlySales rows for every level, aggregated from the order lines in SQL"""
+    lines = OrderItem.objects.filter(~Q(order__status='cancelled')).annotate(
+        bucket=TruncHour('order__created_at', tzinfo=timezone.get_current_timezone()))
+    levels = [
+        ([], {}),
+        (['product__category_id'], {'category_id': 'product__category_id'}),
+        (['product__category_id', 'product_id'], {'category_id': 'product__category_id',
+                                                   'product_id': 'product_id'}),
+    ]
+    for fields, names in levels:
+        rows = (lines.values('bucket', *fields)
+                .annotate(n_orders=Count('order_id', distinct=True), n_units=Sum('quantity'), n_revenue=REVENUE)
+                .order_by().iterator(chunk_size=REBUILD_BATCH_SIZE))
+        for row in rows:
+            yield HourlySales(bucket=row['bucket'], orders=row['n_orders'], units=row['n_units'],
+                              revenue=row['n_revenue'], **{name: row[field] for name, field in names.items()})
+
+
+def _daily_rows():
+    """DailySales rows summed from the hourly ones; an order falls in exactly one hour"""
+    rows = (HourlySales.objects.values('category_id', 'product_id',
+                                       day=TruncDate('bucket', tzinfo=timezone.get_current_timezone()))
+            .annotate(n_orders=Sum('orders'), n_units=Sum('units'), n_revenue=Sum('revenue'))
+            .order_by().iterator(chunk_size=REBUILD_BATCH_SIZE))
+    for row in rows:
+        yield DailySales(bucket=row['day'], category_id=row['category_id'], product_id=row['product_id'],
+                         orders=row['n_orders'], units=row['n_units'], revenue=row['n_revenue'])
+
+
+def _insert(model, rows):
+    count = 0
+    while batch := list(islice(rows, REBUILD_BATCH_SIZE)):
+        model.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute both rollup tables from the order lines; returns the row counts"""
+    HourlySales.objects.all().delete()
+    DailySales.objects.all().delete()
+    Order.objects.update(sales_recorded=Case(When(status='cancelled', then=False), default=True))
+    return {'hourly': _insert(HourlySales, _hourly_rows()), 'daily': _insert(DailySales, _daily_rows())}
+
+
+def start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _totals(rows):
+    return rows.annotate(total_orders=Sum('orders'), total_units=Sum('units'), total_revenue=Sum('revenue'))
+
+
+def cents(rows):
+    """Round ``total_revenue`` in aggregate rows; SQLite sums decimals as floats"""
+    for row in rows:
+        row['total_revenue'] = Decimal(row['total_revenue'] or 0).quantize(CENTS)
+    return rows
+
+
+def report(date_from, date_to, granularity='day', limit=TOP_LIMIT):
+    """Sales between two dates (inclusive) from the rollups, in four queries.
+
+    Returns the store's ``series`` with one entry per hour or day (empty
+    buckets included), the range ``totals`` and the top ``categories`` and
+    ``products`` by revenue.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity {granularity!r}')
+    if granularity == 'hour':
+        if (date_to - date_from).days >= MAX_HOURLY_DAYS:
+            raise ValueError(f'Hourly reports cover at most {MAX_HOURLY_DAYS} days')
+        # Stepped in UTC so a daylight saving change neither skips nor repeats an hour
+        start, end = (start_of(day).astimezone(dt_timezone.utc)
+                      for day in (date_from, date_to + timedelta(days=1)))
+        step = timedelta(hours=1)
+        model, in_range = HourlySales, {'bucket__gte': start, 'bucket__lt': end}
+    else:
+        start, end, step = date_from, date_to + timedelta(days=1), timedelta(days=1)
+        model, in_range = DailySales, {'bucket__gte': date_from, 'bucket__lte': date_to}
+
+    found = {row.bucket: row for row in model.objects.filter(STORE, **in_range)}
+    series = []
+    bucket = start
+    while bucket < end:
+        row = found.get(bucket)
+        series.append({'bucket': bucket, 'orders': row.orders if row else 0, 'units': row.units if row else 0,
+                       'revenue': row.revenue if row else Decimal('0.00')})
+        bucket += step
+    totals = {key: sum(entry[key] for entry in series) for key in ('orders', 'units', 'revenue')}
+
+    # Whole days are read from the daily table whatever the granularity
+    days = {'bucket__gte': date_from, 'bucket__lte': date_to}
+    categories = _totals(DailySales.objects.filter(CATEGORIES, **days)
+                         .values('category_id', name=F('category__name')))
+    # Grouped on the covering index alone; names are read for the top rows only
+    products = cents(list(_totals(DailySales.objects.filter(PRODUCTS, **days).values('product_id'))
+                          .order_by('-total_revenue', 'product_id')[:limit]))
+    names = Product.objects.only('name', 'sku').in_bulk([row['product_id'] for row in products])
+    for row in products:
+        row.update(name=names[row['product_id']].name, sku=names[row['product_id']].sku)
+    return {
+        'series': series,
+        'totals': totals,
+        'categories': cents(list(categories.order_by('-total_revenue', 'category_id')[:limit])),
+        'products': products,
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CommerceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Commerce'
+
+    def ready(self):
+        from . import jobs, signals  # noqa: F401
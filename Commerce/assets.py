@@ -0,0 +1,164 @@
+"""Fingerprinted, precompressed static files and in-process asset serving.
+
+collectstatic with HashedCompressedStorage writes every static file to
+STATIC_ROOT under a content-hashed name (css/base.3f2a9c1e8b7d.css) and,
+for text assets, gzip and (when the brotli package is installed) brotli
+siblings next to it. AssetMiddleware serves STATIC_ROOT and MEDIA_ROOT from
+the Django process: it picks the smallest precompressed variant the client
+accepts and marks content-addressed files (hashed static names and the
+product images from Commerce.images) immutable for a year, so browsers
+never ask for them again.
+"""
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import cached_property
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .images import DERIVED_DIR, ORIGINALS_DIR
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants only
+    brotli = None
+
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.xml', '.html', '.ico')
+# Below this the compressed file rarely saves a packet
+MIN_COMPRESS_SIZE = 256
+# (file suffix, Content-Encoding), best first
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=300'
+
+
+def compressors():
+    """(file suffix, compress function) for each encoding available here"""
+    found = []
+    if brotli is not None:
+        found.append(('.br', lambda data: brotli.compress(data, quality=11)))
+    found.append(('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)))
+    return found
+
+
+def compress_file(path):
+    """Write the compressed siblings of ``path`` that come out smaller; returns {suffix: size}"""
+    with open(path, 'rb') as file:
+        data = file.read()
+    sizes = {}
+    for suffix, compress in compressors():
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            sizes[suffix] = len(compressed)
+    return sizes
+
+
+def accepted_encodings(request):
+    """Content codings from Accept-Encoding, leaving out any refused with q=0"""
+    accepted = set()
+    for token in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = token.partition(';')
+        _, _, quality = params.partition('q=')
+        try:
+            refused = quality and float(quality) == 0
+        except ValueError:
+            refused = False
+        if not refused:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class HashedCompressedStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also precompresses text assets.
+
+    Until collectstatic has written a manifest (development, tests) names
+    are served unhashed instead of raising.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted({*paths, *self.hashed_files.values()}):
+            if name.endswith(COMPRESSIBLE) and self.size(name) >= MIN_COMPRESS_SIZE:
+                compress_file(self.path(name))
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    @cached_property
+    def hashed_names(self):
+        return frozenset(self.hashed_files.values())
+
+
+def is_immutable(root, name):
+    """Whether the file's name changes whenever its content does"""
+    if root == 'static':
+        return name in getattr(staticfiles_storage, 'hashed_names', ())
+    return name.startswith((f'{DERIVED_DIR}/', f'{ORIGINALS_DIR}/'))
+
+
+def serve(request, root, name):
+    """A response for ``name`` under the ``root`` ('static' or 'media') directory, or None"""
+    directory = settings.STATIC_ROOT if root == 'static' else settings.MEDIA_ROOT
+    if not directory or not name:
+        return None
+    try:
+        path = safe_join(directory, name)
+    except SuspiciousFileOperation:
+        return None
+    if not os.path.isfile(path):
+        return None
+
+    immutable = is_immutable(root, name)
+    mtime = os.stat(path).st_mtime
+    if not immutable and not was_modified_since(request.headers.get('If-Modified-Since'), mtime):
+        return HttpResponseNotModified()
+
+    served, encoding = path, None
+    if name.endswith(COMPRESSIBLE):
+        accepted = accepted_encodings(request)
+        for suffix, candidate in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + suffix):
+                served, encoding = path + suffix, candidate
+                break
+    content_type, _ = mimetypes.guess_type(path)
+    response = FileResponse(open(served, 'rb'), content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if name.endswith(COMPRESSIBLE):
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['Cache-Control'] = IMMUTABLE if immutable else REVALIDATE
+    if not immutable:
+        response['Last-Modified'] = http_date(mtime)
+    return response
+
+
+class AssetMiddleware(MiddlewareMixin):
+    """Answer GET/HEAD requests for collected static files and uploaded media.
+
+    Requests for files that are not on disk fall through to the URLconf,
+    so development keeps working before collectstatic has run.
+    """
+
+    def process_request(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        for root, prefix in (('static', settings.STATIC_URL), ('media', settings.MEDIA_URL)):
+            if prefix and prefix.startswith('/') and request.path.startswith(prefix):
+                return serve(request, root, request.path[len(prefix):])
+        return None
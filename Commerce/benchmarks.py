@@ -0,0 +1,207 @@
+"""Synthetic data and result reporting shared by the bench_* management commands.
+
+generate() fills the database with a reproducible catalog, customers, carts
+and orders at a given scale, writing in batches so memory stays flat from a
+thousand rows up to millions. Results are dicts of per-operation latency
+percentiles, throughput and query counts; write_results() saves them as
+JSON tagged with the current git commit, and compare() reports the change
+against an earlier run.
+"""
+import json
+import random
+import subprocess
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from . import analytics, catalog_cache, search, stats
+from .models import Cart, CartItem, Category, Order, OrderItem, Product, User
+from .profiling import percentile
+
+
+ADJECTIVES = ['organic', 'wireless', 'premium', 'compact', 'classic', 'smart', 'fresh', 'leather',
+              'stainless', 'portable', 'vintage', 'ergonomic', 'waterproof', 'bamboo', 'cotton']
+NOUNS = ['headphones', 'jacket', 'sneakers', 'kettle', 'lamp', 'backpack', 'speaker', 'blender',
+         'mat', 'bottle', 'watch', 'pillow', 'charger', 'tent', 'bread', 'salmon', 'spinach', 'mug']
+
+USERNAME_PREFIX = 'bench-'
+PASSWORD = 'bench-pass-123'
+BATCH_SIZE = 5000
+
+# --scale presets: products, customers, orders
+SCALES = {
+    '1k': (1_000, 100, 1_000),
+    '10k': (10_000, 1_000, 10_000),
+    '100k': (100_000, 10_000, 100_000),
+    '1m': (1_000_000, 100_000, 1_000_000),
+}
+
+
+def username(n):
+    return f'{USERNAME_PREFIX}{n:07d}'
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@contextmanager
+def _explicit_created_at(*models):
+    """Let bulk_create keep the created_at values we set instead of stamping now()"""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def generate(products=1000, customers=100, orders=1000, categories=20, cart_ratio=0.2, days=365, seed=1, log=None):
+    """Create a synthetic store; returns the counts created.
+
+    Orders are spread over the last ``days`` days. Customers are named
+    bench-0000000, bench-0000001, ... and share the password PASSWORD.
+    Derived data that signals would normally maintain (stats, search
+    index, catalog cache) is rebuilt once at the end.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    now = timezone.now()
+
+    category_ids = [category.pk for category in Category.objects.bulk_create([
+        Category(name=f'Bench {NOUNS[i % len(NOUNS)]} {i}') for i in range(categories)
+    ])]
+
+    product_prices = {}
+    with _explicit_created_at(Product):
+        for batch in _batches(
+            Product(name=f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {i}',
+                    description=f'A {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} with {rng.choice(ADJECTIVES)} finish.',
+                    price=Decimal(rng.randint(100, 50_000)) / 100, stock=rng.randint(0, 500),
+                    category_id=rng.choice(category_ids), sku=f'BENCH-{seed}-{i:08d}',
+                    created_at=now - timedelta(seconds=rng.randint(0, days * 86400)))
+            for i in range(products)
+        ):
+            product_prices.update((product.pk, product.price) for product in Product.objects.bulk_create(batch))
+    product_ids = list(product_prices)
+    log(f'{products} products')
+
+    password = make_password(PASSWORD)
+    start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+    user_ids = []
+    for batch in _batches(
+        User(username=username(n), email=f'{username(n)}@example.com', password=password,
+             date_joined=now - timedelta(seconds=rng.randint(0, days * 86400)))
+        for n in range(start, start + customers)
+    ):
+        user_ids.extend(user.pk for user in User.objects.bulk_create(batch))
+    log(f'{customers} customers')
+
+    carts = Cart.objects.bulk_create([
+        Cart(user_id=user_id) for user_id in rng.sample(user_ids, int(customers * cart_ratio))
+    ])
+    for batch in _batches(
+        CartItem(cart=cart, product_id=product_id, quantity=rng.randint(1, 3))
+        for cart in carts for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 4)))
+    ):
+        CartItem.objects.bulk_create(batch)
+    log(f'{len(carts)} carts')
+
+    statuses = [status for status, _ in Order.STATUS_CHOICES]
+    with _explicit_created_at(Order):
+        remaining = orders
+        while remaining:
+            count = min(remaining, BATCH_SIZE)
+            remaining -= count
+            lines = [[(product_id, rng.randint(1, 3))
+                      for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 4)))]
+                     for _ in range(count)]
+            created = Order.objects.bulk_create([
+                Order(user_id=rng.choice(user_ids), status=rng.choice(statuses), shipping_address='1 Bench Road',
+                      payment_method='cash_on_delivery',
+                      total_amount=sum(product_prices[product_id] * quantity for product_id, quantity in order_lines),
+                      created_at=now - timedelta(seconds=rng.randint(0, days * 86400)))
+                for order_lines in lines
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=product_id, quantity=quantity, price=product_prices[product_id])
+                for order, order_lines in zip(created, lines) for product_id, quantity in order_lines
+            ])
+    log(f'{orders} orders')
+
+    stats.rebuild()
+    analytics.rebuild()
+    search.rebuild_index()
+    catalog_cache.invalidate_all()
+    return {'categories': categories, 'products': products, 'customers': customers,
+            'carts': len(carts), 'orders': orders}
+
+
+def summarize(timings, elapsed=None, queries=None):
+    """Latency percentiles in ms, throughput and mean query count for one operation"""
+    ordered = sorted(timings)
+    result = {
+        'requests': len(ordered),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+    if elapsed:
+        result['throughput_rps'] = round(len(ordered) / elapsed, 1)
+    if queries:
+        result['queries'] = round(sum(queries) / len(queries), 1)
+    return result
+
+
+def format_table(results):
+    lines = [f'{"operation":<36} {"n":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"req/s":>8} {"queries":>8}']
+    for name, row in results.items():
+        lines.append(f'{name:<36} {row["requests"]:>6} {row["p50_ms"]:>9.2f} {row["p95_ms"]:>9.2f} '
+                     f'{row["p99_ms"]:>9.2f} {row.get("throughput_rps", ""):>8} {row.get("queries", ""):>8}')
+    return '\n'.join(lines)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, kind, settings, results):
+    with open(path, 'w') as file:
+        json.dump({'kind': kind, 'commit': git_commit(), 'recorded_at': timezone.now().isoformat(),
+                   'settings': settings, 'results': results}, file, indent=2)
+
+
+def compare(path, results):
+    """Lines describing how p50/p95 and query counts moved since a saved run"""
+    with open(path) as file:
+        baseline = json.load(file)
+    lines = [f'Compared with {baseline.get("commit") or "unknown commit"} ({baseline.get("recorded_at", "?")}):']
+    for name, row in results.items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms'):
+            if before[key]:
+                changes.append(f'{key[:3]} {(row[key] - before[key]) / before[key]:+.0%}')
+        if 'queries' in row and 'queries' in before and row['queries'] != before['queries']:
+            changes.append(f'queries {before["queries"]} -> {row["queries"]}')
+        lines.append(f'  {name}: {", ".join(changes) or "unchanged"}')
+    return lines
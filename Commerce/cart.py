@@ -0,0 +1,338 @@
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import cached_property
+
+from .upserts import increments, upsert
+
+
+LINE_TOTAL = ExpressionWrapper(
+    F('quantity') * F('product__price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+class CartSummary:
+    """Item count, subtotal and line totals for a set of cart items.
+
+    Totals come from a single aggregate query unless the lines have already
+    been loaded, in which case they are summed in Python with no extra query.
+    """
+
+    def __init__(self, items):
+        self._items = items
+
+    @cached_property
+    def lines(self):
+        return list(
+            self._items.select_related('product__category')
+            .annotate(line_total=LINE_TOTAL)
+            .order_by('id')
+        )
+
+    @cached_property
+    def _totals(self):
+        if 'lines' in self.__dict__:
+            return (
+                sum(line.quantity for line in self.lines),
+                sum((line.line_total for line in self.lines), Decimal('0.00')),
+            )
+        totals = self._items.aggregate(total_items=Sum('quantity'), total_price=Sum(LINE_TOTAL))
+        return totals['total_items'] or 0, totals['total_price'] or Decimal('0.00')
+
+    @property
+    def total_items(self):
+        return self._totals[0]
+
+    @property
+    def total_price(self):
+        return self._totals[1]
+
+    @property
+    def line_count(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return self.total_items > 0
+
+
+GUEST_CART_COOKIE = 'guest_cart'
+GUEST_CART_SALT = 'Commerce.cart.GuestCart'
+GUEST_CART_MAX_AGE = 60 * 60 * 24 * 30
+# Keeps the signed cookie well under the 4 KB browsers allow
+GUEST_CART_MAX_LINES = 50
+
+
+class GuestCartLine:
+    """A guest cart line, shaped like CartItem for the cart templates"""
+
+    def __init__(self, product, quantity):
+        # Guest cart URLs address lines by product id
+        self.id = product.pk
+        self.product = product
+        self.quantity = quantity
+
+    def get_total_price(self):
+        return self.product.price * self.quantity
+
+
+class GuestCartSummary(CartSummary):
+    """CartSummary over a guest cart's {product id: quantity}.
+
+    The item count needs no query; lines and the subtotal load the
+    products in one read.
+    """
+
+    def __init__(self, quantities):
+        self._quantities = quantities
+
+    @cached_property
+    def lines(self):
+        from .models import Product
+
+        products = Product.objects.select_related('category').in_bulk(list(self._quantities))
+        return [GuestCartLine(products[product_id], quantity)
+                for product_id, quantity in self._quantities.items() if product_id in products]
+
+    @property
+    def total_items(self):
+        if 'lines' in self.__dict__:
+            return sum(line.quantity for line in self.lines)
+        return sum(self._quantities.values())
+
+    @property
+    def total_price(self):
+        return sum((line.get_total_price() for line in self.lines), Decimal('0.00'))
+
+
+class GuestCart:
+    """An anonymous visitor's cart, kept in a signed cookie.
+
+    Adding, updating and removing lines never touch the database; the
+    cookie is rewritten on the way out by GuestCartMiddleware. At login
+    merge_guest_cart() moves the lines into the user's Cart.
+    """
+
+    def __init__(self, quantities=None):
+        self.quantities = dict(quantities or {})
+        self.changed = False
+
+    @classmethod
+    def from_request(cls, request):
+        if not hasattr(request, '_guest_cart'):
+            request._guest_cart = cls(cls._load(request))
+        return request._guest_cart
+
+    @staticmethod
+    def _load(request):
+        raw = request.get_signed_cookie(GUEST_CART_COOKIE, default=None, salt=GUEST_CART_SALT,
+                                        max_age=GUEST_CART_MAX_AGE)
+        try:
+            data = json.loads(raw) if raw else {}
+            quantities = {int(product_id): int(quantity) for product_id, quantity in data.items()}
+        except (ValueError, TypeError, AttributeError):
+            return {}
+        return {product_id: quantity for product_id, quantity in
+                list(quantities.items())[:GUEST_CART_MAX_LINES] if quantity > 0}
+
+    @cached_property
+    def summary(self):
+        return GuestCartSummary(self.quantities)
+
+    def get_total_price(self):
+        return self.summary.total_price
+
+    def get_total_items(self):
+        return self.summary.total_items
+
+    def _changed(self):
+        self.changed = True
+        self.__dict__.pop('summary', None)
+
+    def add(self, product_id, quantity=1):
+        """Add to a line; False if the cart already has GUEST_CART_MAX_LINES other lines"""
+        if product_id not in self.quantities and len(self.quantities) >= GUEST_CART_MAX_LINES:
+            return False
+        self.quantities[product_id] = self.quantities.get(product_id, 0) + quantity
+        self._changed()
+        return True
+
+    def update(self, product_id, quantity):
+        if product_id not in self.quantities:
+            return
+        if quantity > 0:
+            self.quantities[product_id] = quantity
+        else:
+            del self.quantities[product_id]
+        self._changed()
+
+    def remove(self, product_id):
+        if self.quantities.pop(product_id, None) is not None:
+            self._changed()
+
+    def clear(self):
+        if self.quantities:
+            self.quantities = {}
+            self._changed()
+
+    def apply(self, changes):
+        """Apply parse_operations() output; returns the product ids rejected as over the line limit"""
+        rejected = []
+        for product_id, (kind, quantity) in changes.items():
+            if kind == 'set' and product_id in self.quantities:
+                self.update(product_id, quantity)
+            elif quantity and not self.add(product_id, quantity):
+                rejected.append(product_id)
+        return rejected
+
+    def save(self, response):
+        if not self.changed:
+            return
+        if self.quantities:
+            response.set_signed_cookie(GUEST_CART_COOKIE, json.dumps(self.quantities, separators=(',', ':')),
+                                       salt=GUEST_CART_SALT, max_age=GUEST_CART_MAX_AGE,
+                                       httponly=True, samesite='Lax')
+        else:
+            response.delete_cookie(GUEST_CART_COOKIE, samesite='Lax')
+
+
+class GuestCartMiddleware(MiddlewareMixin):
+    """Write back the guest cart cookie when a view changed the cart"""
+
+    def process_response(self, request, response):
+        guest_cart = getattr(request, '_guest_cart', None)
+        if guest_cart is not None:
+            guest_cart.save(response)
+        return response
+
+
+def merge_guest_cart(request, user):
+    """Move the request's guest cart into the user's Cart with one upsert.
+
+    Quantities add to any line the user already has, in the database, so
+    an add-to-cart racing the merge is not lost. Returns the number of
+    lines merged.
+    """
+    from .models import Cart, CartItem, Product
+
+    guest_cart = GuestCart.from_request(request)
+    if not guest_cart.quantities:
+        return 0
+    cart, _ = Cart.objects.get_or_create(user=user)
+    product_ids = list(Product.objects.filter(id__in=list(guest_cart.quantities)).values_list('id', flat=True))
+    upsert(CartItem, [{'cart': cart.id, 'product': product_id, 'quantity': guest_cart.quantities[product_id]}
+                      for product_id in product_ids], ['cart', 'product'], increments('quantity'))
+    guest_cart.clear()
+    return len(product_ids)
+
+
+CART_OPERATIONS = ('add', 'set', 'remove')
+MAX_CART_OPERATIONS = 100
+
+
+def parse_operations(operations):
+    """Fold a batch of {"op", "product", "quantity"} into one change per product.
+
+    Returns {product id: ('add', n) or ('set', n)}, where setting 0 removes
+    the line; later operations on a product build on earlier ones. Raises
+    ValueError describing the first malformed operation.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('"operations" must be a non-empty list.')
+    if len(operations) > MAX_CART_OPERATIONS:
+        raise ValueError(f'At most {MAX_CART_OPERATIONS} operations per request.')
+    changes = {}
+    for index, operation in enumerate(operations):
+        try:
+            op = operation['op']
+            product_id = int(operation['product'])
+            quantity = int(operation.get('quantity', 1 if op == 'add' else 0))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError(f'Operation {index}: expected {{"op", "product", "quantity"}}.')
+        if op not in CART_OPERATIONS or quantity < 0 or (op == 'add' and quantity == 0):
+            raise ValueError(f'Operation {index}: invalid op or quantity.')
+        if op == 'remove':
+            changes[product_id] = ('set', 0)
+        elif op == 'set':
+            changes[product_id] = ('set', quantity)
+        else:
+            kind, current = changes.get(product_id, ('add', 0))
+            changes[product_id] = (kind, current + quantity)
+    return changes
+
+
+def apply_cart_changes(cart, changes):
+    """Apply parse_operations() output to a Cart in one transaction.
+
+    Removals are one DELETE and absolute quantities one upsert. Additions
+    insert any missing lines at quantity 0, then add with F() updates (one
+    per distinct amount), so concurrent requests cannot lose increments.
+    """
+    from .models import CartItem
+
+    removed = [product_id for product_id, (kind, quantity) in changes.items() if kind == 'set' and not quantity]
+    quantities = {product_id: quantity for product_id, (kind, quantity) in changes.items()
+                  if kind == 'set' and quantity}
+    added = defaultdict(list)
+    for product_id, (kind, quantity) in changes.items():
+        if kind == 'add':
+            added[quantity].append(product_id)
+
+    with transaction.atomic():
+        if removed:
+            cart.items.filter(product_id__in=removed).delete()
+        if quantities:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=quantity)
+                 for product_id, quantity in quantities.items()],
+                update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+            )
+        if added:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=0)
+                 for product_ids in added.values() for product_id in product_ids],
+                ignore_conflicts=True,
+            )
+            for amount, product_ids in added.items():
+                cart.items.filter(product_id__in=product_ids).update(quantity=F('quantity') + amount)
+
+
+def _money(amount):
+    return str(Decimal(amount).quantize(Decimal('0.01')))
+
+
+def summary_json(summary):
+    return {
+        'line_count': summary.line_count,
+        'total_items': summary.total_items,
+        'total_price': _money(summary.total_price),
+        'lines': [{
+            'product': line.product.id,
+            'name': line.product.name,
+            'quantity': line.quantity,
+            'price': _money(line.product.price),
+            'total': _money(line.get_total_price()),
+        } for line in summary.lines],
+    }
+
+
+def get_cart_summary(request, cart=None):
+    """Return the cart summary for this request, computing it at most once.
+
+    Views that already hold the user's cart pass it in so the context
+    processor reuses the same summary instead of querying again.
+    """
+    if cart is not None:
+        request._cart_summary = cart.summary
+    if not hasattr(request, '_cart_summary'):
+        from .models import CartItem
+
+        if request.user.is_authenticated:
+            request._cart_summary = CartSummary(CartItem.objects.filter(cart__user=request.user))
+        else:
+            request._cart_summary = GuestCart.from_request(request).summary
+    return request._cart_summary
@@ -0,0 +1,298 @@
+"""Versioned read cache for the storefront catalog.
+
+Every cached value is stored under a key that embeds the current version
+of what it depends on: one version per product, one per category listing,
+one for the all-products listing (which also covers the featured list),
+one for the category list and one for the whole catalog, bumped after bulk
+imports that bypass the signals. Invalidation replaces a version with a fresh
+random token, so stale entries are never read again and simply expire.
+
+Versions are bumped by the Product/Category signals in Commerce.signals and
+by checkout after it decrements stock with a queryset update.
+"""
+import asyncio
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+
+from .models import Category, Product
+from .pagination import KeysetPaginator, decode_cursor
+
+
+CACHE_ALIAS = getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')
+TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+FEATURED_COUNT = 8
+
+CATALOG = 'catalog'
+ALL_PRODUCTS = 'products'
+CATEGORIES = 'categories'
+# Bumped when products are deleted, for readers that only look for changed rows
+DELETED_PRODUCTS = 'deleted-products'
+
+_MISSING = object()
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def product_version(product_id):
+    return f'product:{product_id}'
+
+
+def category_version(category_id):
+    return f'category:{category_id}'
+
+
+def _version_keys(names):
+    return [f'catalog:v:{name}' for name in names]
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def _version_map(names):
+    """{name: current version token}, creating tokens for names never seen"""
+    cache = _cache()
+    keys = dict(zip(_version_keys(names), names))
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        found.update(cache.get_many(missing))
+    return {name: str(found.get(key, 0)) for key, name in keys.items()}
+
+
+def _versions(names):
+    versions = _version_map(names)
+    return '-'.join(versions[name] for name in names)
+
+
+async def _aversions(names):
+    cache = _cache()
+    keys = _version_keys(names)
+    found = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            await cache.aadd(key, _new_version(), None)
+        found.update(await cache.aget_many(missing))
+    return '-'.join(str(found.get(key, 0)) for key in keys)
+
+
+def version_stamp(names):
+    """The current versions of ``names`` and the whole catalog, as one string"""
+    return _versions([CATALOG, *names])
+
+
+def versions(names):
+    """{name: version} for ``names`` and the whole catalog, in one cache read"""
+    return _version_map([CATALOG, *names])
+
+
+def bump(*names):
+    """Invalidate everything cached against the given version names"""
+    if names:
+        _cache().set_many({key: _new_version() for key in _version_keys(names)}, None)
+
+
+def _record(kind, hit):
+    with _counters_lock:
+        _counters[f'{kind}_hits' if hit else f'{kind}_misses'] += 1
+
+
+def counters():
+    """Hit and miss counts per kind of cached read since the process started"""
+    with _counters_lock:
+        snapshot = dict(_counters)
+    snapshot['hits'] = sum(value for key, value in snapshot.items() if key.endswith('_hits'))
+    snapshot['misses'] = sum(value for key, value in snapshot.items() if key.endswith('_misses'))
+    return snapshot
+
+
+def reset_counters():
+    with _counters_lock:
+        _counters.clear()
+
+
+def cached(kind, key, versions, loader):
+    cache = _cache()
+    full_key = f'catalog:{kind}:{key}:{_versions([CATALOG, *versions])}'
+    value = cache.get(full_key, _MISSING)
+    _record(kind, value is not _MISSING)
+    if value is _MISSING:
+        value = loader()
+        cache.set(full_key, value, TIMEOUT)
+    return value
+
+
+async def acached(kind, key, versions, loader):
+    """cached() for async callers; ``loader`` is a coroutine function"""
+    cache = _cache()
+    full_key = f'catalog:{kind}:{key}:{await _aversions([CATALOG, *versions])}'
+    value = await cache.aget(full_key, _MISSING)
+    _record(kind, value is not _MISSING)
+    if value is _MISSING:
+        value = await loader()
+        await cache.aset(full_key, value, TIMEOUT)
+    return value
+
+
+def fragments(kind, items, key, versions, render):
+    """Cached HTML for each item, rendering only the ones missing from the cache.
+
+    ``key(item)`` identifies an item, ``versions(item)`` names the versions
+    its markup depends on and ``render(item)`` produces it. Versions and fragments are each fetched
+    with one get_many, and new fragments are stored with one set_many, so a
+    page of cards costs a few cache round trips however many it shows.
+    """
+    names = {item: [CATALOG, *versions(item)] for item in items}
+    tokens = _version_map(list({name for item_names in names.values() for name in item_names}))
+    keys = {item: f'catalog:{kind}:{key(item)}:{"-".join(tokens[name] for name in item_names)}'
+            for item, item_names in names.items()}
+    cache = _cache()
+    found = cache.get_many(list(keys.values()))
+    rendered = {}
+    for item, full_key in keys.items():
+        _record(kind, full_key in found)
+        if full_key not in found:
+            rendered[full_key] = found[full_key] = render(item)
+    if rendered:
+        cache.set_many(rendered, TIMEOUT)
+    return [found[keys[item]] for item in items]
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+
+# ========== READS ==========
+# Each read has a sync and an async form sharing its query and cache key.
+
+def _categories_query():
+    return Category.objects.annotate(product_count=Count('product')).order_by('id')
+
+
+def categories():
+    """All categories, each annotated with product_count"""
+    return cached('categories', 'all', [CATEGORIES], lambda: list(_categories_query()))
+
+
+async def acategories():
+    return await acached('categories', 'all', [CATEGORIES], lambda: _alist(_categories_query()))
+
+
+def _featured_query():
+    return Product.objects.filter(stock__gt=0).order_by('-created_at', '-id')[:FEATURED_COUNT]
+
+
+def featured_products():
+    return cached('featured', FEATURED_COUNT, [ALL_PRODUCTS], lambda: list(_featured_query()))
+
+
+async def afeatured_products():
+    return await acached('featured', FEATURED_COUNT, [ALL_PRODUCTS], lambda: _alist(_featured_query()))
+
+
+def _product_query(product_id):
+    return Product.objects.select_related('category').filter(id=product_id)
+
+
+def product(product_id):
+    """The product with its category, or None if it does not exist"""
+    return cached('product', product_id, [product_version(product_id), CATEGORIES],
+                  lambda: _product_query(product_id).first())
+
+
+async def aproduct(product_id):
+    return await acached('product', product_id, [product_version(product_id), CATEGORIES],
+                         lambda: _product_query(product_id).afirst())
+
+
+def _listing(category_id, after, before, page_size):
+    """(paginator, products, normalised arguments, cache key, version) for a listing page"""
+    products = Product.objects.filter(stock__gt=0)
+    if category_id:
+        products = products.filter(category_id=category_id)
+        version = category_version(category_id)
+    else:
+        version = ALL_PRODUCTS
+
+    paginator = KeysetPaginator(products)
+    # Normalise user input before it becomes part of a cache key
+    after = after if after and decode_cursor(after) else None
+    before = before if before and decode_cursor(before) else None
+    page_size = paginator.clamp_page_size(page_size)
+    key = f'{category_id or "all"}:{after}:{before}:{page_size}'
+    return paginator, products, (after, before, page_size), key, version
+
+
+def _listing_result(page, total):
+    return {
+        'rows': page.object_list,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+        'total': total,
+    }
+
+
+def listing(category_id=None, after=None, before=None, page_size=None):
+    """One keyset page of in-stock products plus the total count.
+
+    Returns a dict with rows, next_cursor, previous_cursor and total.
+    """
+    paginator, products, (after, before, page_size), key, version = _listing(category_id, after, before, page_size)
+
+    def load():
+        page = paginator.page(after=after, before=before, page_size=page_size)
+        return _listing_result(page, products.count())
+
+    return cached('listing', key, [version], load)
+
+
+async def alisting(category_id=None, after=None, before=None, page_size=None):
+    paginator, products, (after, before, page_size), key, version = _listing(category_id, after, before, page_size)
+
+    async def load():
+        page, total = await asyncio.gather(
+            paginator.apage(after=after, before=before, page_size=page_size), products.acount()
+        )
+        return _listing_result(page, total)
+
+    return await acached('listing', key, [version], load)
+
+
+# ========== INVALIDATION ==========
+def invalidate_products(products, membership_changed=False, deleted=False):
+    """Bump the versions covering the given (product_id, category_id) pairs.
+
+    ``membership_changed`` means products were added, removed or moved
+    between categories, which also changes the per-category counts;
+    ``deleted`` that the products no longer exist.
+    """
+    names = {ALL_PRODUCTS}
+    if deleted:
+        names.add(DELETED_PRODUCTS)
+    for product_id, category_id in products:
+        names.add(product_version(product_id))
+        if category_id:
+            names.add(category_version(category_id))
+    if membership_changed:
+        names.add(CATEGORIES)
+    bump(*names)
+
+
+def invalidate_category(category_id):
+    bump(CATEGORIES, category_version(category_id))
+
+
+def invalidate_all():
+    bump(CATALOG)
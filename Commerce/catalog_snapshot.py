@@ -0,0 +1,415 @@
+"""Columnar in-memory snapshot of the catalog for filtered product listings.
+
+The snapshot holds one array.array per column (id, category, price in
+cents, stock, calories and created_at in microseconds), in id order, so a
+million products take about 48 MB and no per-product Python objects.
+Filters, sorting and facet counts run over whole columns: with NumPy
+installed (optional), on zero-copy views of the arrays; without it, in
+plain Python loops, several times slower but with nothing extra to install.
+
+Each process keeps one snapshot. Before every read it compares the
+catalog_cache versions of the product listings and of product deletions
+(one cache read). When the listings have moved, it applies the products
+whose updated_at is past its watermark; product saves, checkout's stock
+updates and imports all advance updated_at and bump that version. When
+products have been deleted, it drops the rows whose ids are gone.
+
+queryset() and orm_facet_counts() answer the same questions with the ORM;
+product_list uses queryset() when settings.CATALOG_SNAPSHOT is off. Its
+facet navigation always comes from facets(): the rows of one grouped query,
+cached in catalog_cache, so plain listings never need the snapshot.
+"""
+import heapq
+import operator
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import BooleanField, Case, Count, ExpressionWrapper, IntegerField, Q, Value, When
+
+from . import catalog_cache
+from .models import Product
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+try:
+    import numpy
+except ImportError:  # optional: pure Python filtering
+    numpy = None
+
+
+COLUMNS = ('id', 'category', 'price', 'stock', 'calories', 'created')
+FIELDS = ('id', 'category_id', 'price', 'stock', 'calories', 'created_at', 'updated_at')
+# Stands in for a product without a calorie count
+NO_CALORIES = -1
+# Price bucket boundaries, in GH₵; the buckets are [0, 10), [10, 25) ... [250, ∞)
+PRICE_EDGES = (Decimal('10'), Decimal('25'), Decimal('50'), Decimal('100'), Decimal('250'))
+CENT = Decimal('0.01')
+SORTS = {
+    # sort: (ORM ordering, snapshot column, descending)
+    'newest': (('-created_at', '-id'), 'created', True),
+    'price': (('price', 'id'), 'price', False),
+    '-price': (('-price', '-id'), 'price', True),
+}
+# Rows updated this long before the watermark are read again, for
+# transactions that committed after a later one was already applied
+OVERLAP = timedelta(minutes=1)
+LOAD_CHUNK_SIZE = 5000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+Filters = namedtuple('Filters', ['category_id', 'min_price', 'max_price', 'max_calories', 'in_stock', 'sort'],
+                     defaults=[None, None, None, None, True, 'newest'])
+
+
+def cents(price):
+    return int(Decimal(price) * 100)
+
+
+def _conditions(filters, skip=()):
+    """(column, test, value) triples for the filters, leaving out the columns in ``skip``"""
+    conditions = []
+    if filters.category_id and 'category' not in skip:
+        conditions.append(('category', operator.eq, filters.category_id))
+    if filters.in_stock and 'stock' not in skip:
+        conditions.append(('stock', operator.gt, 0))
+    if filters.min_price is not None and 'price' not in skip:
+        conditions.append(('price', operator.ge, cents(filters.min_price)))
+    if filters.max_price is not None and 'price' not in skip:
+        conditions.append(('price', operator.le, cents(filters.max_price)))
+    if filters.max_calories is not None:
+        conditions += [('calories', operator.gt, NO_CALORIES), ('calories', operator.le, filters.max_calories)]
+    return conditions
+
+
+class CatalogSnapshot:
+    """The catalog's filterable columns, one int64 array each, sorted by product id"""
+
+    def __init__(self):
+        self.columns = {name: array('q') for name in COLUMNS}
+        # Newest updated_at applied so far
+        self.synced_at = None
+
+    @classmethod
+    def load(cls):
+        snapshot = cls()
+        rows = Product.objects.order_by('id').values_list(*FIELDS)
+        snapshot.upsert(rows.iterator(chunk_size=LOAD_CHUNK_SIZE))
+        return snapshot
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    @property
+    def nbytes(self):
+        return sum(len(column) * column.itemsize for column in self.columns.values())
+
+    def upsert(self, rows):
+        """Add or replace products from (FIELDS) value tuples"""
+        ids = self.columns['id']
+        columns = [self.columns[name] for name in COLUMNS]
+        for pk, category_id, price, stock, calories, created_at, updated_at in rows:
+            values = (pk, category_id, cents(price), stock, NO_CALORIES if calories is None else calories,
+                      (created_at - _EPOCH) // _MICROSECOND)
+            position = bisect_left(ids, pk)
+            if position < len(ids) and ids[position] == pk:
+                for column, value in zip(columns, values):
+                    column[position] = value
+            elif position == len(ids):
+                for column, value in zip(columns, values):
+                    column.append(value)
+            else:
+                for column, value in zip(columns, values):
+                    column.insert(position, value)
+            if self.synced_at is None or updated_at > self.synced_at:
+                self.synced_at = updated_at
+
+    def copy(self):
+        snapshot = CatalogSnapshot()
+        snapshot.columns = {name: column[:] for name, column in self.columns.items()}
+        snapshot.synced_at = self.synced_at
+        return snapshot
+
+    def retain(self, product_ids):
+        """Drop the rows of products not in ``product_ids``"""
+        keep = [row for row, pk in enumerate(self.columns['id']) if pk in product_ids]
+        if len(keep) < len(self):
+            self.columns = {name: array('q', (column[row] for row in keep)) for name, column in self.columns.items()}
+
+    # Each query has a NumPy form, over views of the arrays, and a plain
+    # Python one. The views only live for the length of the query: an
+    # array cannot grow while a view of it exists.
+
+    def _matching(self, filters, skip=()):
+        """Positions of the rows the filters match: an index array, or a list without NumPy"""
+        conditions = _conditions(filters, skip)
+        if numpy is not None:
+            mask = numpy.ones(len(self), dtype=bool)
+            for name, test, value in conditions:
+                mask &= test(numpy.frombuffer(self.columns[name], dtype=numpy.int64), value)
+            return numpy.flatnonzero(mask)
+        rows = range(len(self))
+        for name, test, value in conditions:
+            column = self.columns[name]
+            rows = [row for row in rows if test(column[row], value)]
+        return rows
+
+    def select(self, filters, offset=0, limit=None):
+        """(product ids for rows offset..offset+limit in the filters' sort order, total matches)"""
+        rows = self._matching(filters)
+        total = len(rows)
+        count = total if limit is None else min(total, offset + limit)
+        _, name, descending = SORTS[filters.sort]
+        if numpy is not None:
+            ids = numpy.frombuffer(self.columns['id'], dtype=numpy.int64)
+            keys = numpy.frombuffer(self.columns[name], dtype=numpy.int64)[rows]
+            if count < total:
+                # Keep only the rows that can reach the page, ties included
+                if descending:
+                    rows = rows[keys >= numpy.partition(keys, total - count)[total - count]]
+                else:
+                    rows = rows[keys <= numpy.partition(keys, count - 1)[count - 1]]
+                keys = numpy.frombuffer(self.columns[name], dtype=numpy.int64)[rows]
+            order = numpy.lexsort((ids[rows], keys))
+            if descending:
+                order = order[::-1]
+            return ids[rows[order[offset:count]]].tolist(), total
+        ids, keys = self.columns['id'], self.columns[name]
+        pick = heapq.nlargest if descending else heapq.nsmallest
+        top = pick(count, rows, key=lambda row: (keys[row], ids[row]))
+        return [ids[row] for row in top[offset:count]], total
+
+    def facet_counts(self, filters):
+        """Matches per category, price bucket and availability, each counted under the other filters.
+
+        Returns {'categories': {category id: n}, 'prices': [n per bucket of
+        PRICE_EDGES], 'in_stock': n, 'all': n}; ``all`` ignores the stock
+        filter.
+        """
+        edges = [cents(edge) for edge in PRICE_EDGES]
+        by_category = self._matching(filters, skip=('category',))
+        by_price = self._matching(filters, skip=('price',))
+        by_stock = self._matching(filters, skip=('stock',))
+        if numpy is not None:
+            view = lambda name: numpy.frombuffer(self.columns[name], dtype=numpy.int64)
+            categories, counts = numpy.unique(view('category')[by_category], return_counts=True)
+            buckets = numpy.bincount(numpy.searchsorted(edges, view('price')[by_price], side='right'),
+                                     minlength=len(edges) + 1)
+            return {
+                'categories': dict(zip(categories.tolist(), counts.tolist())),
+                'prices': buckets.tolist(),
+                'in_stock': int(numpy.count_nonzero(view('stock')[by_stock] > 0)),
+                'all': len(by_stock),
+            }
+        category, price, stock = (self.columns[name] for name in ('category', 'price', 'stock'))
+        buckets = Counter(bisect_right(edges, price[row]) for row in by_price)
+        return {
+            'categories': dict(Counter(category[row] for row in by_category)),
+            'prices': [buckets[bucket] for bucket in range(len(edges) + 1)],
+            'in_stock': sum(1 for row in by_stock if stock[row] > 0),
+            'all': len(by_stock),
+        }
+
+
+# ========== THE PROCESS SNAPSHOT ==========
+# Never changed once published: a refresh works on a copy and swaps it in,
+# so reads need no lock and never wait on the database
+_snapshot = None
+# The catalog_cache versions it reflects
+_versions = None
+# Guards reading and swapping the two globals together
+_lock = threading.Lock()
+
+
+def _refreshed(snapshot, known, versions):
+    """A new snapshot brought from the ``known`` catalog_cache versions up to ``versions``"""
+    if snapshot is None or versions[catalog_cache.CATALOG] != known[catalog_cache.CATALOG]:
+        # invalidate_all() follows bulk changes that may have skipped updated_at
+        return CatalogSnapshot.load()
+    snapshot = snapshot.copy()
+    if versions[catalog_cache.ALL_PRODUCTS] != known[catalog_cache.ALL_PRODUCTS]:
+        changed = Product.objects.all()
+        if snapshot.synced_at is not None:
+            changed = changed.filter(updated_at__gte=snapshot.synced_at - OVERLAP)
+        snapshot.upsert(changed.values_list(*FIELDS))
+    if versions[catalog_cache.DELETED_PRODUCTS] != known[catalog_cache.DELETED_PRODUCTS]:
+        snapshot.retain(set(Product.objects.values_list('id', flat=True).iterator(chunk_size=LOAD_CHUNK_SIZE)))
+    return snapshot
+
+
+def _current():
+    global _snapshot, _versions
+    with _lock:
+        snapshot, known = _snapshot, _versions
+    # Read before the rows, so a change made meanwhile is picked up next time
+    versions = catalog_cache.versions([catalog_cache.ALL_PRODUCTS, catalog_cache.DELETED_PRODUCTS])
+    if snapshot is not None and versions == known:
+        return snapshot
+    snapshot = _refreshed(snapshot, known, versions)
+    with _lock:
+        # Unless another thread has swapped in a refresh of its own meanwhile
+        if _versions is known:
+            _snapshot, _versions = snapshot, versions
+    return snapshot
+
+
+def select(filters, offset=0, limit=None):
+    """CatalogSnapshot.select() on this process's up-to-date snapshot"""
+    return _current().select(filters, offset, limit)
+
+
+def facet_counts(filters):
+    return _current().facet_counts(filters)
+
+
+def enabled():
+    return getattr(settings, 'CATALOG_SNAPSHOT', True)
+
+
+def reset():
+    """Drop the process snapshot; the next read loads it afresh"""
+    global _snapshot, _versions
+    with _lock:
+        _snapshot = _versions = None
+
+
+# ========== THE SAME WITH THE ORM ==========
+def queryset(filters, skip=()):
+    """Products matching the filters, in their sort order"""
+    products = Product.objects.all()
+    if filters.category_id and 'category' not in skip:
+        products = products.filter(category_id=filters.category_id)
+    if filters.in_stock and 'stock' not in skip:
+        products = products.filter(stock__gt=0)
+    if filters.min_price is not None and 'price' not in skip:
+        products = products.filter(price__gte=filters.min_price)
+    if filters.max_price is not None and 'price' not in skip:
+        products = products.filter(price__lte=filters.max_price)
+    if filters.max_calories is not None:
+        products = products.filter(calories__lte=filters.max_calories)
+    return products.order_by(*SORTS[filters.sort][0])
+
+
+def price_buckets():
+    """A Q for each price bucket of PRICE_EDGES, lowest first"""
+    buckets = [Q(price__lt=PRICE_EDGES[0])]
+    buckets += [Q(price__gte=low, price__lt=high) for low, high in zip(PRICE_EDGES, PRICE_EDGES[1:])]
+    return buckets + [Q(price__gte=PRICE_EDGES[-1])]
+
+
+def price_ranges():
+    """(min_price, max_price) query values selecting each price bucket; None for an open end"""
+    lows = [None, *PRICE_EDGES]
+    highs = [edge - CENT for edge in PRICE_EDGES] + [None]
+    return list(zip(lows, highs))
+
+
+def _grouped_counts(filters):
+    """Product counts grouped by category, price bucket, stock and whether the price filter is met.
+
+    One query. Only the calorie filter goes into its WHERE clause; the
+    others are group columns, so _tally() can leave each one out in turn.
+    """
+    bucket = Case(*[When(condition, then=Value(index)) for index, condition in enumerate(price_buckets())],
+                  output_field=IntegerField())
+    in_price = Q()
+    if filters.min_price is not None:
+        in_price &= Q(price__gte=filters.min_price)
+    if filters.max_price is not None:
+        in_price &= Q(price__lte=filters.max_price)
+    groups = {
+        'bucket': bucket,
+        'stocked': ExpressionWrapper(Q(stock__gt=0), output_field=BooleanField()),
+        'in_price': ExpressionWrapper(in_price, output_field=BooleanField()) if in_price else Value(True),
+    }
+    rows = queryset(filters, skip=('category', 'price', 'stock')).order_by().values('category_id', **groups)
+    return list(rows.annotate(n=Count('id')).values_list('category_id', *groups, 'n'))
+
+
+def _tally(rows, filters):
+    """facet_counts() from _grouped_counts() rows"""
+    categories = Counter()
+    prices = [0] * (len(PRICE_EDGES) + 1)
+    in_stock = every = 0
+    for category_id, bucket, stocked, in_price, n in rows:
+        in_category = not filters.category_id or category_id == filters.category_id
+        available = stocked or not filters.in_stock
+        if in_price and available:
+            categories[category_id] += n
+        if in_category and available:
+            prices[bucket] += n
+        if in_category and in_price:
+            every += n
+            in_stock += n if stocked else 0
+    return {'categories': dict(categories), 'prices': prices, 'in_stock': in_stock, 'all': every}
+
+
+def orm_facet_counts(filters):
+    """facet_counts() with one grouped query"""
+    return _tally(_grouped_counts(filters), filters)
+
+
+def _facets_key(filters):
+    # Category and stock filters are applied to the cached rows, not part of the query
+    bound = lambda value: 'any' if value is None else cents(value)
+    return f'{bound(filters.min_price)}:{bound(filters.max_price)}:{filters.max_calories}'
+
+
+def facets(filters):
+    """orm_facet_counts() through catalog_cache.
+
+    The grouped rows are cached against the all-products version, which
+    every product save, delete and checkout stock update bumps, so while
+    the catalog is unchanged the facets cost no query.
+    """
+    rows = catalog_cache.cached('facets', _facets_key(filters), [catalog_cache.ALL_PRODUCTS],
+                                lambda: _grouped_counts(filters))
+    return _tally(rows, filters)
+
+
+async def afacets(filters):
+    rows = await catalog_cache.acached('facets', _facets_key(filters), [catalog_cache.ALL_PRODUCTS],
+                                       lambda: sync_to_async(_grouped_counts)(filters))
+    return _tally(rows, filters)
+
+
+# ========== LISTING PAGES ==========
+def _position(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def listing(filters, after=None, before=None, page_size=None):
+    """One page of a filtered listing, shaped like catalog_cache.listing().
+
+    Sorts other than newest first have no keyset index, so the cursors are
+    positions in the result: ``after`` is where a page starts and
+    ``before`` where it ends.
+    """
+    size = _position(page_size) or DEFAULT_PAGE_SIZE
+    size = min(size, MAX_PAGE_SIZE)
+    start = _position(after)
+    if start is None:
+        end = _position(before)
+        start = max(0, end - size) if end is not None else 0
+    if enabled():
+        ids, total = select(filters, start, size)
+        found = Product.objects.in_bulk(ids)
+        # A product deleted since the snapshot was read is left out
+        rows = [found[pk] for pk in ids if pk in found]
+    else:
+        products = queryset(filters)
+        rows, total = list(products[start:start + size]), products.count()
+    return {
+        'rows': rows,
+        'next_cursor': str(start + size) if start + size < total else None,
+        'previous_cursor': str(start) if start else None,
+        'total': total,
+    }
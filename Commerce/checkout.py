@@ -0,0 +1,118 @@
+from collections import Counter
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.db.models.functions import Now
+
+from . import analytics, catalog_cache, outbox, reservations
+from .models import Order, OrderItem, Product
+
+
+class CheckoutError(Exception):
+    """Base class for errors that abort a checkout"""
+
+
+class EmptyCartError(CheckoutError):
+    def __init__(self):
+        super().__init__('Your cart is empty!')
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(product.name for product in products)
+        super().__init__(f'Not enough stock for: {names}')
+
+
+class _StockShortfall(Exception):
+    """Raised inside the checkout transaction to force a rollback"""
+
+    def __init__(self, products, quantities):
+        self.products = products
+        self.quantities = quantities
+
+
+def place_order(user, cart, shipping_address, payment_method):
+    """Turn a cart into an order in a constant number of queries.
+
+    Cart lines are loaded with their products in one query, the product rows
+    are locked in id order (on backends that support it), and stock is
+    decremented by a single conditional UPDATE that only matches rows with
+    enough stock beyond what other customers hold. The customer's own holds
+    are released, and the confirmation email queued, in the same
+    transaction. If any product falls short the whole transaction rolls
+    back and OutOfStockError names the offending products.
+    """
+    try:
+        with transaction.atomic():
+            return _place_order(user, cart, shipping_address, payment_method)
+    except _StockShortfall as e:
+        # The decrement was rolled back, so current stock levels tell us
+        # which lines could not be filled.
+        available = reservations.available_to_sell(e.quantities, exclude_user=user)
+        short = [product for pk, product in e.products.items() if available.get(pk, 0) < e.quantities[pk]]
+        raise OutOfStockError(short or list(e.products.values())) from None
+
+
+def _place_order(user, cart, shipping_address, payment_method):
+    lines = list(cart.items.select_related('product').order_by('product_id'))
+    if not lines:
+        raise EmptyCartError()
+
+    quantities = Counter()
+    products = {}
+    for line in lines:
+        quantities[line.product_id] += line.quantity
+        products[line.product_id] = line.product
+    product_ids = sorted(quantities)
+
+    reservations.lock_products(product_ids)
+    held = reservations.held_by_others(user, product_ids)
+    has_stock = reduce(or_, (Q(id=pk, stock__gte=qty + held.get(pk, 0)) for pk, qty in quantities.items()))
+    updated = Product.objects.filter(has_stock).update(
+        stock=Case(*[When(id=pk, then=F('stock') - qty) for pk, qty in quantities.items()],
+                   default=F('stock')),
+        updated_at=Now(),
+    )
+    if updated != len(product_ids):
+        raise _StockShortfall(products, quantities)
+    # The queryset update bypasses the Product signals
+    transaction.on_commit(lambda: catalog_cache.invalidate_products(
+        [(pk, products[pk].category_id) for pk in product_ids]
+    ))
+
+    order = Order.objects.create(
+        user=user,
+        total_amount=sum((products[pk].price * qty for pk, qty in quantities.items()), Decimal('0.00')),
+        shipping_address=shipping_address,
+        payment_method=payment_method,
+        status='pending',
+        sales_recorded=True,
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=pk, quantity=qty, price=products[pk].price)
+        for pk, qty in quantities.items()
+    ])
+    analytics.order_placed(order, [(pk, products[pk].category_id, qty, products[pk].price * qty)
+                                   for pk, qty in quantities.items()])
+    cart.items.all().delete()
+    reservations.release(user)
+    outbox.enqueue('send_order_confirmation', order_id=order.id)
+    return order
+
+
+def hold_cart(user, lines):
+    """Reserve the quantities on the cart ``lines`` for ``user`` as they enter checkout.
+
+    Raises OutOfStockError naming the products that other customers'
+    holds or sales have left short.
+    """
+    quantities = Counter()
+    for line in lines:
+        quantities[line.product_id] += line.quantity
+    short = set(reservations.reserve(user, quantities))
+    if short:
+        raise OutOfStockError([line.product for line in lines if line.product_id in short])
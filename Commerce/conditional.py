@@ -0,0 +1,112 @@
+"""Conditional GET (ETag / Last-Modified) for the storefront catalog pages.
+
+A page's ETag hashes the catalog_cache versions of what it shows with what
+it shows about the viewer (their user id and cart badge), so checking it
+costs a few cache reads and, for logged-in users, the cart count query the
+page needs anyway, but no catalog queries and no render.
+
+Last-Modified is the newest Product/Category updated_at the page depends
+on, cached per version. If-Modified-Since cannot tell viewers apart, so it
+is only sent to anonymous visitors with an empty cart. Pages with pending
+messages are never answered with 304, so the messages are shown.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import catalog_cache
+from .cart import get_cart_summary
+from .models import Category, Product
+
+
+def _newest(*stamps):
+    return max((stamp for stamp in stamps if stamp), default=None)
+
+
+def _newest_in(queryset):
+    return queryset.aggregate(newest=Max('updated_at'))['newest']
+
+
+# Each page function returns (version names, loader of the newest stamp)
+# for the request, matching what the view reads from catalog_cache. The
+# home page shows the featured products and categories, which listing_page
+# covers.
+
+def listing_page(request, category_id=None):
+    # The facet counts cover every category, so any product change changes a category page too
+    return [catalog_cache.ALL_PRODUCTS, catalog_cache.CATEGORIES], lambda: _newest(
+        _newest_in(Product.objects.all()), _newest_in(Category.objects.all()))
+
+
+def product_page(request, product_id):
+    def modified():
+        stamps = (Product.objects.filter(id=product_id)
+                  .values_list('updated_at', 'category__updated_at').first())
+        return _newest(*stamps) if stamps else None
+
+    return [catalog_cache.product_version(product_id), catalog_cache.CATEGORIES], modified
+
+
+def validators(request, page, *args, **kwargs):
+    """(ETag, Last-Modified timestamp) for a GET of ``page``, or (None, None) to skip"""
+    if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+        return None, None
+    names, modified = page(request, *args, **kwargs)
+    stamp = catalog_cache.version_stamp(names)
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    cart_items = get_cart_summary(request).total_items
+    etag = hashlib.sha1(f'{request.get_full_path()}|{stamp}|{user_id}|{cart_items}'.encode()).hexdigest()[:24]
+
+    last_modified = None
+    if not user_id and not cart_items:
+        key = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+        newest = catalog_cache.cached('modified', key, names, modified)
+        last_modified = int(newest.timestamp()) if newest else None
+    return f'"{etag}"', last_modified
+
+
+def _finish(request, response, etag, last_modified):
+    if etag is None or response.status_code not in (200, 304):
+        return response
+    response.headers.setdefault('ETag', etag)
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(last_modified)
+    # Browsers and CDNs keep the page but check back on every use
+    patch_cache_control(response, no_cache=True, private=request.user.is_authenticated)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def conditional(page):
+    """Answer GETs whose If-None-Match/If-Modified-Since still match with 304.
+
+    Works on sync and async views; the validators are computed before the
+    view runs, so a 304 skips the view's queries and its render.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # Resolve the user once for both the validators and the view
+                request.user = await request.auser()
+                etag, last_modified = await sync_to_async(validators)(request, page, *args, **kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            etag, last_modified = validators(request, page, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            return _finish(request, response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -1,8 +1,4 @@
-from .models import Cart
+from .cart import get_cart_summary
 
 def cart_items_count(request):
-    if request.user.is_authenticated:
-        cart = Cart.objects.filter(user=request.user).first()
-        if cart:
-            return {'cart_items_count': cart.get_total_items()}
-    return {'cart_items_count': 0}
\ No newline at end of file
+    return {'cart_items_count': get_cart_summary(request).total_items}
\ No newline at end of file
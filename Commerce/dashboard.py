@@ -0,0 +1,46 @@
+"""Data for the admin dashboard, loadable from sync or async views.
+
+reads() lists the dashboard's independent queries once; context() runs them
+one after another for the WSGI view and acontext() gathers them on the event
+loop for the ASGI view.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+
+from . import stats
+from .models import Cart, Category, Order, Product, User
+
+
+def reads():
+    """{context name: (how to evaluate, queryset)} for what the template shows"""
+    return {
+        'total_products': ('count', Product.objects.all()),
+        'recent_orders': ('list', Order.objects.select_related('user').order_by('-created_at')[:10]),
+        'recent_users': ('list', User.objects.filter(is_staff=False).order_by('-date_joined')[:5]),
+        'categories': ('list', Category.objects.all()),
+        'active_carts': ('count', Cart.objects.all()),
+        'low_stock_products': ('list', Product.objects.filter(stock__lt=10)[:5]),
+    }
+
+
+def context():
+    values = stats.dashboard_counters()
+    for name, (kind, queryset) in reads().items():
+        values[name] = queryset.count() if kind == 'count' else list(queryset)
+    return values
+
+
+async def _aevaluate(kind, queryset):
+    if kind == 'count':
+        return await queryset.acount()
+    return [row async for row in queryset]
+
+
+async def acontext():
+    pending = reads()
+    counters, *results = await asyncio.gather(
+        sync_to_async(stats.dashboard_counters)(),
+        *(_aevaluate(kind, queryset) for kind, queryset in pending.values()),
+    )
+    return {**counters, **dict(zip(pending, results))}
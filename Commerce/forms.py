@@ -1,9 +1,13 @@
+from datetime import timedelta
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.utils import timezone
 from unicodedata import category
 
-from .models import Product
+from . import analytics, catalog_snapshot, exports
+from .models import Order, Product
 
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField(
@@ -132,8 +136,70 @@ class CheckoutForm(forms.Form):
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ['name', 'description', 'price', 'stock', 'category','image','calories']
+        fields = ['sku', 'name', 'description', 'price', 'stock', 'category','image','calories']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4}),
             'price': forms.NumberInput(attrs={'step':'0.01'}),
-        }
\ No newline at end of file
+        }
+
+class ExportForm(forms.Form):
+    """Filters for the staff exports in Commerce.exports"""
+    format = forms.ChoiceField(choices=[(fmt, fmt) for fmt in exports.FORMATS], required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    status = forms.MultipleChoiceField(choices=Order.STATUS_CHOICES, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError("The start date must not be after the end date.")
+        return cleaned_data
+
+
+class SalesReportForm(forms.Form):
+    """Date range and bucket size for the sales report in Commerce.analytics"""
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    granularity = forms.ChoiceField(choices=[('day', 'Daily'), ('hour', 'Hourly')], required=False,
+                                    widget=forms.Select(attrs={'class': 'form-select'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_to = cleaned_data.get('date_to') or timezone.localdate()
+        date_from = cleaned_data.get('date_from') or date_to - timedelta(days=29)
+        granularity = cleaned_data.get('granularity') or 'day'
+        if date_from > date_to:
+            raise forms.ValidationError("The start date must not be after the end date.")
+        if granularity == 'hour' and (date_to - date_from).days >= analytics.MAX_HOURLY_DAYS:
+            raise forms.ValidationError(f"Hourly reports cover at most {analytics.MAX_HOURLY_DAYS} days.")
+        cleaned_data.update(date_from=date_from, date_to=date_to, granularity=granularity)
+        return cleaned_data
+
+
+class ProductFilterForm(forms.Form):
+    """Price, calorie, availability and sort filters for product_list (Commerce.catalog_snapshot)"""
+    SORT_CHOICES = [('newest', 'Newest'), ('price', 'Price: low to high'), ('-price', 'Price: high to low')]
+
+    min_price = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2,
+                                   widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Min'}))
+    max_price = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2,
+                                   widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Max'}))
+    max_calories = forms.IntegerField(required=False, min_value=0,
+                                      widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    availability = forms.ChoiceField(choices=[('', 'In stock'), ('all', 'Include out of stock')], required=False,
+                                     widget=forms.Select(attrs={'class': 'form-select'}))
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False, widget=forms.Select(attrs={'class': 'form-select'}))
+
+    def filters(self, category_id=None):
+        """The catalog_snapshot.Filters asked for, or None when the plain listing will do"""
+        if not self.is_valid():
+            return None
+        data = self.cleaned_data
+        unbounded = all(data[name] is None for name in ('min_price', 'max_price', 'max_calories'))
+        if unbounded and not data['availability'] and data['sort'] in ('', 'newest'):
+            return None
+        return catalog_snapshot.Filters(
+            category_id=category_id, min_price=data['min_price'], max_price=data['max_price'],
+            max_calories=data['max_calories'], in_stock=data['availability'] != 'all', sort=data['sort'] or 'newest',
+        )
@@ -0,0 +1,123 @@
+"""Resized derivatives of product images.
+
+Originals are stored under a name derived from a hash of their content, so
+uploading the same picture twice keeps a single copy on disk. Each original
+gets WebP and JPEG derivatives at the fixed WIDTHS (never upscaled), stored
+as products/derived/<hash>/<width>.<ext>, which templates combine into
+srcset attributes through Product.image_srcset.
+
+New uploads are processed by the derive_product_image outbox job once the
+product's save commits, so a save never waits on Pillow. derive() only
+touches storage, never the database, so the backfill command can run it
+across a process pool.
+"""
+import hashlib
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageOps
+
+
+WIDTHS = (160, 320, 640, 1024)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+ORIGINALS_DIR = 'products/originals'
+DERIVED_DIR = 'products/derived'
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()[:24]
+
+
+def derived_name(image_hash, width, ext):
+    return f'{DERIVED_DIR}/{image_hash}/{width}.{ext}'
+
+
+def target_widths(original_width):
+    """The fixed widths that fit inside the original, or just its own width"""
+    return [width for width in WIDTHS if width <= original_width] or [original_width]
+
+
+def _save_once(name, content):
+    """Save ``content`` as exactly ``name`` unless a file by that name exists"""
+    if default_storage.exists(name):
+        return
+    saved = default_storage.save(name, content)
+    if saved != name:
+        # Another worker wrote the same content first
+        default_storage.delete(saved)
+
+
+def _encode(image, width, ext):
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image.copy()
+    image_format, options = FORMATS[ext]
+    if image_format == 'JPEG' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    elif resized.mode not in ('RGB', 'RGBA'):
+        resized = resized.convert('RGBA')
+    buffer = io.BytesIO()
+    resized.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def derive(name):
+    """Store the content-addressed original and its derivatives for one stored image.
+
+    Returns (canonical_name, image_hash, widths). Files that already exist
+    are left alone, so repeated or concurrent runs only do the missing work.
+    """
+    with default_storage.open(name, 'rb') as file:
+        image_hash = content_hash(file)
+        ext = posixpath.splitext(name)[1].lower()
+        canonical = f'{ORIGINALS_DIR}/{image_hash}{ext}'
+        if name != canonical:
+            _save_once(canonical, file)
+            file.seek(0)
+        with Image.open(file) as image:
+            image = ImageOps.exif_transpose(image)
+            widths = target_widths(image.width)
+            for width in widths:
+                for derived_ext in FORMATS:
+                    target = derived_name(image_hash, width, derived_ext)
+                    if not default_storage.exists(target):
+                        _save_once(target, _encode(image, width, derived_ext))
+    return canonical, image_hash, widths
+
+
+def apply(products, name, canonical, image_hash, widths):
+    """Point the products that use ``name`` at its canonical original.
+
+    The uploaded copy is deleted once nothing references it any more, after
+    the update commits, so a rollback never leaves a row pointing at a
+    missing file.
+    """
+    from .models import Product
+
+    Product.objects.filter(image=name).update(image=canonical, image_hash=image_hash, image_widths=widths,
+                                              updated_at=Now())
+    for product in products:
+        product.image.name, product.image_hash, product.image_widths = canonical, image_hash, widths
+    if name != canonical and not Product.objects.filter(image=name).exists():
+        transaction.on_commit(lambda: default_storage.delete(name))
+
+
+def derived_url(image_hash, width, ext):
+    return default_storage.url(derived_name(image_hash, width, ext))
+
+
+def srcset(image_hash, widths, ext):
+    return ', '.join(f'{derived_url(image_hash, width, ext)} {width}w' for width in widths)
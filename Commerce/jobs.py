@@ -0,0 +1,47 @@
+"""Handlers for the background jobs queued through Commerce.outbox.
+
+A job can run more than once (its worker may die after the work but before
+the job is deleted), so each handler must be safe to repeat.
+"""
+from datetime import datetime
+
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from . import analytics, catalog_cache, images, outbox
+from .models import Order, Product
+
+
+@outbox.task
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('user').filter(pk=order_id).first()
+    if order is None or not order.user.email:
+        return
+    body = render_to_string('emails/order_confirmation.txt', {
+        'order': order,
+        'items': order.items.select_related('product').order_by('id'),
+    })
+    send_mail(f'Your ReggieMercy order #{order.id}', body, None, [order.user.email])
+
+
+@outbox.task
+def record_sales(hour, lines, sign=1):
+    # The rollup deltas commit together with the job's deletion, so a job
+    # only runs again if its earlier attempt was rolled back
+    analytics.apply(datetime.fromisoformat(hour), lines, sign)
+
+
+@outbox.task
+def derive_product_image(image):
+    """Build the derivatives of an uploaded image and point its products at the canonical original"""
+    if not default_storage.exists(image):
+        # An earlier run already replaced and deleted the upload
+        return
+    products = list(Product.objects.filter(image=image))
+    images.apply(products, image, *images.derive(image))
+    # apply() updates the rows with a queryset update, which skips the Product signals
+    transaction.on_commit(lambda: catalog_cache.invalidate_products(
+        [(product.pk, product.category_id) for product in products]
+    ))
@@ -0,0 +1,77 @@
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from Commerce import benchmarks
+from Commerce.models import Product
+
+
+STATIC_LINK = re.compile(r'(?:href|src)="(%s[^"]+)"')
+STYLE_BLOCK = re.compile(r'<style\b.*?</style>', re.S)
+
+
+class Command(BaseCommand):
+    help = ('Report the bytes each storefront page costs a browser on its first and repeat views now '
+            'that its stylesheet is a hashed, precompressed, immutable asset, against the old inline '
+            'CSS served uncompressed on every view. Needs collectstatic to have run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accept-encoding', default='br, gzip', help='Accept-Encoding sent for assets')
+        parser.add_argument('--json', help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        if not getattr(staticfiles_storage, 'hashed_files', None):
+            raise CommandError(f'No static manifest in {settings.STATIC_ROOT}; run collectstatic first')
+        pages = {'home': reverse('home'), 'product_list': reverse('product_list'), 'view_cart': reverse('view_cart'),
+                 'login': reverse('login')}
+        product = Product.objects.order_by('-created_at').first()
+        if product:
+            pages['product_detail'] = reverse('product_detail', args=[product.id])
+        link = re.compile(STATIC_LINK.pattern % re.escape(settings.STATIC_URL))
+
+        results = {}
+        # DEBUG off so templates link the hashed names, as in production
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            client = Client()
+            for name, path in pages.items():
+                response = client.get(path)
+                if response.status_code >= 400:
+                    raise CommandError(f'GET {path} returned {response.status_code}')
+                html = response.content.decode()
+                row = {'html': len(response.content), 'inline_css': sum(len(block.encode()) for block in
+                                                                         STYLE_BLOCK.findall(html)),
+                       'assets': 0, 'assets_raw': 0, 'assets_sent': 0, 'immutable': 0}
+                for url in dict.fromkeys(link.findall(html)):
+                    asset = client.get(url, headers={'accept-encoding': options['accept_encoding']})
+                    if asset.status_code != 200:
+                        raise CommandError(f'GET {url} returned {asset.status_code}; is STATIC_ROOT current?')
+                    row['assets'] += 1
+                    row['assets_sent'] += len(b''.join(asset.streaming_content))
+                    row['assets_raw'] += os.path.getsize(
+                        os.path.join(settings.STATIC_ROOT, url[len(settings.STATIC_URL):]))
+                    row['immutable'] += 'immutable' in asset.get('Cache-Control', '')
+                # Before the stylesheets were extracted their CSS rode along, uncompressed, in every page
+                row['before'] = row['html'] + row['assets_raw']
+                row['first_view'] = row['html'] + row['assets_sent']
+                row['repeat_view'] = row['html'] + (row['assets_sent'] if row['immutable'] < row['assets'] else 0)
+                results[name] = row
+
+        self.stdout.write(f'{"page":<16} {"html":>8} {"inline css":>11} {"assets":>7} {"raw":>8} {"sent":>8} '
+                          f'{"before":>8} {"first":>8} {"repeat":>8} {"saved":>7}')
+        for name, row in results.items():
+            saved = 1 - row['repeat_view'] / row['before']
+            self.stdout.write(f'{name:<16} {row["html"]:>8} {row["inline_css"]:>11} {row["assets"]:>7} '
+                              f'{row["assets_raw"]:>8} {row["assets_sent"]:>8} {row["before"]:>8} '
+                              f'{row["first_view"]:>8} {row["repeat_view"]:>8} {saved:>7.0%}')
+        self.stdout.write('Bytes per view. "before" is the page with its stylesheets inline; "saved" compares '
+                          'it with a repeat view, where immutable assets come from the browser cache.')
+        if options['json']:
+            benchmarks.write_results(options['json'], 'assets', {
+                'accept_encoding': options['accept_encoding'],
+            }, results)
@@ -0,0 +1,92 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from Commerce import analytics, benchmarks
+from Commerce.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = ('Time sales reports over ranges of days from the rollup tables against the same report '
+            'aggregated from the raw order lines, and time a full rebuild. Runs in a transaction that '
+            'is rolled back, so any data it generates is discarded.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=benchmarks.SCALES,
+                            help='Generate synthetic data first (default: use existing data, or 1k if empty)')
+        parser.add_argument('--days', type=int, action='append', help='Report range in days; repeatable '
+                                                                      '(default 1, 7, 30 and 365)')
+        parser.add_argument('--repeat', type=int, default=20, help='Reports per range and source')
+        parser.add_argument('--json', help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        ranges = options['days'] or [1, 7, 30, 365]
+        if options['repeat'] < 1 or min(ranges) < 1:
+            raise CommandError('--repeat and --days must be positive')
+        results = {}
+        with transaction.atomic():
+            scale = options['scale'] or (None if Order.objects.exists() else '1k')
+            if scale:
+                products, customers, orders = benchmarks.SCALES[scale]
+                started = time.perf_counter()
+                benchmarks.generate(products=products, customers=customers, orders=orders,
+                                    log=lambda message: self.stdout.write(f'  generated {message}'))
+                self.stdout.write(f'  generated {scale} in {time.perf_counter() - started:.0f}s')
+            started = time.perf_counter()
+            rows = analytics.rebuild()
+            self.stdout.write(f'  rebuilt {rows["hourly"]} hourly and {rows["daily"]} daily rows '
+                              f'in {time.perf_counter() - started:.1f}s')
+            orders, items = Order.objects.count(), OrderItem.objects.count()
+
+            today = timezone.localdate()
+            for days in ranges:
+                date_from = today - timedelta(days=days - 1)
+                rollup = analytics.report(date_from, today)
+                raw = self.from_order_lines(date_from, today)
+                if rollup['totals'] != raw['totals']:
+                    raise CommandError(f'{days} days: rollups {rollup["totals"]} != order lines {raw["totals"]}')
+                results[f'{days}d rollups'] = self.time(lambda: analytics.report(date_from, today), options)
+                results[f'{days}d order lines'] = self.time(lambda: self.from_order_lines(date_from, today),
+                                                            options)
+            transaction.set_rollback(True)
+
+        self.stdout.write(benchmarks.format_table(results))
+        if options['json']:
+            benchmarks.write_results(options['json'], 'analytics', {
+                'scale': scale, 'orders': orders, 'order_items': items, 'hourly_rows': rows['hourly'],
+                'daily_rows': rows['daily'],
+            }, results)
+
+    def time(self, run, options):
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        return benchmarks.summarize(timings)
+
+    def from_order_lines(self, date_from, date_to):
+        """The report analytics.report() gives, aggregated from the order lines on every call"""
+        lines = OrderItem.objects.filter(
+            ~Q(order__status='cancelled'),
+            order__created_at__gte=analytics.start_of(date_from),
+            order__created_at__lt=analytics.start_of(date_to + timedelta(days=1)),
+        )
+        totals = lambda rows: rows.annotate(total_orders=Count('order_id', distinct=True),
+                                            total_units=Sum('quantity'), total_revenue=analytics.REVENUE)
+        days = lines.values(day=TruncDate('order__created_at', tzinfo=timezone.get_current_timezone()))
+        series = analytics.cents(list(totals(days).order_by('day')))
+        categories = totals(lines.values(category=F('product__category_id'), name=F('product__category__name')))
+        products = totals(lines.values('product_id', name=F('product__name'), sku=F('product__sku')))
+        return {
+            'totals': {'orders': sum(row['total_orders'] for row in series),
+                       'units': sum(row['total_units'] for row in series),
+                       'revenue': sum(row['total_revenue'] for row in series)},
+            'categories': analytics.cents(list(categories.order_by('-total_revenue')[:analytics.TOP_LIMIT])),
+            'products': analytics.cents(list(products.order_by('-total_revenue')[:analytics.TOP_LIMIT])),
+        }
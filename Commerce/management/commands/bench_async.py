@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from itertools import cycle, islice
+from types import ModuleType
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from Commerce import benchmarks, catalog_cache, urls
+from Commerce.models import Product
+
+
+def urlconf(async_views):
+    module = ModuleType('bench_async_urls')
+    module.urlpatterns = urls.with_async_views(urls.urlpatterns) if async_views else urls.urlpatterns
+    return module
+
+
+class Command(BaseCommand):
+    help = ('Compare the storefront read views served sync (WSGI, one thread per concurrent request) '
+            'with their async twins (ASGI, concurrent tasks on one event loop). Reads existing data; '
+            'run generate_bench_data first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--cold', action='store_true', help='Invalidate the catalog cache before each request')
+        parser.add_argument('--json', help='Write the results to this file')
+        parser.add_argument('--compare', help='Results file from an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        product = Product.objects.order_by('-created_at').first()
+        if product is None:
+            raise CommandError('No products; run generate_bench_data first')
+        paths = {
+            'home': reverse('home'),
+            'product_list': reverse('product_list'),
+            'product_list_by_category': reverse('product_list_by_category', args=[product.category_id]),
+            'product_detail': reverse('product_detail', args=[product.id]),
+        }
+        # The same round-robin sequence of requests for both modes
+        work = list(islice(cycle(paths.items()), options['requests']))
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for mode, run in (('wsgi', self.run_threads), ('asgi', self.run_tasks)):
+                with override_settings(ROOT_URLCONF=urlconf(mode == 'asgi')):
+                    run(work[:len(paths)], 1, False)  # warm the catalog cache and connections
+                    timings, queries, elapsed = run(work, options['concurrency'], options['cold'])
+                for name in paths:
+                    results[f'{mode} {name}'] = benchmarks.summarize(timings[name], queries=queries[name])
+                results[f'{mode} total'] = benchmarks.summarize(
+                    [t for values in timings.values() for t in values], elapsed=elapsed)
+                self.stdout.write(f'  {mode}: {results[f"{mode} total"]["throughput_rps"]} req/s')
+
+        self.stdout.write(benchmarks.format_table(results))
+        if options['compare']:
+            self.stdout.write('\n'.join(benchmarks.compare(options['compare'], results)))
+        if options['json']:
+            benchmarks.write_results(options['json'], 'async', {
+                'requests': options['requests'], 'concurrency': options['concurrency'], 'cold': options['cold'],
+                'products': Product.objects.count(),
+            }, results)
+
+    def run_threads(self, work, concurrency, cold):
+        """Each thread takes the next request off the shared list, like a threaded WSGI server"""
+        timings, queries = defaultdict(list), defaultdict(list)
+        pending = iter(work)
+        lock = threading.Lock()
+
+        def worker():
+            client = Client()
+            while True:
+                with lock:
+                    item = next(pending, None)
+                if item is None:
+                    return
+                name, path = item
+                if cold:
+                    catalog_cache.invalidate_all()
+                started = time.perf_counter()
+                response = client.get(path)
+                elapsed = time.perf_counter() - started
+                self.check_response(response, path)
+                with lock:
+                    timings[name].append(elapsed)
+                    queries[name].append(response.wsgi_request.query_profile.query_count)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, queries, time.perf_counter() - started
+
+    def run_tasks(self, work, concurrency, cold):
+        return async_to_sync(self.arun_tasks)(work, concurrency, cold)
+
+    async def arun_tasks(self, work, concurrency, cold):
+        """Concurrent tasks on one event loop, like an ASGI server"""
+        timings, queries = defaultdict(list), defaultdict(list)
+        pending = iter(work)
+
+        async def worker():
+            client = AsyncClient()
+            for name, path in pending:
+                if cold:
+                    catalog_cache.invalidate_all()
+                started = time.perf_counter()
+                response = await client.get(path)
+                timings[name].append(time.perf_counter() - started)
+                self.check_response(response, path)
+                queries[name].append(response.asgi_request.query_profile.query_count)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return timings, queries, time.perf_counter() - started
+
+    def check_response(self, response, path):
+        if response.status_code >= 400:
+            raise CommandError(f'GET {path} returned {response.status_code}')
@@ -0,0 +1,131 @@
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Mod
+
+from Commerce import benchmarks, catalog_snapshot
+from Commerce.models import Category, Product
+
+
+PAGE_SIZE = 24
+
+
+class Command(BaseCommand):
+    help = ('Compare filtered, sorted product listing pages and their facet counts served from the '
+            'in-memory catalog snapshot against the same queries through the ORM, and report the '
+            'snapshot\'s load time and memory. Each catalog is generated inside a transaction that is '
+            'rolled back, so the database is left unchanged.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, action='append',
+                            help='Catalog size; repeatable (default 100000 and 1000000)')
+        parser.add_argument('--queries', type=int, default=50, help='Random filter combinations per catalog')
+        parser.add_argument('--python', action='store_true',
+                            help='Also time the snapshot without NumPy (always done when NumPy is missing)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        sizes = options['products'] or [100_000, 1_000_000]
+        if options['queries'] < 1 or min(sizes) < 1:
+            raise CommandError('--products and --queries must be positive')
+        if catalog_snapshot.numpy is None:
+            self.stdout.write(self.style.WARNING('NumPy is not installed; timing the pure Python snapshot.'))
+        results, settings = {}, {'queries': options['queries'], 'numpy': catalog_snapshot.numpy is not None}
+        for size in sizes:
+            with transaction.atomic():
+                settings[size] = self.populate(size, options['seed'])
+                snapshot = self.load(settings[size])
+                self.verify(snapshot, self.random_filters(size, options))
+                for name, row in self.run(snapshot, size, options).items():
+                    results[name] = row
+                    self.stdout.write(f'  {name}: p50 {row["p50_ms"]:.2f} ms, p95 {row["p95_ms"]:.2f} ms')
+                transaction.set_rollback(True)
+
+        self.stdout.write(benchmarks.format_table(results))
+        for size in sizes:
+            row = settings[size]
+            self.stdout.write(f'{size} products: snapshot {row["snapshot_mib"]} MiB in arrays, '
+                              f'{row["load_peak_mib"]} MiB peak while loading, loaded in {row["load_s"]}s')
+        if options['json']:
+            benchmarks.write_results(options['json'], 'catalog_snapshot', settings, results)
+
+    def populate(self, size, seed):
+        started = time.perf_counter()
+        benchmarks.generate(products=size, customers=1, orders=0, categories=50, seed=seed)
+        # generate() leaves calories unset and stock rarely zero; vary both so every filter bites
+        Product.objects.update(calories=Mod(F('id') * 37, 900), stock=Mod('stock', 50))
+        Product.objects.alias(fourth=Mod('id', 4)).filter(fourth=0).update(calories=None)
+        Product.objects.alias(tenth=Mod('id', 10)).filter(tenth=0).update(stock=0)
+        return {'generate_s': round(time.perf_counter() - started, 1)}
+
+    def load(self, row):
+        started = time.perf_counter()
+        catalog_snapshot.CatalogSnapshot.load()
+        row['load_s'] = round(time.perf_counter() - started, 2)
+        tracemalloc.start()
+        try:
+            snapshot = catalog_snapshot.CatalogSnapshot.load()
+            row['load_peak_mib'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        finally:
+            tracemalloc.stop()
+        row['snapshot_mib'] = round(snapshot.nbytes / 2 ** 20, 1)
+        return snapshot
+
+    def random_filters(self, size, options):
+        rng = random.Random(options['seed'])
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        filters = []
+        for _ in range(options['queries']):
+            low = rng.choice([None, Decimal(rng.randint(1, 200))])
+            filters.append(catalog_snapshot.Filters(
+                category_id=rng.choice([None, rng.choice(category_ids)]),
+                min_price=low,
+                max_price=rng.choice([None, (low or 0) + rng.randint(5, 300)]),
+                max_calories=rng.choice([None, None, rng.randint(100, 800)]),
+                in_stock=rng.random() < 0.8,
+                sort=rng.choice(list(catalog_snapshot.SORTS)),
+            ))
+        return filters
+
+    def verify(self, snapshot, filters):
+        for one in filters[:5]:
+            products = catalog_snapshot.queryset(one)
+            expected = (list(products.values_list('id', flat=True)[:PAGE_SIZE]), products.count())
+            if (snapshot.select(one, 0, PAGE_SIZE) != expected
+                    or snapshot.facet_counts(one) != catalog_snapshot.orm_facet_counts(one)):
+                raise CommandError(f'Snapshot and ORM disagree on {one}')
+
+    def run(self, snapshot, size, options):
+        filters = self.random_filters(size, options)
+
+        def orm_page(one):
+            products = catalog_snapshot.queryset(one)
+            return list(products.values_list('id', flat=True)[:PAGE_SIZE]), products.count()
+
+        operations = {
+            'snapshot page': lambda one: snapshot.select(one, 0, PAGE_SIZE),
+            'snapshot facets': snapshot.facet_counts,
+            'orm page': orm_page,
+            'orm facets': catalog_snapshot.orm_facet_counts,
+        }
+        results = {f'{size} {name}': self.time(operation, filters) for name, operation in operations.items()}
+        if options['python'] and catalog_snapshot.numpy is not None:
+            with mock.patch.object(catalog_snapshot, 'numpy', None):
+                results[f'{size} python page'] = self.time(lambda one: snapshot.select(one, 0, PAGE_SIZE), filters)
+                results[f'{size} python facets'] = self.time(snapshot.facet_counts, filters)
+        return results
+
+    def time(self, operation, filters):
+        timings = []
+        for one in filters:
+            started = time.perf_counter()
+            operation(one)
+            timings.append(time.perf_counter() - started)
+        return benchmarks.summarize(timings)
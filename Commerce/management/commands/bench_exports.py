@@ -0,0 +1,76 @@
+import os
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Commerce import benchmarks, exports
+from Commerce.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = ('Time streaming each export dataset in each format to /dev/null, reporting rows/s and, '
+            'with --memory, the peak Python memory of a second, traced run. Runs in a transaction that '
+            'is rolled back, so any data it generates is discarded.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=benchmarks.SCALES,
+                            help='Generate synthetic data first (default: use existing data, or 1k if empty)')
+        parser.add_argument('--dataset', choices=list(exports.DATASETS), action='append',
+                            help='Only this dataset; repeatable')
+        parser.add_argument('--format', choices=exports.FORMATS, action='append', help='Only this format; repeatable')
+        parser.add_argument('--memory', action='store_true', help='Also measure peak memory with tracemalloc')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+        parser.add_argument('--json', help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        results = {}
+        with transaction.atomic():
+            scale = options['scale'] or (None if Order.objects.exists() else '1k')
+            if scale:
+                products, customers, orders = benchmarks.SCALES[scale]
+                started = time.perf_counter()
+                benchmarks.generate(products=products, customers=customers, orders=orders,
+                                    log=lambda message: self.stdout.write(f'  generated {message}'))
+                self.stdout.write(f'  generated {scale} in {time.perf_counter() - started:.0f}s')
+            orders, items = Order.objects.count(), OrderItem.objects.count()
+            for dataset in options['dataset'] or exports.DATASETS:
+                for fmt in options['format'] or exports.FORMATS:
+                    name = f'{dataset} {fmt}'
+                    results[name] = self.run(dataset, fmt, options)
+                    row = results[name]
+                    self.stdout.write(f'  {name}: {row["rows"]} rows, {row["rows_per_s"]:,.0f} rows/s')
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'{"export":<20} {"rows":>10} {"seconds":>9} {"rows/s":>10} {"MiB":>8} {"peak MiB":>9}')
+        for name, row in results.items():
+            self.stdout.write(f'{name:<20} {row["rows"]:>10} {row["seconds"]:>9.2f} {row["rows_per_s"]:>10,.0f} '
+                              f'{row["mib"]:>8.1f} {row.get("peak_mib", ""):>9}')
+        if options['json']:
+            benchmarks.write_results(options['json'], 'exports', {
+                'scale': scale, 'orders': orders, 'order_items': items, 'chunk_size': options['chunk_size'],
+            }, results)
+
+    def run(self, dataset, fmt, options):
+        export = exports.Export(dataset, fmt, chunk_size=options['chunk_size'])
+        written = 0
+        started = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as sink:
+            for chunk in export:
+                sink.write(chunk)
+                written += len(chunk)
+        elapsed = time.perf_counter() - started
+        result = {'rows': export.rows, 'seconds': round(elapsed, 3),
+                  'rows_per_s': round(export.rows / (elapsed or 1), 1), 'mib': round(written / 2 ** 20, 1)}
+        if options['memory']:
+            tracemalloc.start()
+            try:
+                for _ in exports.Export(dataset, fmt, chunk_size=options['chunk_size']):
+                    pass
+                result['peak_mib'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            finally:
+                tracemalloc.stop()
+        return result
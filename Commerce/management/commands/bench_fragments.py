@@ -0,0 +1,72 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.urls import reverse
+
+from Commerce import benchmarks, catalog_cache
+from Commerce.models import Product
+from Commerce.pagination import KeysetPage
+
+
+class Command(BaseCommand):
+    help = ('Time rendering a product listing of --products cards with the fragment cache cold (every '
+            'card rendered and stored) and warm (every card read back). Runs in a transaction that is '
+            'rolled back, so any products it generates are discarded.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Cards on the listing')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--json', help='Write the results to this file')
+        parser.add_argument('--compare', help='Results file from an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['products'] < 1:
+            raise CommandError('--products and --iterations must be positive')
+        with transaction.atomic():
+            missing = options['products'] - Product.objects.count()
+            if missing > 0:
+                benchmarks.generate(products=missing, customers=1, orders=0)
+            products = list(Product.objects.select_related('category').order_by('-created_at')[:options['products']])
+            request = RequestFactory().get(reverse('product_list'))
+            request.user = AnonymousUser()
+            context = {
+                'products': KeysetPage(products, request.GET),
+                'page': None,
+                'total_products': len(products),
+                'categories': catalog_cache.categories(),
+                'category': None,
+            }
+            template = get_template('product_list.html')
+
+            results = {}
+            for mode in ('cold', 'warm'):
+                catalog_cache.reset_counters()
+                timings = []
+                template.render(context, request)
+                for _ in range(options['iterations']):
+                    if mode == 'cold':
+                        catalog_cache.invalidate_all()
+                    started = time.perf_counter()
+                    template.render(context, request)
+                    timings.append(time.perf_counter() - started)
+                results[mode] = benchmarks.summarize(timings)
+                counters = catalog_cache.counters()
+                hits, misses = counters.get('card1_hits', 0), counters.get('card1_misses', 0)
+                self.stdout.write(f'  {mode}: p50 {results[mode]["p50_ms"]} ms, '
+                                  f'card hit rate {hits / ((hits + misses) or 1):.0%}')
+            transaction.set_rollback(True)
+
+        self.stdout.write(benchmarks.format_table(results))
+        if results['warm']['p50_ms']:
+            self.stdout.write(f'Warm renders take {results["warm"]["p50_ms"] / results["cold"]["p50_ms"]:.0%} '
+                              f'of the cold render time for {len(products)} cards.')
+        if options['compare']:
+            self.stdout.write('\n'.join(benchmarks.compare(options['compare'], results)))
+        if options['json']:
+            benchmarks.write_results(options['json'], 'fragments', {
+                'products': len(products), 'iterations': options['iterations'],
+            }, results)
@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Commerce import product_io
+from Commerce.benchmarks import ADJECTIVES, NOUNS
+
+
+class Command(BaseCommand):
+    help = ('Benchmark bulk product import and export on a synthetic feed. Everything runs in a '
+            'transaction that is rolled back, so the database is left unchanged.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50_000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=product_io.BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1:
+            raise CommandError('--rows must be positive')
+        rng = random.Random(options['seed'])
+        for fmt in product_io.FORMATS:
+            feed = self.feed(rng, fmt, options['rows'], options['categories'])
+            with transaction.atomic():
+                self.measure(f'{fmt} import (insert)', options['rows'], lambda: self.load(feed, fmt, options))
+                self.measure(f'{fmt} import (update)', options['rows'], lambda: self.load(feed, fmt, options))
+                self.measure(f'{fmt} export', options['rows'],
+                             lambda: product_io.export_products(io.StringIO(), fmt))
+                transaction.set_rollback(True)
+
+    def feed(self, rng, fmt, rows, categories):
+        stream = io.StringIO()
+        records = (
+            {'sku': f'BENCH-{i:08d}', 'name': f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {i}',
+             'description': f'A {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}.',
+             'price': f'{rng.randint(100, 50_000) / 100:.2f}', 'stock': rng.randint(0, 50),
+             'category': f'Bench category {rng.randrange(categories)}', 'calories': ''}
+            for i in range(rows)
+        )
+        if fmt == 'csv':
+            writer = csv.DictWriter(stream, product_io.COLUMNS)
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            stream.writelines(json.dumps(record) + '\n' for record in records)
+        return stream.getvalue()
+
+    def load(self, feed, fmt, options):
+        result = product_io.import_products(
+            product_io.read_rows(io.StringIO(feed), fmt), batch_size=options['batch_size'], create_categories=True,
+        )
+        if result.invalid:
+            raise CommandError(f'{result.invalid} synthetic rows were rejected')
+
+    def measure(self, label, rows, run):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label}: {rows / elapsed:,.0f} rows/s ({elapsed:.2f}s)')
@@ -0,0 +1,70 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Commerce import search
+from Commerce.benchmarks import ADJECTIVES, NOUNS
+from Commerce.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = ('Benchmark product search on a synthetic catalog. The catalog is created inside a '
+            'transaction that is rolled back, so the database is left unchanged.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if not search.uses_fts():
+            self.stdout.write(self.style.WARNING('FTS5 index not available; benchmarking the icontains fallback.'))
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self.populate(rng, options['products'])
+            terms = [rng.choice(NOUNS) for _ in range(options['queries'] // 2)]
+            terms += [rng.choice(ADJECTIVES)[:3] + ' ' + rng.choice(NOUNS)[:4]
+                      for _ in range(options['queries'] - len(terms))]
+            ranked = self.time_queries(lambda q: search.search(q, limit=24), terms)
+            counted = self.time_queries(lambda q: search.filter_products(Product.objects.all(), q).count(), terms)
+            transaction.set_rollback(True)
+
+        self.report('search() top 24', ranked)
+        self.report('filter_products().count()', counted)
+
+    def populate(self, rng, count):
+        if count < 1:
+            raise CommandError('--products must be positive')
+        started = time.perf_counter()
+        category = Category.objects.create(name='Benchmark')
+        batch = []
+        for i in range(count):
+            adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+            batch.append(Product(
+                name=f'{adjective.title()} {noun} {i}',
+                description=f'A {rng.choice(ADJECTIVES)} {noun} with {rng.choice(ADJECTIVES)} finish.',
+                price=rng.randint(100, 50_000) / 100, category=category, stock=rng.randint(0, 50),
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        search.rebuild_index()
+        self.stdout.write(f'Indexed {count} products in {time.perf_counter() - started:.1f}s')
+
+    def time_queries(self, run, terms):
+        timings = []
+        for term in terms:
+            started = time.perf_counter()
+            run(term)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'{label}: p50 {statistics.median(timings):.2f} ms, '
+                          f'p95 {p95:.2f} ms, max {timings[-1]:.2f} ms over {len(timings)} queries')
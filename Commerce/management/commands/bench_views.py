@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from Commerce import benchmarks, catalog_cache
+from Commerce.models import Cart, CartItem, Order, Product, User
+
+
+class Command(BaseCommand):
+    help = ('Micro-benchmark each view through the test client, reporting latency percentiles and '
+            'query counts. Runs in a transaction that is rolled back, so the database is unchanged.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--scale', choices=benchmarks.SCALES,
+                            help='Generate synthetic data first (default: use existing data, or 1k if empty)')
+        parser.add_argument('--cold', action='store_true', help='Invalidate the catalog cache before each request')
+        parser.add_argument('--view', action='append', help='Only run operations whose name contains this')
+        parser.add_argument('--json', help='Write the results to this file')
+        parser.add_argument('--compare', help='Results file from an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be positive')
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            scale = options['scale'] or (None if Product.objects.filter(stock__gt=0).exists() else '1k')
+            if scale:
+                products, customers, orders = benchmarks.SCALES[scale]
+                benchmarks.generate(products=products, customers=customers, orders=orders)
+            results = {}
+            for name, user, method, url, data, prepare in self.cases():
+                if options['view'] and not any(part in name for part in options['view']):
+                    continue
+                results[name] = self.run_case(user, method, url, data, prepare, options)
+                self.stdout.write(f'  {name}: p50 {results[name]["p50_ms"]} ms')
+            transaction.set_rollback(True)
+
+        self.stdout.write(benchmarks.format_table(results))
+        if options['compare']:
+            self.stdout.write('\n'.join(benchmarks.compare(options['compare'], results)))
+        if options['json']:
+            benchmarks.write_results(options['json'], 'views', {
+                'iterations': options['iterations'], 'scale': scale, 'cold': options['cold'],
+                'products': Product.objects.count(), 'orders': Order.objects.count(),
+            }, results)
+
+    def cases(self):
+        """(name, user, method, url, data, prepare) for each operation"""
+        staff = User.objects.create_user('bench-staff-user', is_staff=True)
+        customer = User.objects.create_user('bench-view-customer')
+        product = Product.objects.filter(stock__gt=0).order_by('-created_at').first()
+        order = Order.objects.order_by('-created_at').first()
+
+        def fill_cart():
+            cart, _ = Cart.objects.get_or_create(user=customer)
+            Product.objects.filter(pk=product.pk).update(stock=1000)
+            CartItem.objects.update_or_create(cart=cart, product=product, defaults={'quantity': 1})
+
+        fill_cart()
+        checkout = {'shipping_address': '1 Bench Road', 'phone_number': '0240000000',
+                    'payment_method': 'cash_on_delivery'}
+        return [
+            ('home', None, 'get', reverse('home'), None, None),
+            ('product_list', None, 'get', reverse('product_list'), None, None),
+            ('product_list_by_category', None, 'get',
+             reverse('product_list_by_category', args=[product.category_id]), None, None),
+            ('product_detail', None, 'get', reverse('product_detail', args=[product.id]), None, None),
+            ('product_search', None, 'get', reverse('product_search'), {'q': product.name.split()[1]}, None),
+            ('view_cart', customer, 'get', reverse('view_cart'), None, None),
+            ('add_to_cart', customer, 'get', reverse('add_to_cart', args=[product.id]), None, None),
+            ('checkout (form)', customer, 'get', reverse('checkout'), None, fill_cart),
+            ('checkout (place order)', customer, 'post', reverse('checkout'), checkout, fill_cart),
+            ('admin_dashboard', staff, 'get', reverse('admin_dashboard'), None, None),
+            ('admin_products', staff, 'get', reverse('admin_products'), None, None),
+            ('customer_list', staff, 'get', reverse('customer_list'), None, None),
+            ('order_history', staff, 'get', reverse('order_history'), None, None),
+            ('user_order_history', staff, 'get',
+             reverse('user_order_history', args=[order.user_id if order else customer.id]), None, None),
+            ('admin_categories', staff, 'get', reverse('admin_categories'), None, None),
+        ]
+
+    def run_case(self, user, method, url, data, prepare, options):
+        client = Client()
+        if user:
+            client.force_login(user)
+        timings, queries = [], []
+        # The first request warms the cache and connection and is not counted
+        for iteration in range(options['iterations'] + 1):
+            if prepare:
+                prepare()
+            if options['cold']:
+                catalog_cache.invalidate_all()
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise CommandError(f'{method.upper()} {url} returned {response.status_code}')
+            if iteration:
+                timings.append(elapsed)
+                queries.append(response.wsgi_request.query_profile.query_count)
+        return benchmarks.summarize(timings, elapsed=sum(timings), queries=queries)
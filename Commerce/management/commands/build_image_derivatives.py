@@ -0,0 +1,63 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Commerce import catalog_cache, images
+from Commerce.models import Product
+
+
+def derive(name):
+    try:
+        return images.derive(name)
+    except (OSError, ValueError) as exc:
+        return exc
+
+
+class Command(BaseCommand):
+    help = 'Generate resized derivatives for product images and deduplicate the originals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 1 runs everything in this process')
+        parser.add_argument('--force', action='store_true',
+                            help='Also process products whose derivatives already exist')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            products = products.filter(image_hash='')
+        by_name = defaultdict(list)
+        for product in products.only('id', 'category_id', 'image'):
+            by_name[product.image.name].append(product)
+        if not by_name:
+            self.stdout.write('No product images to process.')
+            return
+
+        names = sorted(by_name)
+        workers = max(1, min(options['workers'], len(names)))
+        if workers == 1:
+            self.apply_all(names, map(derive, names), by_name)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+                self.apply_all(names, pool.map(derive, names), by_name)
+
+    def apply_all(self, names, results, by_name):
+        hashes, failed = set(), 0
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                failed += 1
+                self.stderr.write(f'{name}: {result}')
+                continue
+            with transaction.atomic():
+                images.apply(by_name[name], name, *result)
+            hashes.add(result[1])
+            self.stdout.write(f'{name} -> {result[0]} ({len(result[2])} widths)')
+        catalog_cache.invalidate_products(
+            [(product.pk, product.category_id) for products in by_name.values() for product in products]
+        )
+        summary = f'Processed {len(names) - failed} images into {len(hashes)} unique originals.'
+        self.stdout.write(self.style.SUCCESS(summary) if not failed else self.style.WARNING(f'{summary} {failed} failed.'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Commerce import exports, product_io
+from Commerce.forms import ExportForm
+
+
+class Command(BaseCommand):
+    help = 'Stream orders, order items or customer totals to a CSV or JSON-lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exports.DATASETS))
+        parser.add_argument('path', nargs='?', default='-', help='Output file, or - for stdout')
+        parser.add_argument('--format', choices=exports.FORMATS,
+                            help='Defaults to the file extension, or csv for stdout')
+        parser.add_argument('--from', dest='date_from', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--status', action='append', default=[], help='Only orders in this status; repeatable')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        form = ExportForm({'format': options['format'] or product_io.format_for(path),
+                           'date_from': options['date_from'], 'date_to': options['date_to'],
+                           'status': options['status']})
+        if not form.is_valid():
+            raise CommandError(' '.join(message for errors in form.errors.values() for message in errors))
+        export = exports.Export(options['dataset'], form.cleaned_data['format'],
+                                date_from=form.cleaned_data['date_from'], date_to=form.cleaned_data['date_to'],
+                                statuses=form.cleaned_data['status'])
+        started = time.perf_counter()
+        if path == '-':
+            export.write_to(self.stdout)
+            return
+        try:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                count = export.write_to(stream)
+        except OSError as exc:
+            raise CommandError(exc)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {count} {options["dataset"]} rows to {path} in {elapsed:.1f}s '
+            f'({count / (elapsed or 1):,.0f} rows/s).'
+        ))
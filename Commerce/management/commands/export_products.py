@@ -0,0 +1,32 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Commerce import product_io
+
+
+class Command(BaseCommand):
+    help = 'Stream every product to a CSV or JSON-lines file in the import format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file, or - for stdout')
+        parser.add_argument('--format', choices=product_io.FORMATS,
+                            help='Defaults to the file extension, or csv for stdout')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or product_io.format_for(path)
+        started = time.perf_counter()
+        if path == '-':
+            product_io.export_products(self.stdout, fmt)
+            return
+        try:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                count = product_io.export_products(stream, fmt)
+        except OSError as exc:
+            raise CommandError(exc)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {count} products to {path} in {elapsed:.1f}s ({count / elapsed:,.0f} rows/s).'
+        ))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Commerce import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic catalog, customers, carts and orders for '
+            'bench_views and load_test. Customers log in as bench-NNNNNNN / ' + benchmarks.PASSWORD)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=benchmarks.SCALES, default='1k')
+        parser.add_argument('--products', type=int, help='Overrides the --scale preset')
+        parser.add_argument('--customers', type=int, help='Overrides the --scale preset')
+        parser.add_argument('--orders', type=int, help='Overrides the --scale preset')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        products, customers, orders = benchmarks.SCALES[options['scale']]
+        counts = {
+            'products': options['products'] if options['products'] is not None else products,
+            'customers': options['customers'] if options['customers'] is not None else customers,
+            'orders': options['orders'] if options['orders'] is not None else orders,
+        }
+        if counts['products'] < 1 or counts['customers'] < 1 or options['categories'] < 1:
+            raise CommandError('At least one category, product and customer is needed')
+        started = time.perf_counter()
+        with transaction.atomic():
+            created = benchmarks.generate(
+                categories=options['categories'], seed=options['seed'],
+                log=lambda message: self.stdout.write(f'  {message} ({time.perf_counter() - started:.1f}s)'),
+                **counts,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{count} {name}' for name, count in created.items())
+            + f' in {time.perf_counter() - started:.1f}s.'
+        ))
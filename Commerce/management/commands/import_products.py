@@ -0,0 +1,57 @@
+import csv
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Commerce import product_io
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSON-lines feed keyed on SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file, or - for stdin')
+        parser.add_argument('--format', choices=product_io.FORMATS,
+                            help='Defaults to the file extension, or csv for stdin')
+        parser.add_argument('--batch-size', type=int, default=product_io.BATCH_SIZE)
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create categories that do not exist instead of rejecting the row')
+        parser.add_argument('--max-errors', type=int, default=50, help='Rejected rows to print')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or product_io.format_for(path)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        printed = 0
+
+        def on_error(line_number, errors):
+            nonlocal printed
+            if printed < options['max_errors']:
+                messages = '; '.join(f'{field}: {" ".join(map(str, msgs))}' for field, msgs in errors.items())
+                self.stderr.write(f'line {line_number}: {messages}')
+                printed += 1
+
+        started = time.perf_counter()
+        try:
+            # stdin belongs to the process, so it is left open
+            stream = nullcontext(sys.stdin) if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as exc:
+            raise CommandError(exc)
+        with stream as feed:
+            try:
+                result = product_io.import_products(
+                    product_io.read_rows(feed, fmt), batch_size=options['batch_size'],
+                    create_categories=options['create_categories'], on_error=on_error,
+                )
+            except (ValueError, csv.Error) as exc:
+                raise CommandError(f'Import stopped, earlier batches were saved: {exc}')
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.rows} rows in {elapsed:.1f}s ({result.rows / elapsed:,.0f} rows/s): '
+            f'{result.created} created, {result.updated} updated, {result.invalid} rejected, '
+            f'{result.categories_created} categories created.'
+        ))
@@ -0,0 +1,144 @@
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import CookieJar
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Commerce import benchmarks
+
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+ADD_LINK = re.compile(r'/cart/add/(\d+)/')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Time each request on its own instead of following redirects"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Shopper:
+    """One simulated customer with its own session"""
+
+    def __init__(self, base_url, username, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+
+    def request(self, path, data=None):
+        """Return (status, body, query count or None, seconds)"""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, content, headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as exc:
+            status, content, headers = exc.code, exc.read(), exc.headers
+        elapsed = time.perf_counter() - started
+        queries = headers.get('X-Query-Count')
+        return status, content.decode('utf-8', 'replace'), int(queries) if queries else None, elapsed
+
+    def form_post(self, path, data):
+        status, body, _, _ = self.request(path)
+        token = CSRF_INPUT.search(body)
+        if not token:
+            raise RuntimeError(f'No CSRF token on {path} (status {status})')
+        return self.request(path, {**data, 'csrfmiddlewaretoken': token.group(1)})
+
+    def login(self):
+        status, _, _, _ = self.form_post('/login/', {'username': self.username, 'password': benchmarks.PASSWORD})
+        if status != 302:
+            raise RuntimeError(f'Login failed for {self.username}; run generate_bench_data first')
+
+
+class Command(BaseCommand):
+    help = ('Drive concurrent browse -> add to cart -> checkout journeys against a running server '
+            '(e.g. manage.py runserver) using the customers from generate_bench_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=10, help='Concurrent shoppers')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', help='Write the results to this file')
+        parser.add_argument('--compare', help='Results file from an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('--users must be positive')
+        shoppers = [Shopper(options['url'], benchmarks.username(n), options['timeout'])
+                    for n in range(options['users'])]
+        try:
+            for shopper in shoppers:
+                shopper.login()
+        except (OSError, RuntimeError) as exc:
+            raise CommandError(exc)
+
+        timings = defaultdict(list)
+        queries = defaultdict(list)
+        errors = defaultdict(int)
+        journeys = [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+
+        def record(step, result):
+            status, _, query_count, elapsed = result
+            with lock:
+                timings[step].append(elapsed)
+                if query_count is not None:
+                    queries[step].append(query_count)
+                if status >= 400:
+                    errors[step] += 1
+
+        def run(shopper, rng):
+            while time.perf_counter() < deadline:
+                result = shopper.request('/products/')
+                record('browse', result)
+                product_ids = ADD_LINK.findall(result[1])
+                if not product_ids:
+                    continue
+                product_id = rng.choice(product_ids)
+                record('product_detail', shopper.request(f'/product/{product_id}/'))
+                record('add_to_cart', shopper.request(f'/cart/add/{product_id}/'))
+                record('view_cart', shopper.request('/cart/'))
+                record('checkout', shopper.form_post('/checkout/', {
+                    'shipping_address': '1 Bench Road', 'phone_number': '0240000000',
+                    'payment_method': 'cash_on_delivery',
+                }))
+                with lock:
+                    journeys[0] += 1
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=run, args=(shopper, random.Random(options['seed'] + i)))
+                   for i, shopper in enumerate(shoppers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        results = {step: {**benchmarks.summarize(step_timings, elapsed=elapsed, queries=queries[step]),
+                          'errors': errors[step]}
+                   for step, step_timings in timings.items()}
+        self.stdout.write(benchmarks.format_table(results))
+        self.stdout.write(f'{journeys[0]} journeys in {elapsed:.1f}s ({journeys[0] / elapsed:.1f}/s) with '
+                          f'{options["users"]} shoppers; {sum(errors.values())} errors')
+        if not queries:
+            self.stdout.write('Query counts need the server to run with DEBUG on (X-Query-Count header).')
+        if options['compare']:
+            self.stdout.write('\n'.join(benchmarks.compare(options['compare'], results)))
+        if options['json']:
+            benchmarks.write_results(options['json'], 'load', {
+                'url': options['url'], 'users': options['users'], 'duration': options['duration'],
+                'journeys': journeys[0],
+            }, results)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from Commerce import stats
+
+
+class Command(BaseCommand):
+    help = ("Delete the dashboard's order counters for past days. Only today's is read; run this "
+            'periodically (e.g. daily from cron) so they do not pile up.')
+
+    def handle(self, *args, **options):
+        pruned = stats.prune_days()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} day counters'))
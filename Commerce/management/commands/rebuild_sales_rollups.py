@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Commerce import analytics
+
+
+class Command(BaseCommand):
+    help = ('Recompute the hourly and daily sales rollups from the order lines, e.g. after a bulk load '
+            'that did not go through checkout')
+
+    def handle(self, *args, **options):
+        counts = analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {counts['hourly']} hourly and {counts['daily']} daily rollup rows"
+        ))
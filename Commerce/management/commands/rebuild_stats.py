@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Commerce import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized dashboard statistics from orders and users'
+
+    def handle(self, *args, **options):
+        counters = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(counters)} counters: {counters[stats.ORDERS]} orders, "
+            f"GH₵ {counters[stats.REVENUE]} revenue, {counters[stats.CUSTOMERS]} customers"
+        ))
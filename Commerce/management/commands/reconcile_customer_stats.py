@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from Commerce import stats
+
+
+class Command(BaseCommand):
+    help = 'Compare CustomerStats with the orders table and optionally repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite drifted rows with the actual totals')
+
+    def handle(self, *args, **options):
+        # The scan takes no write lock; only the repair batches do
+        drift = list(stats.customer_drift())
+        for user_id, stored, actual in drift:
+            self.stdout.write(f'user {user_id}: stored {stored} != actual {actual}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Customer stats are in sync.'))
+        elif options['fix']:
+            repaired = stats.repair_customers(drift)
+            self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} customer stats rows.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} customers drifted; rerun with --fix to repair.'))
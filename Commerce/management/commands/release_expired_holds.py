@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Commerce import reservations
+
+
+class Command(BaseCommand):
+    help = ('Delete stock holds whose time has run out. Expired holds already stop counting against '
+            'available stock; run this periodically (e.g. every few minutes from cron) to keep the table small.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=reservations.SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        released = reservations.release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired holds'))
@@ -0,0 +1,55 @@
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Commerce import outbox
+
+
+class Command(BaseCommand):
+    help = ('Run queued outbox jobs: those the web processes did not get to, retries that have come '
+            'due and jobs whose worker died. Runs until interrupted unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Jobs run in parallel')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls when idle')
+        parser.add_argument('--metrics-every', type=float, default=60.0,
+                            help='Seconds between queue metrics lines; 0 turns them off')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due')
+        parser.add_argument('--metrics', action='store_true', help='Print the queue metrics and exit')
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            self.write_metrics()
+            return
+        if options['threads'] < 1 or options['interval'] <= 0:
+            raise CommandError('--threads and --interval must be positive')
+        stopping = threading.Event()
+        if not options['once'] and threading.current_thread() is threading.main_thread():
+            # Finish the jobs in hand before exiting
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: stopping.set())
+
+        succeeded = 0
+        next_metrics = time.monotonic() + options['metrics_every']
+        # With --threads 1 jobs run on this thread, no pool needed
+        pool = (ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='outbox')
+                if options['threads'] > 1 else nullcontext())
+        with pool as executor:
+            while not stopping.is_set():
+                jobs = outbox.claim(limit=options['threads'] * outbox.BATCH_SIZE)
+                succeeded += outbox.run(jobs, executor)
+                if options['metrics_every'] and time.monotonic() >= next_metrics:
+                    self.write_metrics()
+                    next_metrics = time.monotonic() + options['metrics_every']
+                if not jobs:
+                    if options['once']:
+                        break
+                    stopping.wait(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {succeeded} jobs'))
+
+    def write_metrics(self):
+        self.stdout.write(' '.join(f'{key}={value}' for key, value in outbox.metrics().items()))
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Customer listings filter auth_user on is_staff and sort by date_joined.
+# That table belongs to django.contrib.auth, so the index is added through
+# the schema editor rather than Meta.indexes. It depends on the latest auth
+# migration because SQLite rebuilds tables on ALTER and would drop it.
+USER_STAFF_INDEX = models.Index(fields=['is_staff', 'date_joined', 'id'], name='user_staff_joined_idx')
+
+
+def add_user_staff_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model(settings.AUTH_USER_MODEL), USER_STAFF_INDEX)
+
+
+def remove_user_staff_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model(settings.AUTH_USER_MODEL), USER_STAFF_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commerce', '0002_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['created_at', 'id'], name='product_instock_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['category', 'created_at', 'id'], name='product_instock_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__lt', 10)), fields=['stock'], name='product_low_stock_idx'),
+        ),
+        migrations.RunPython(add_user_staff_index, remove_user_staff_index),
+    ]
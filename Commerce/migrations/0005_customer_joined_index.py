@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+# filter(is_staff=False) compiles to "NOT is_staff", which SQLite cannot seek
+# on through a leading is_staff column. A partial index on date_joined whose
+# condition matches that predicate serves both the customer count and the
+# newest-customers listings.
+OLD_INDEX = models.Index(fields=['is_staff', 'date_joined', 'id'], name='user_staff_joined_idx')
+NEW_INDEX = models.Index(fields=['date_joined', 'id'], name='user_customer_joined_idx',
+                         condition=models.Q(is_staff=False))
+
+
+def swap_indexes(old, new):
+    def run(apps, schema_editor):
+        user_model = apps.get_model(settings.AUTH_USER_MODEL)
+        schema_editor.remove_index(user_model, old)
+        schema_editor.add_index(user_model, new)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commerce', '0004_store_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(swap_indexes(OLD_INDEX, NEW_INDEX), swap_indexes(NEW_INDEX, OLD_INDEX)),
+    ]
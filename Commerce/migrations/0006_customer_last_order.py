@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commerce', '0005_customer_joined_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerstats',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# Frozen copy of the schema Commerce.search expects; the index is kept
+# current by the Product signals, so there are no triggers.
+FTS_TABLE = 'commerce_product_fts'
+
+
+def create_search_index(apps, schema_editor):
+    """Create and fill the FTS5 table, or do nothing if this backend has no FTS5"""
+    db = schema_editor.connection
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} "
+        f"USING fts5(name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    product_table = apps.get_model('Commerce', 'Product')._meta.db_table
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, name, description) SELECT id, name, description FROM "{product_table}"'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commerce', '0006_customer_last_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
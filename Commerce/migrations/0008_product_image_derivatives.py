@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commerce', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=24),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_widths',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
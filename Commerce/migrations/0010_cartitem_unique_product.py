@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    CartItem = apps.get_model('Commerce', 'CartItem')
+    duplicates = (CartItem.objects.values('cart_id', 'product_id')
+                  .annotate(lines=Count('id'), keep=Min('id'), quantity=Sum('quantity'))
+                  .filter(lines__gt=1))
+    for row in duplicates:
+        lines = CartItem.objects.filter(cart_id=row['cart_id'], product_id=row['product_id'])
+        lines.exclude(id=row['keep']).delete()
+        lines.filter(id=row['keep']).update(quantity=row['quantity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commerce', '0009_product_sku'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cartitem_unique_product'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commerce', '0013_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('bucket', models.DateField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Commerce.category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Commerce.product')),
+            ],
+            options={
+                'verbose_name_plural': 'daily sales',
+                'abstract': False,
+                'indexes': [models.Index(condition=models.Q(('product__isnull', False)), fields=['bucket', 'product', 'orders', 'units', 'revenue'], name='dailysales_product_totals_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', True), ('product__isnull', True)), fields=('bucket',), name='dailysales_store_uniq'), models.UniqueConstraint(condition=models.Q(('category__isnull', False), ('product__isnull', True)), fields=('bucket', 'category'), name='dailysales_category_uniq'), models.UniqueConstraint(condition=models.Q(('product__isnull', False)), fields=('bucket', 'product'), name='dailysales_product_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('bucket', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Commerce.category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Commerce.product')),
+            ],
+            options={
+                'verbose_name_plural': 'hourly sales',
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', True), ('product__isnull', True)), fields=('bucket',), name='hourlysales_store_uniq'), models.UniqueConstraint(condition=models.Q(('category__isnull', False), ('product__isnull', True)), fields=('bucket', 'category'), name='hourlysales_category_uniq'), models.UniqueConstraint(condition=models.Q(('product__isnull', False)), fields=('bucket', 'product'), name='hourlysales_product_uniq')],
+            },
+        ),
+    ]
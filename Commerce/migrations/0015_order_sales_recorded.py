@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:30
+
+from django.db import migrations, models
+
+
+def mark_recorded_orders(apps, schema_editor):
+    # Once the rollups have been built, every counted order is in them
+    if apps.get_model('Commerce', 'HourlySales').objects.exists():
+        apps.get_model('Commerce', 'Order').objects.exclude(status='cancelled').update(sales_recorded=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commerce', '0014_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='sales_recorded',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_recorded_orders, migrations.RunPython.noop),
+    ]
@@ -1,39 +1,81 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    # Also touched when a product leaves the category (Commerce.signals)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
 
 class Product(models.Model):
+    # Supplier stock keeping unit; the key bulk imports upsert on
+    sku = models.CharField(max_length=64, unique=True, blank=True, null=True)
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Set by Commerce.images once the derivatives exist
+    image_hash = models.CharField(max_length=24, blank=True, editable=False)
+    image_widths = models.JSONField(default=list, blank=True, editable=False)
     calories = models.IntegerField(blank=True, null=True)
     stock = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Queryset updates (checkout, images) set this explicitly
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order for listings
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            # Storefront listings only ever show in-stock products
+            models.Index(fields=['created_at', 'id'], name='product_instock_created_idx',
+                         condition=models.Q(stock__gt=0)),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_instock_cat_idx',
+                         condition=models.Q(stock__gt=0)),
+            # Low stock alerts on the dashboard and product admin
+            models.Index(fields=['stock'], name='product_low_stock_idx', condition=models.Q(stock__lt=10)),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def image_srcset(self):
+        """{'webp': ..., 'jpg': ..., 'src': ...} for a <picture>, or None before derivation"""
+        if not (self.image and self.image_hash and self.image_widths):
+            return None
+        from . import images
+        fallback = max([width for width in self.image_widths if width <= 640] or self.image_widths[:1])
+        return {
+            'webp': images.srcset(self.image_hash, self.image_widths, 'webp'),
+            'jpg': images.srcset(self.image_hash, self.image_widths, 'jpg'),
+            'src': images.derived_url(self.image_hash, fallback, 'jpg'),
+        }
+
 
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @cached_property
+    def summary(self):
+        from .cart import CartSummary
+        return CartSummary(self.items.all())
+
     def get_total_price(self):
-        return sum(item.get_total_price() for item in self.items.all())
+        return self.summary.total_price
 
     def get_total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.summary.total_items
 
 
 class CartItem(models.Model):
@@ -41,7 +83,15 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
 
+    class Meta:
+        constraints = [
+            # One line per product; guest carts merge into it with an upsert
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartitem_unique_product'),
+        ]
+
     def get_total_price(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.product.price * self.quantity
 
 
@@ -60,6 +110,16 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     shipping_address = models.TextField()
     payment_method = models.CharField(max_length=50)
+    # Whether the order's lines are counted in the sales rollups (Commerce.analytics)
+    sales_recorded = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+            # Per-customer order history, newest first
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ]
 
 def __str__(self):
     return f"Order #{self.id} by {self.user.username}"
@@ -72,3 +132,134 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def get_total_price(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
+        return self.price * self.quantity
+
+
+class StoreStat(models.Model):
+    """A running store-wide counter kept up to date by Commerce.stats"""
+    key = models.CharField(max_length=50, unique=True)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class CustomerStats(models.Model):
+    """Lifetime order totals for one customer, kept up to date by Commerce.stats"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_orders = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total_spent'], name='customer_top_spend_idx'),
+        ]
+
+    def __str__(self):
+        return f"Stats for {self.user}"
+
+
+class StockHold(models.Model):
+    """Units of a product set aside for a customer in checkout, managed by Commerce.reservations"""
+    # Both foreign keys lead an index below, so neither needs its own
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds', db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_holds', db_index=False)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Re-entering checkout refreshes the customer's holds with an upsert
+            models.UniqueConstraint(fields=['user', 'product'], name='stockhold_unique_user_product'),
+        ]
+        indexes = [
+            # The sweeper deletes in expiry order
+            models.Index(fields=['expires_at'], name='stockhold_expiry_idx'),
+            # Covers the available-to-sell sum of unexpired holds per product
+            models.Index(fields=['product', 'expires_at', 'quantity'], name='stockhold_product_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.user_id} until {self.expires_at}"
+
+
+class OutboxJob(models.Model):
+    """Background work queued by Commerce.outbox in the same transaction as the data it is about"""
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When the job is next due; pushed back after each failed attempt
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # A worker's claim on the job; another worker may take it once the lease has passed
+    locked_until = models.DateTimeField(blank=True, null=True)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    # Set when the last attempt fails; the job is then kept only for inspection
+    failed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for pending jobs in due order
+            models.Index(fields=['run_after'], name='outbox_pending_idx', condition=models.Q(failed_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk}"
+
+
+class SalesRollup(models.Model):
+    """Sales in one time bucket, kept up to date by Commerce.analytics.
+
+    Each bucket has a store row (no category or product), one row per
+    category sold and one row per product sold. ``orders`` counts distinct
+    orders at every level; cancelled orders are not included.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, blank=True, null=True, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, blank=True, null=True, related_name='+')
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+        # One row per level in each bucket. Range queries filter on the level
+        # and a range of buckets, which these partial indexes answer.
+        constraints = [
+            models.UniqueConstraint(fields=['bucket'], name='%(class)s_store_uniq',
+                                    condition=models.Q(category__isnull=True, product__isnull=True)),
+            models.UniqueConstraint(fields=['bucket', 'category'], name='%(class)s_category_uniq',
+                                    condition=models.Q(category__isnull=False, product__isnull=True)),
+            models.UniqueConstraint(fields=['bucket', 'product'], name='%(class)s_product_uniq',
+                                    condition=models.Q(product__isnull=False)),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket} {self.product_id or self.category_id or 'store'}: {self.orders} orders"
+
+
+class HourlySales(SalesRollup):
+    # Start of the hour in the current time zone
+    bucket = models.DateTimeField()
+
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'hourly sales'
+
+
+class DailySales(SalesRollup):
+    # Calendar day in the current time zone
+    bucket = models.DateField()
+
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'daily sales'
+        indexes = [
+            # Top products over a range group many product rows; this lets
+            # SQLite sum them without reading the table
+            models.Index(fields=['bucket', 'product', 'orders', 'units', 'revenue'],
+                         name='dailysales_product_totals_idx', condition=models.Q(product__isnull=False)),
+        ]
@@ -0,0 +1,54 @@
+"""Order list summaries computed in SQL.
+
+Order listings show each order's item count and a short preview of its
+items. with_summaries() annotates the counts and totals onto the orders
+query and prefetches the items, so a page of orders renders with a fixed
+number of queries however many orders or items it holds.
+"""
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import OrderItem
+
+
+PREVIEW_ITEMS = 2
+
+ITEM_LINE_TOTAL = ExpressionWrapper(
+    F('quantity') * F('price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def order_items():
+    return OrderItem.objects.select_related('product').annotate(line_total=ITEM_LINE_TOTAL).order_by('id')
+
+
+def with_summaries(orders, preview=None):
+    """Annotate item_count, item_quantity and items_total and prefetch the items.
+
+    With ``preview`` only the first ``preview`` items of each order are
+    loaded, into ``preview_items``; otherwise all of them are prefetched
+    into ``order.items.all()``.
+    """
+    # Correlated subqueries rather than a join and GROUP BY, so the orders
+    # are still read in index order and only the page's rows are summed
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    total = lambda expression, output_field=None: Subquery(
+        items.annotate(total=expression).values('total'), output_field=output_field)
+    orders = orders.annotate(
+        item_count=Coalesce(total(Count('id')), Value(0)),
+        item_quantity=total(Sum('quantity')),
+        items_total=total(Sum(ITEM_LINE_TOTAL), ITEM_LINE_TOTAL.output_field),
+    )
+    if preview:
+        return orders.prefetch_related(Prefetch('items', queryset=order_items()[:preview], to_attr='preview_items'))
+    return orders.prefetch_related(Prefetch('items', queryset=order_items()))
+
+
+def summarize(orders, preview=PREVIEW_ITEMS):
+    """Set preview_items and remaining_items on orders loaded by with_summaries()"""
+    for order in orders:
+        if not hasattr(order, 'preview_items'):
+            order.preview_items = order.items.all()[:preview]
+        order.remaining_items = order.item_count - len(order.preview_items)
+    return orders
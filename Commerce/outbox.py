@@ -0,0 +1,221 @@
+"""Durable background jobs for work that can wait until after a request.
+
+enqueue() writes an OutboxJob row inside the caller's transaction, so a job
+exists exactly when the order (or whatever else) it is about was committed.
+Once that transaction commits, a small thread pool in the same process
+(settings.OUTBOX_WORKERS threads) runs the job straight away. The
+run_outbox_worker command polls the table for the rest: jobs whose process
+stopped before running them, whose worker died mid-run (their lease
+expires) and retries that have come due. A failed job is retried with
+exponential backoff up to MAX_ATTEMPTS times and then kept, with its last
+error, for inspection. The database is the only queue; no broker is needed.
+
+Jobs run at least once. A handler's database writes commit together with
+the job's deletion, and are rolled back if its lease was lost meanwhile,
+so they are applied once; anything else a handler does (sending mail, say)
+must be safe to repeat.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import OutboxJob
+from .profiling import percentile
+
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+# Retries wait RETRY_DELAY, then twice that, four times...
+RETRY_DELAY = timedelta(seconds=10)
+# How long a claimed job may run before another worker can take it over
+LEASE = timedelta(minutes=5)
+BATCH_SIZE = 20
+
+_tasks = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_counters = Counter()
+# (seconds waited after becoming due, seconds running) for recent jobs
+_timings = deque(maxlen=1000)
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker claimed it"""
+
+
+def task(function):
+    """Register ``function`` as a job handler under its name"""
+    _tasks[function.__name__] = function
+    return function
+
+
+def enqueue(name, **payload):
+    """Queue a call to the task ``name`` with JSON-serializable keyword arguments.
+
+    The job commits or rolls back with the surrounding transaction.
+    """
+    if name not in _tasks:
+        raise LookupError(f'No outbox task named {name!r}')
+    job = OutboxJob.objects.create(task=name, payload=payload)
+    transaction.on_commit(lambda: dispatch([job.pk]), robust=True)
+    return job
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.OUTBOX_WORKERS, thread_name_prefix='outbox')
+        return _executor
+
+
+def dispatch(job_ids):
+    """Run freshly committed jobs on this process's worker threads, if it has any"""
+    # Commit hooks only run inside a transaction under TestCase, whose
+    # uncommitted rows another thread's connection could not see.
+    if settings.OUTBOX_WORKERS > 0 and not connection.in_atomic_block:
+        _pool().submit(_run_in_thread, job_ids)
+
+
+def _run_in_thread(job_ids):
+    try:
+        run(claim(job_ids))
+    except Exception:
+        # The jobs stay in the table for run_outbox_worker
+        logger.exception('Outbox dispatch of jobs %s failed', job_ids)
+    finally:
+        connection.close()
+
+
+def _pending(now):
+    return OutboxJob.objects.filter(failed_at=None, run_after__lte=now).filter(
+        Q(locked_until=None) | Q(locked_until__lte=now))
+
+
+def claim(job_ids=None, limit=BATCH_SIZE):
+    """Take a lease on the given jobs, or on up to ``limit`` due ones; returns those claimed.
+
+    Claiming is one conditional UPDATE, so two workers never run the same
+    job while its lease lasts.
+    """
+    now = timezone.now()
+    if job_ids is None:
+        job_ids = list(_pending(now).order_by('run_after').values_list('id', flat=True)[:limit])
+    if not job_ids:
+        return []
+    token = uuid.uuid4().hex
+    _pending(now).filter(id__in=job_ids).update(locked_until=now + LEASE, claimed_by=token)
+    return list(OutboxJob.objects.filter(id__in=job_ids, claimed_by=token).order_by('run_after'))
+
+
+def run(jobs, executor=None):
+    """Run claimed jobs, on ``executor`` if given; returns how many succeeded"""
+    if executor is None:
+        return sum(map(run_job, jobs))
+    return sum(executor.map(_run_job_in_thread, jobs))
+
+
+def _run_job_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+
+def run_job(job):
+    """Run one claimed job, then delete it, or schedule its retry; True on success.
+
+    The handler's own queries and the job's deletion commit together; if
+    the job is no longer ours to delete, both roll back.
+    """
+    started = timezone.now()
+    clock = time.perf_counter()
+    try:
+        with transaction.atomic():
+            handler = _tasks.get(job.task)
+            if handler is None:
+                raise LookupError(f'No outbox task named {job.task!r}')
+            handler(**job.payload)
+            deleted, _ = OutboxJob.objects.filter(pk=job.pk, claimed_by=job.claimed_by).delete()
+            if not deleted:
+                raise LeaseLost(f'Outbox job {job.pk} was claimed by another worker')
+    except LeaseLost:
+        # Its new owner runs it and records the outcome
+        logger.warning('Outbox job %s (%s) outlived its lease; its changes were rolled back', job.pk, job.task)
+        return False
+    except Exception as exc:
+        attempts = job.attempts + 1
+        updates = {'attempts': attempts, 'last_error': f'{type(exc).__name__}: {exc}',
+                   'locked_until': None, 'claimed_by': ''}
+        if attempts >= MAX_ATTEMPTS:
+            updates['failed_at'] = timezone.now()
+        else:
+            updates['run_after'] = timezone.now() + RETRY_DELAY * 2 ** (attempts - 1)
+        OutboxJob.objects.filter(pk=job.pk, claimed_by=job.claimed_by).update(**updates)
+        logger.warning('Outbox job %s (%s) failed on attempt %d: %s', job.pk, job.task, attempts, exc,
+                       exc_info=attempts >= MAX_ATTEMPTS)
+        _record('failed' if attempts >= MAX_ATTEMPTS else 'retried')
+        return False
+    _record('succeeded', (started - job.run_after).total_seconds(), time.perf_counter() - clock)
+    return True
+
+
+def _record(outcome, waited=None, ran=None):
+    with _metrics_lock:
+        _counters[outcome] += 1
+        if waited is not None:
+            _timings.append((max(waited, 0.0), ran))
+
+
+def metrics():
+    """Queue depth from the outbox table and job latency seen by this process.
+
+    ``pending`` jobs are due now, ``scheduled`` ones are waiting for a
+    retry, ``running`` ones hold a lease and ``dead`` ones ran out of
+    attempts. Latencies are percentiles over recent successful jobs.
+    """
+    now = timezone.now()
+    leased = Q(locked_until__gt=now)
+    depth = OutboxJob.objects.aggregate(
+        pending=Count('id', filter=Q(failed_at=None, run_after__lte=now) & ~leased),
+        scheduled=Count('id', filter=Q(failed_at=None, run_after__gt=now) & ~leased),
+        running=Count('id', filter=Q(failed_at=None) & leased),
+        dead=Count('id', filter=~Q(failed_at=None)),
+        oldest_due=Min('run_after', filter=Q(failed_at=None, run_after__lte=now)),
+    )
+    oldest = depth.pop('oldest_due')
+    with _metrics_lock:
+        counters = dict(_counters)
+        timings = list(_timings)
+    waits = sorted(waited for waited, _ in timings)
+    runs = sorted(ran for _, ran in timings)
+    return {
+        **depth,
+        'oldest_due_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        'succeeded': counters.get('succeeded', 0),
+        'retried': counters.get('retried', 0),
+        'failed': counters.get('failed', 0),
+        'wait_p50_ms': round(percentile(waits, 0.50) * 1000, 1),
+        'wait_p95_ms': round(percentile(waits, 0.95) * 1000, 1),
+        'run_p50_ms': round(percentile(runs, 0.50) * 1000, 1),
+        'run_p95_ms': round(percentile(runs, 0.95) * 1000, 1),
+    }
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,132 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import QueryDict
+
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (datetime, pk) for a cursor, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, query, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._query = query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def _url(self, key, cursor):
+        query = self._query.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[key] = cursor
+        return '?' + query.urlencode()
+
+    @property
+    def next_url(self):
+        return self._url('after', self.next_cursor) if self.next_cursor else None
+
+    @property
+    def previous_url(self):
+        return self._url('before', self.previous_cursor) if self.previous_cursor else None
+
+
+class KeysetPaginator:
+    """Cursor pagination over a (timestamp, id) ordering, newest first.
+
+    Unlike offset pagination the cost of a page does not depend on how deep
+    it is: each page is a range scan on the (field, id) index starting at the
+    cursor. Cursors are opaque strings passed as ?after= / ?before=.
+    """
+
+    def __init__(self, queryset, field='created_at', page_size=DEFAULT_PAGE_SIZE, max_page_size=MAX_PAGE_SIZE):
+        self.queryset = queryset
+        self.field = field
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+
+    def _cursor(self, obj):
+        return encode_cursor(getattr(obj, self.field), obj.pk)
+
+    def clamp_page_size(self, requested):
+        try:
+            size = int(requested)
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _query(self, after, before, page_size):
+        """The rows query for a page and how to turn its rows into one"""
+        size = self.clamp_page_size(page_size)
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before and not after else None
+        field = self.field
+
+        if before:
+            value, pk = before
+            queryset = (self.queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+                        .order_by(field, 'pk'))
+        else:
+            queryset = self.queryset
+            if after:
+                value, pk = after
+                queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+            queryset = queryset.order_by(f'-{field}', '-pk')
+        return queryset[:size + 1], (size, after, before)
+
+    def _page(self, rows, state, query):
+        size, after, before = state
+        has_more = len(rows) > size
+        if before:
+            rows = rows[:size][::-1]
+            previous_cursor = self._cursor(rows[0]) if has_more else None
+            next_cursor = self._cursor(rows[-1]) if rows else None
+        else:
+            rows = rows[:size]
+            next_cursor = self._cursor(rows[-1]) if has_more else None
+            previous_cursor = self._cursor(rows[0]) if after and rows else None
+        return KeysetPage(rows, query if query is not None else QueryDict(), next_cursor, previous_cursor)
+
+    def page(self, after=None, before=None, page_size=None, query=None):
+        queryset, state = self._query(after, before, page_size)
+        return self._page(list(queryset), state, query)
+
+    async def apage(self, after=None, before=None, page_size=None, query=None):
+        queryset, state = self._query(after, before, page_size)
+        return self._page([row async for row in queryset], state, query)
+
+    def page_from_request(self, request):
+        return self.page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=request.GET.get('page_size'),
+            query=request.GET,
+        )
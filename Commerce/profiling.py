@@ -0,0 +1,213 @@
+"""Per-request query budgets and timings.
+
+QueryBudgetMiddleware records, for every request, the number of queries,
+how many of them repeat an SQL statement already run by that request (the
+N+1 signature), time spent in the database and in template rendering, and
+the total latency. Totals are kept per URL name in this process and served
+to staff as JSON by the admin_performance view.
+
+Views declare the most queries they should need with @query_budget(n). A
+request over budget is logged, and the test suite fails if any view in
+Commerce.urls exceeds its budget or lacks one.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_profile', default=None)
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def query_budget(queries):
+    """Declare the most queries a view may run; apply it outermost"""
+    def decorator(view_func):
+        view_func.query_budget = queries
+        return view_func
+    return decorator
+
+
+class RequestProfile:
+    def __init__(self):
+        self.statements = Counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+
+    @property
+    def query_count(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.statements[sql] += 1
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.record_query(execute, sql, params, many, context)
+
+
+def install(connection):
+    """Count this connection's queries against whichever request runs them.
+
+    Async views run their queries on a worker thread's connection, so rather
+    than wrapping one connection per request, every connection carries this
+    wrapper and the request is found through a context variable, which
+    sync_to_async and asyncio tasks carry along.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ProfilingTemplates(DjangoTemplates):
+    """The Django template backend, timing top-level renders for the current request"""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name))
+
+
+class ProfiledTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - started
+
+
+class QueryBudgetMiddleware:
+    """Profile each request; install it first so it sees every other middleware's queries"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, token, started = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(profile, token, started)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile, token, started = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(profile, token, started)
+        return self.finish(request, response, profile)
+
+    def start(self, request):
+        profile = request.query_profile = RequestProfile()
+        return profile, _current.set(profile), time.perf_counter()
+
+    def stop(self, profile, token, started):
+        profile.total_time = time.perf_counter() - started
+        _current.reset(token)
+
+    def finish(self, request, response, profile):
+        match = request.resolver_match
+        if match is not None:
+            budget = getattr(match.func, 'query_budget', None)
+            record(match.view_name, profile, budget)
+            if budget is not None and profile.query_count > budget:
+                logger.warning('%s ran %d queries (budget %d, %d duplicates)', match.view_name,
+                               profile.query_count, budget, profile.duplicate_count)
+        if settings.DEBUG:
+            response['Server-Timing'] = (f'db;dur={profile.db_time * 1000:.1f}, '
+                                         f'tpl;dur={profile.template_time * 1000:.1f}, '
+                                         f'total;dur={profile.total_time * 1000:.1f}')
+            response['X-Query-Count'] = str(profile.query_count)
+        return response
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list; 0.0 when it is empty"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def record(view_name, profile, budget):
+    queries = profile.query_count
+    with _totals_lock:
+        totals = _totals.setdefault(view_name, Counter())
+        totals['requests'] += 1
+        totals['queries'] += queries
+        totals['duplicates'] += profile.duplicate_count
+        totals['db_time'] += profile.db_time
+        totals['template_time'] += profile.template_time
+        totals['total_time'] += profile.total_time
+        totals['max_queries'] = max(totals['max_queries'], queries)
+        totals['max_time'] = max(totals['max_time'], profile.total_time)
+        totals['over_budget'] += budget is not None and queries > budget
+        totals['budget'] = budget
+
+
+def report():
+    """Per-view averages since the process started, worst query count first"""
+    with _totals_lock:
+        snapshot = {name: dict(totals) for name, totals in _totals.items()}
+    views = []
+    for name, totals in snapshot.items():
+        requests = totals['requests']
+        views.append({
+            'view': name,
+            'requests': requests,
+            'budget': totals['budget'],
+            'over_budget': totals['over_budget'],
+            'avg_queries': round(totals['queries'] / requests, 1),
+            'max_queries': totals['max_queries'],
+            'avg_duplicates': round(totals['duplicates'] / requests, 1),
+            'avg_db_ms': round(totals['db_time'] * 1000 / requests, 2),
+            'avg_template_ms': round(totals['template_time'] * 1000 / requests, 2),
+            'avg_total_ms': round(totals['total_time'] * 1000 / requests, 2),
+            'max_total_ms': round(totals['max_time'] * 1000, 2),
+        })
+    views.sort(key=lambda row: (-row['max_queries'], row['view']))
+    return views
+
+
+def reset():
+    with _totals_lock:
+        _totals.clear()
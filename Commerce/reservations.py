@@ -0,0 +1,91 @@
+"""Time-limited holds on product stock for customers in checkout.
+
+Opening the checkout page places a StockHold per cart line that lasts
+HOLD_TTL, so two customers cannot both be promised the last unit. Holds
+only count while unexpired: available-to-sell is stock less the unexpired
+holds, one query that the (product, expires_at, quantity) index covers.
+place_order turns the customer's own holds into the stock decrement in the
+same transaction, and the release_expired_holds command deletes lapsed
+holds in batches so the table stays small.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockHold
+
+
+HOLD_TTL = timedelta(minutes=15)
+SWEEP_BATCH_SIZE = 1000
+
+
+def _unexpired(now=None, exclude_user=None):
+    holds = StockHold.objects.filter(expires_at__gt=now or timezone.now())
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    return holds
+
+
+def available_to_sell(product_ids, exclude_user=None, now=None):
+    """{product id: stock less unexpired holds}, not counting ``exclude_user``'s own holds"""
+    held = (_unexpired(now, exclude_user).filter(product=OuterRef('pk'))
+            .values('product').annotate(total=Sum('quantity')).values('total'))
+    return dict(Product.objects.filter(id__in=product_ids)
+                .annotate(available=F('stock') - Coalesce(Subquery(held), Value(0)))
+                .values_list('id', 'available'))
+
+
+def held_by_others(user, product_ids, now=None):
+    """{product id: units other customers hold}, for products with any"""
+    return dict(_unexpired(now, exclude_user=user).filter(product_id__in=product_ids)
+                .values('product').annotate(total=Sum('quantity')).values_list('product', 'total'))
+
+
+def lock_products(product_ids):
+    """Lock the product rows in id order on backends that support it"""
+    if connection.features.has_select_for_update:
+        list(Product.objects.select_for_update().filter(id__in=product_ids)
+             .order_by('id').values_list('id', flat=True))
+
+
+def reserve(user, quantities, now=None):
+    """Hold ``quantities`` ({product id: units}) for ``user`` until HOLD_TTL from now.
+
+    Replaces the user's earlier holds. Returns the ids of the products
+    without enough available stock, in which case nothing is held.
+    """
+    now = now or timezone.now()
+    product_ids = sorted(quantities)
+    with transaction.atomic():
+        lock_products(product_ids)
+        available = available_to_sell(product_ids, exclude_user=user, now=now)
+        short = [pk for pk in product_ids if available.get(pk, 0) < quantities[pk]]
+        if short:
+            return short
+        StockHold.objects.filter(user=user).exclude(product_id__in=product_ids).delete()
+        StockHold.objects.bulk_create(
+            [StockHold(user=user, product_id=pk, quantity=quantities[pk], expires_at=now + HOLD_TTL)
+             for pk in product_ids],
+            update_conflicts=True, unique_fields=['user', 'product'], update_fields=['quantity', 'expires_at'],
+        )
+    return []
+
+
+def release(user):
+    """Drop all of ``user``'s holds; place_order calls this inside its transaction"""
+    StockHold.objects.filter(user=user).delete()
+
+
+def release_expired(now=None, batch_size=SWEEP_BATCH_SIZE):
+    """Delete lapsed holds in batches of ``batch_size``; returns how many were deleted"""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        batch = list(StockHold.objects.filter(expires_at__lte=now).order_by('expires_at')
+                     .values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return released
+        released += StockHold.objects.filter(id__in=batch).delete()[0]
@@ -0,0 +1,132 @@
+"""Product search.
+
+On SQLite with FTS5 available, product names and descriptions are indexed
+in a separate full-text table keyed by product id and ranked with bm25.
+Other backends fall back to icontains matching ranked by where the terms
+occur. The index is kept current by the Product signals in Commerce.signals.
+"""
+import re
+import time
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+FTS_TABLE = 'commerce_product_fts'
+# Name matches count ten times as much as description matches
+NAME_WEIGHT, DESCRIPTION_WEIGHT = 10.0, 1.0
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Whether the FTS table (created by migration 0007) exists, per database
+# name; a miss is stored as the time to look again, in case migrate has
+# since run in another process
+_fts_available = {}
+PROBE_INTERVAL = 60
+
+
+def uses_fts():
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    available = _fts_available.get(name)
+    if available is True:
+        return True
+    if available is None or time.monotonic() >= available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            found = cursor.fetchone() is not None
+        _fts_available[name] = True if found else time.monotonic() + PROBE_INTERVAL
+        return found
+    return False
+
+
+def match_expression(query):
+    """FTS5 MATCH expression requiring every term, each as a prefix"""
+    return ' '.join(f'"{token}"*' for token in _TOKEN.findall(query))
+
+
+def index_products(products):
+    """Add or refresh the index rows for the given products"""
+    if not uses_fts():
+        return
+    rows = [(product.pk, product.name, product.description) for product in products]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', rows)
+
+
+def remove_products(product_ids):
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+
+def rebuild_index():
+    """Reindex the whole catalog with one INSERT ... SELECT"""
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+            f'SELECT id, name, description FROM "{Product._meta.db_table}"'
+        )
+
+
+def filter_products(queryset, query):
+    """Restrict a Product queryset to search matches without changing its ordering"""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if uses_fts():
+        return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                                             [expression]))
+    return queryset.filter(_fallback_filter(query))
+
+
+def search(query, limit=48, queryset=None):
+    """Return up to ``limit`` products matching ``query``, best match first"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    expression = match_expression(query)
+    if not expression:
+        return []
+    if not uses_fts():
+        return list(_fallback_ranked(queryset, query)[:limit])
+
+    with connection.cursor() as cursor:
+        # Over-fetch so products removed by the caller's queryset filter
+        # (e.g. out of stock) do not leave the page short.
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s) LIMIT %s',
+            [expression, NAME_WEIGHT, DESCRIPTION_WEIGHT, limit * 2],
+        )
+        ranked_ids = [row[0] for row in cursor.fetchall()]
+    products = queryset.select_related('category').in_bulk(ranked_ids)
+    return [products[pk] for pk in ranked_ids if pk in products][:limit]
+
+
+def _fallback_filter(query):
+    condition = Q()
+    for token in _TOKEN.findall(query):
+        condition &= Q(name__icontains=token) | Q(description__icontains=token)
+    return condition
+
+
+def _fallback_ranked(queryset, query):
+    first = _TOKEN.findall(query)[0]
+    rank = Case(
+        When(name__istartswith=first, then=Value(2)),
+        When(name__icontains=first, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return (queryset.filter(_fallback_filter(query)).select_related('category')
+            .annotate(search_rank=rank).order_by('-search_rank', 'name'))
@@ -0,0 +1,124 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analytics, cart, catalog_cache, outbox, profiling, search, stats
+from .models import Category, Order, Product, User
+
+
+# post_init keeps a snapshot of the fields the counters depend on, so saves
+# can apply a delta without re-reading the row. __dict__ is used so deferred
+# fields are not loaded just to take the snapshot.
+
+@receiver(post_init, sender=Order)
+def snapshot_order(sender, instance, **kwargs):
+    instance._stats_snapshot = (instance.__dict__.get('status'), instance.__dict__.get('total_amount'))
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and not {'status', 'total_amount'} & set(update_fields):
+        return
+    if created:
+        stats.order_created(instance)
+    else:
+        stats.order_changed(instance, *instance._stats_snapshot)
+        analytics.order_changed(instance, instance._stats_snapshot[0])
+    snapshot_order(sender, instance)
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleting(sender, instance, **kwargs):
+    # Before the cascade removes the lines the rollup delta is made from
+    analytics.order_deleted(instance)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    stats.order_deleted(instance)
+
+
+@receiver(post_init, sender=User)
+def snapshot_user(sender, instance, **kwargs):
+    instance._stats_is_staff = instance.__dict__.get('is_staff')
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, **kwargs):
+    # is_staff was deferred when the user was loaded but is set now, so
+    # read what it was before the save overwrites it
+    if instance._stats_is_staff is None and not instance._state.adding and 'is_staff' in instance.__dict__:
+        instance._stats_is_staff = User.objects.filter(pk=instance.pk).values_list('is_staff', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and 'is_staff' not in update_fields:
+        return
+    was_customer = not created and instance._stats_is_staff is False
+    stats.increment(stats.CUSTOMERS, int(not instance.is_staff) - int(was_customer))
+    snapshot_user(sender, instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    if not instance.is_staff:
+        stats.increment(stats.CUSTOMERS, -1)
+
+
+def touch_categories(category_ids):
+    """A product leaving a category changes its listing, so advance its updated_at"""
+    Category.objects.filter(pk__in=category_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_init, sender=Product)
+def snapshot_product(sender, instance, **kwargs):
+    instance._cache_category_id = instance.__dict__.get('category_id')
+    instance._image_name = getattr(instance.__dict__.get('image'), 'name', instance.__dict__.get('image'))
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, update_fields=None, **kwargs):
+    old_category_id = instance._cache_category_id
+    if instance.image and instance.image.name != instance._image_name:
+        # Derived once the save commits
+        outbox.enqueue('derive_product_image', image=instance.image.name)
+    moved = created or old_category_id != instance.category_id
+    if old_category_id and old_category_id != instance.category_id:
+        touch_categories([old_category_id])
+    transaction.on_commit(lambda: catalog_cache.invalidate_products(
+        [(instance.pk, instance.category_id), (instance.pk, old_category_id)], membership_changed=moved
+    ))
+    snapshot_product(sender, instance)
+    if update_fields and not {'name', 'description'} & set(update_fields):
+        return
+    search.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+    touch_categories([instance.category_id])
+    transaction.on_commit(lambda: catalog_cache.invalidate_products(
+        [(instance.pk, instance.category_id)], membership_changed=True, deleted=True
+    ))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: catalog_cache.invalidate_category(instance.pk))
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    profiling.install(connection)
+
+
+@receiver(user_logged_in)
+def guest_cart_login(sender, request, user, **kwargs):
+    if request is not None:
+        cart.merge_guest_cart(request, user)
@@ -0,0 +1,197 @@
+"""Materialized store statistics for the admin dashboard.
+
+Signal handlers in Commerce.signals apply incremental deltas as orders and
+customers change; rebuild() recomputes everything from the source tables,
+e.g. after a bulk QuerySet.update() that bypassed the signals. Revenue and
+customer spend only count orders that are not cancelled.
+"""
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Subquery, Sum
+from django.utils import timezone
+
+from .models import CustomerStats, Order, StoreStat, User
+from .upserts import increments, upsert
+
+
+ORDERS = 'orders'
+REVENUE = 'revenue'
+CUSTOMERS = 'customers'
+
+COUNTED = ~Q(status='cancelled')
+
+
+DAY_PREFIX = 'orders:'
+
+
+def day_key(day):
+    """Key of the counter for orders made on ``day``; only today's is kept (see prune_days())"""
+    return f'{DAY_PREFIX}{day.isoformat()}'
+
+
+def counted_amount(status, total_amount):
+    """What an order contributes to revenue and customer spend"""
+    if status == 'cancelled' or total_amount is None:
+        return Decimal('0.00')
+    return total_amount
+
+
+CUSTOMER_CHUNK_SIZE = 5000
+REPAIR_BATCH_SIZE = 1000
+
+
+def increment_many(deltas):
+    """Add each delta in {key: delta} to its StoreStat counter"""
+    upsert(StoreStat, [{'key': key, 'value': delta} for key, delta in deltas.items() if delta],
+           ['key'], increments('value'))
+
+
+def increment(key, delta):
+    increment_many({key: delta})
+
+
+def increment_customer(user_id, orders=0, spent=Decimal('0.00'), ordered_at=None):
+    if not (orders or spent or ordered_at):
+        return
+    greatest = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+    upsert(CustomerStats, [{'user': user_id, 'total_orders': orders, 'total_spent': spent,
+                            'last_order_at': ordered_at}], ['user'], {
+        **increments('total_orders', 'total_spent'),
+        'last_order_at': greatest + '(COALESCE({old}."last_order_at", {new}."last_order_at"), '
+                                    'COALESCE({new}."last_order_at", {old}."last_order_at"))',
+    })
+
+
+def order_created(order):
+    amount = counted_amount(order.status, order.total_amount)
+    increment_many({ORDERS: 1, REVENUE: amount, day_key(timezone.localdate(order.created_at)): 1})
+    increment_customer(order.user_id, orders=1, spent=amount, ordered_at=order.created_at)
+
+
+def order_changed(order, old_status, old_total):
+    delta = counted_amount(order.status, order.total_amount) - counted_amount(old_status, old_total)
+    increment(REVENUE, delta)
+    increment_customer(order.user_id, spent=delta)
+
+
+def order_deleted(order):
+    amount = counted_amount(order.status, order.total_amount)
+    deltas = {ORDERS: -1, REVENUE: -amount}
+    day = timezone.localdate(order.created_at)
+    if day == timezone.localdate():
+        # Earlier days' counters are pruned; don't bring one back
+        deltas[day_key(day)] = -1
+    increment_many(deltas)
+    # No upsert here: when a customer is deleted their stats row may
+    # already be gone by the time the cascade reaches their orders. The row
+    # has been deleted, so the subquery finds the next most recent order.
+    latest = Order.objects.filter(user_id=order.user_id).order_by('-created_at').values('created_at')[:1]
+    CustomerStats.objects.filter(user_id=order.user_id).update(
+        total_orders=F('total_orders') - 1,
+        total_spent=F('total_spent') - amount,
+        last_order_at=Subquery(latest),
+    )
+
+
+def customer_totals(orders):
+    """Actual (orders, spent, last order) per user_id for an Order queryset"""
+    rows = (orders.values('user_id')
+            .annotate(orders=Count('id'), spent=Sum('total_amount', filter=COUNTED), last=Max('created_at'))
+            .order_by())
+    return {row['user_id']: (row['orders'], row['spent'] or Decimal('0.00'), row['last']) for row in rows}
+
+
+def customer_drift():
+    """Yield (user_id, stored, actual) for each customer whose stats disagree with their orders.
+
+    Works through users in id windows so memory stays bounded on large
+    tables. ``stored`` is None when the customer has no stats row.
+    """
+    no_orders = (0, Decimal('0.00'), None)
+    bounds = User.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return
+    for start in range(bounds['low'], bounds['high'] + 1, CUSTOMER_CHUNK_SIZE):
+        window = {'user_id__gte': start, 'user_id__lt': start + CUSTOMER_CHUNK_SIZE}
+        actual = customer_totals(Order.objects.filter(**window))
+        stored = {row.user_id: (row.total_orders, row.total_spent, row.last_order_at)
+                  for row in CustomerStats.objects.filter(**window)}
+        for user_id in sorted(actual.keys() | stored.keys()):
+            expected = actual.get(user_id, no_orders)
+            if stored.get(user_id, no_orders) != expected:
+                yield user_id, stored.get(user_id), expected
+
+
+def repair_customers(drift, batch_size=REPAIR_BATCH_SIZE):
+    """Overwrite the stats rows listed by customer_drift() with the actual values.
+
+    Each batch is its own short transaction, and its totals are read again
+    inside it, so an order placed since the scan is not overwritten.
+    """
+    user_ids = [user_id for user_id, _, _ in drift]
+    no_orders = (0, Decimal('0.00'), None)
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        with transaction.atomic():
+            actual = customer_totals(Order.objects.filter(user_id__in=batch))
+            rows = []
+            # Skipping customers deleted since the scan
+            for user_id in User.objects.filter(id__in=batch).values_list('id', flat=True):
+                orders, spent, last = actual.get(user_id, no_orders)
+                rows.append(CustomerStats(user_id=user_id, total_orders=orders, total_spent=spent,
+                                          last_order_at=last))
+            CustomerStats.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['user'],
+                update_fields=['total_orders', 'total_spent', 'last_order_at'],
+            )
+    return len(user_ids)
+
+
+def dashboard_counters():
+    """Totals for the dashboard from a single query on StoreStat"""
+    today = day_key(timezone.localdate())
+    values = dict(StoreStat.objects.filter(key__in=[ORDERS, REVENUE, CUSTOMERS, today])
+                  .values_list('key', 'value'))
+    return {
+        'total_orders': int(values.get(ORDERS, 0)),
+        'total_revenue': values.get(REVENUE, Decimal('0.00')),
+        'total_customers': int(values.get(CUSTOMERS, 0)),
+        'today_orders': int(values.get(today, 0)),
+    }
+
+
+def prune_days(today=None):
+    """Delete the day counters for days before ``today``; returns how many were deleted"""
+    today = today or timezone.localdate()
+    return StoreStat.objects.filter(key__startswith=DAY_PREFIX).exclude(key=day_key(today)).delete()[0]
+
+
+def top_customers(limit=5):
+    return (CustomerStats.objects.select_related('user')
+            .filter(total_orders__gt=0).order_by('-total_spent')[:limit])
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute every counter from the orders and users tables"""
+    StoreStat.objects.all().delete()
+    CustomerStats.objects.all().delete()
+
+    totals = Order.objects.aggregate(orders=Count('id'), revenue=Sum('total_amount', filter=COUNTED))
+    counters = {
+        ORDERS: totals['orders'],
+        REVENUE: totals['revenue'] or 0,
+        CUSTOMERS: User.objects.filter(is_staff=False).count(),
+    }
+    today = timezone.localdate()
+    midnight = timezone.make_aware(datetime.combine(today, time.min))
+    counters[day_key(today)] = Order.objects.filter(created_at__gte=midnight).count()
+    StoreStat.objects.bulk_create([StoreStat(key=key, value=value) for key, value in counters.items()])
+
+    CustomerStats.objects.bulk_create([
+        CustomerStats(user_id=user_id, total_orders=orders, total_spent=spent, last_order_at=last)
+        for user_id, (orders, spent, last) in customer_totals(Order.objects.all()).items()
+    ], batch_size=1000)
+    return counters
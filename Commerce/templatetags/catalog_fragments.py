@@ -0,0 +1,47 @@
+"""Cached storefront fragments: product cards and the category navigation.
+
+Each fragment is cached under the catalog_cache versions of what it shows,
+so saving a product or category replaces its fragments on the next render
+and listing pages are mostly stitched together from cached HTML.
+"""
+from django import template
+from django.template import Context
+from django.utils.safestring import mark_safe
+
+from .. import catalog_cache
+
+
+register = template.Library()
+
+# Part of every fragment key; bump it when the fragment templates change
+FRAGMENT_VERSION = 1
+
+
+def _template(context, name):
+    # Render with the engine directly so cached fragments are not timed
+    # again as top-level renders by the profiling backend
+    return context.template.engine.get_template(name)
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products):
+    """The cards for a list of products, concatenated"""
+    card = _template(context, 'includes/product_card.html')
+    cards = catalog_cache.fragments(
+        f'card{FRAGMENT_VERSION}', list(products),
+        key=lambda product: product.pk,
+        versions=lambda product: [catalog_cache.product_version(product.pk)],
+        render=lambda product: card.render(Context({'product': product}, autoescape=context.autoescape)),
+    )
+    return mark_safe(''.join(cards))
+
+
+@register.simple_tag(takes_context=True)
+def category_nav(context, categories, active=None, counts=False):
+    """The category list with ``active`` highlighted, optionally with product counts"""
+    nav = _template(context, 'includes/category_nav.html')
+    values = {'categories': categories, 'category': active, 'counts': counts}
+    return mark_safe(catalog_cache.cached(
+        f'nav{FRAGMENT_VERSION}', f'{active.pk if active else "all"}:{int(counts)}', [catalog_cache.CATEGORIES],
+        lambda: nav.render(Context(values, autoescape=context.autoescape)),
+    ))
@@ -1,3 +1,1624 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from types import ModuleType
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from . import (analytics, assets, benchmarks, cart, catalog_cache, catalog_snapshot, exports, images, order_summaries,
+               outbox, product_io, profiling, reservations, search, stats, urls)
+from .checkout import OutOfStockError, place_order
+from .models import (Cart, CartItem, Category, CustomerStats, DailySales, HourlySales, Order, OrderItem, OutboxJob,
+                     Product, StockHold, StoreStat)
+from .pagination import KeysetPaginator
+
+
+class ClearCacheMixin:
+    """Start each test with an empty cache; rolled-back test data reuses ids"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        catalog_snapshot.reset()
+
+
+def make_products(count, stock=100, category=None):
+    category = category or Category.objects.create(name='General')
+    return Product.objects.bulk_create([
+        Product(name=f'Product {i}', description='desc', price=Decimal('2.50'), category=category, stock=stock)
+        for i in range(count)
+    ])
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', password='pass12345')
+        self.cart = Cart.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def fill_cart(self, count):
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=2) for product in make_products(count)
+        ])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_totals(self):
+        self.fill_cart(3)
+        self.assertEqual(self.cart.get_total_items(), 6)
+        self.assertEqual(self.cart.get_total_price(), Decimal('15.00'))
+
+    def test_cart_page_queries_do_not_grow_with_cart(self):
+        self.fill_cart(1)
+        small = [self.count_queries(reverse('view_cart')), self.count_queries(reverse('checkout'))]
+        self.fill_cart(25)
+        self.assertEqual([self.count_queries(reverse('view_cart')), self.count_queries(reverse('checkout'))], small)
+
+
+class GuestCartTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('shopper', password='pass12345')
+        self.products = make_products(3)
+
+    def writes(self, queries):
+        return [query['sql'] for query in queries
+                if query['sql'].split()[0].upper() in ('INSERT', 'UPDATE', 'DELETE')]
+
+    def test_guest_cart_needs_no_writes(self):
+        first, second = self.products[:2]
+        self.client.get(reverse('product_detail', args=[first.id]))  # warm the catalog cache
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('add_to_cart', args=[first.id]))
+            self.client.get(reverse('add_to_cart', args=[first.id]))
+            self.client.get(reverse('add_to_cart', args=[second.id]))
+            self.client.post(reverse('update_cart_item', args=[second.id]), {'quantity': 4})
+        self.assertEqual(self.writes(queries), [])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('view_cart'))
+        self.assertEqual(self.writes(queries), [])
+        self.assertEqual(response.context['cart_items_count'], 2)
+        self.assertEqual(response.context['cart'].get_total_price(), Decimal('15.00'))
+        self.client.get(reverse('remove_from_cart', args=[first.id]))
+        self.assertEqual(self.client.get(reverse('view_cart')).context['cart'].get_total_items(), 4)
+
+    def test_non_numeric_quantity_is_rejected(self):
+        product = self.products[0]
+        self.client.get(reverse('add_to_cart', args=[product.id]))
+        response = self.client.post(reverse('update_cart_item', args=[product.id]), {'quantity': 'lots'})
+        self.assertRedirects(response, reverse('view_cart'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('view_cart')).context['cart'].quantities, {product.id: 1})
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.get(reverse('add_to_cart', args=[self.products[0].id]))
+        self.client.cookies[cart.GUEST_CART_COOKIE] = '{"1":99}'
+        self.assertEqual(self.client.get(reverse('view_cart')).context['cart'].quantities, {})
+
+    def test_login_merges_into_cart_with_one_upsert(self):
+        first, second, third = self.products
+        kept = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=kept, product=first, quantity=1)
+        self.client.get(reverse('add_to_cart', args=[first.id]))
+        self.client.post(reverse('add_to_cart', args=[second.id]))
+        self.client.get(reverse('add_to_cart', args=[third.id]))
+        third.delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'shopper', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len([sql for sql in self.writes(queries) if 'Commerce_cartitem' in sql]), 1)
+        # The quantities are added in the upsert, not read back first
+        self.assertFalse([query['sql'] for query in queries
+                          if query['sql'].startswith('SELECT') and 'Commerce_cartitem' in query['sql']])
+        self.assertEqual(dict(kept.items.values_list('product_id', 'quantity')), {first.id: 2, second.id: 1})
+        self.assertEqual(response.cookies[cart.GUEST_CART_COOKIE].value, '')
+        self.assertEqual(self.client.get(reverse('view_cart')).context['cart_items_count'], 2)
+
+
+class CartApiTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('shopper', password='pass12345')
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = make_products(40)
+
+    def post(self, operations):
+        return self.client.post(reverse('cart_api'), {'operations': operations}, content_type='application/json')
+
+    def quantities(self):
+        return dict(self.cart.items.values_list('product_id', 'quantity'))
+
+    def test_batch_applies_in_order(self):
+        first, second, third, fourth = self.products[:4]
+        CartItem.objects.create(cart=self.cart, product=first, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=third, quantity=1)
+        self.client.force_login(self.user)
+        response = self.post([
+            {'op': 'add', 'product': first.id},
+            {'op': 'add', 'product': second.id, 'quantity': 2},
+            {'op': 'add', 'product': second.id},
+            {'op': 'remove', 'product': third.id},
+            {'op': 'set', 'product': fourth.id, 'quantity': 4},
+            {'op': 'add', 'product': fourth.id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {first.id: 3, second.id: 3, fourth.id: 5})
+        data = response.json()
+        self.assertEqual((data['line_count'], data['total_items'], data['total_price']), (3, 11, '27.50'))
+        self.assertEqual(data['lines'][0], {'product': first.id, 'name': first.name, 'quantity': 3,
+                                            'price': '2.50', 'total': '7.50'})
+
+    def test_query_count_does_not_grow_with_batch(self):
+        self.client.force_login(self.user)
+
+        def count(products):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post([{'op': 'add', 'product': p.id} for p in products]).status_code, 200)
+            return len(queries)
+
+        self.assertEqual(count(self.products[:2]), count(self.products[2:40]))
+
+    def test_guest_batch_needs_no_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post([{'op': 'add', 'product': p.id, 'quantity': 2} for p in self.products[:3]])
+        self.assertEqual(response.json()['total_items'], 6)
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+        self.assertEqual(self.client.get(reverse('view_cart')).context['cart_items_count'], 3)
+
+    def test_invalid_batches_change_nothing(self):
+        self.client.force_login(self.user)
+        for operations in ([], [{'op': 'add'}], [{'op': 'drop', 'product': 1}],
+                           [{'op': 'set', 'product': self.products[0].id, 'quantity': -1}],
+                           [{'op': 'add', 'product': self.products[0].id}, {'op': 'add', 'product': 10 ** 9}]):
+            with self.subTest(operations=operations):
+                self.assertEqual(self.post(operations).status_code, 400)
+        self.assertEqual(self.quantities(), {})
+        self.assertEqual(self.client.get(reverse('cart_api')).status_code, 405)
+
+
+class CheckoutTests(TransactionTestCase):
+    def make_cart(self, username, products, quantity=1):
+        user = User.objects.create_user(username, password='pass12345')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=p, quantity=quantity) for p in products])
+        return user, cart
+
+    def checkout(self, user, cart):
+        return place_order(user, cart, shipping_address='1 Main St', payment_method='cash_on_delivery')
+
+    def test_order_lines_and_stock(self):
+        products = make_products(3, stock=5)
+        user, cart = self.make_cart('buyer', products, quantity=2)
+        order = self.checkout(user, cart)
+        self.assertEqual(order.total_amount, Decimal('15.00'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(cart.items.exists())
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {3})
+
+    def test_out_of_stock_rolls_back(self):
+        plenty, scarce = make_products(2, stock=5)
+        Product.objects.filter(id=scarce.id).update(stock=1)
+        user, cart = self.make_cart('buyer', [plenty, scarce], quantity=2)
+        with self.assertRaises(OutOfStockError) as ctx:
+            self.checkout(user, cart)
+        self.assertEqual([p.id for p in ctx.exception.products], [scarce.id])
+        self.assertEqual(Product.objects.get(id=plenty.id).stock, 5)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(cart.items.count(), 2)
+
+    def test_query_count_is_flat(self):
+        user, cart = self.make_cart('buyer', make_products(1))
+        counts = []
+        for size in (1, 50):
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=p) for p in make_products(size)])
+            with CaptureQueriesContext(connection) as ctx:
+                self.checkout(user, cart)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_parallel_checkouts_never_oversell(self):
+        product, = make_products(1, stock=3)
+        carts = [self.make_cart(f'buyer{i}', [product]) for i in range(12)]
+        barrier = threading.Barrier(len(carts))
+
+        def attempt(user, cart):
+            barrier.wait()
+            try:
+                self.checkout(user, cart)
+                return True
+            except OutOfStockError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(carts)) as pool:
+            results = list(pool.map(lambda args: attempt(*args), carts))
+
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(Product.objects.get(id=product.id).stock, 0)
+        self.assertEqual(OrderItem.objects.aggregate(total=Sum('quantity'))['total'], 3)
+
+
+class ReservationTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product, = make_products(1, stock=3)
+        self.first, self.second = (User.objects.create_user(name, password='pass12345') for name in ('first', 'second'))
+
+    def fill_cart(self, user, quantity):
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        return cart
+
+    def test_holds_reduce_available_stock(self):
+        self.assertEqual(reservations.reserve(self.first, {self.product.id: 2}), [])
+        self.assertEqual(reservations.reserve(self.second, {self.product.id: 2}), [self.product.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(reservations.available_to_sell([self.product.id]), {self.product.id: 1})
+        self.assertEqual(reservations.available_to_sell([self.product.id], exclude_user=self.first),
+                         {self.product.id: 3})
+        # Re-reserving replaces the earlier hold rather than adding to it
+        self.assertEqual(reservations.reserve(self.first, {self.product.id: 1}), [])
+        self.assertEqual(StockHold.objects.get(user=self.first).quantity, 1)
+
+    def test_expired_holds_stop_counting_and_are_swept(self):
+        reservations.reserve(self.first, {self.product.id: 3}, now=timezone.now() - reservations.HOLD_TTL * 2)
+        reservations.reserve(self.second, {self.product.id: 1})
+        self.assertEqual(reservations.available_to_sell([self.product.id]), {self.product.id: 2})
+        out = io.StringIO()
+        call_command('release_expired_holds', batch_size=1, stdout=out)
+        self.assertIn('Released 1 expired holds', out.getvalue())
+        self.assertEqual(list(StockHold.objects.values_list('user__username', flat=True)), ['second'])
+
+    def test_checkout_converts_holds(self):
+        cart = self.fill_cart(self.first, 2)
+        self.client.force_login(self.first)
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 200)
+        self.assertEqual(StockHold.objects.get(user=self.first).quantity, 2)
+
+        # Another customer cannot buy the held units
+        other = self.fill_cart(self.second, 2)
+        with self.assertRaises(OutOfStockError):
+            place_order(self.second, other, shipping_address='1 Main St', payment_method='cash_on_delivery')
+
+        place_order(self.first, cart, shipping_address='1 Main St', payment_method='cash_on_delivery')
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 1)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_checkout_page_redirects_when_stock_is_held(self):
+        reservations.reserve(self.second, {self.product.id: 2})
+        self.fill_cart(self.first, 2)
+        self.client.force_login(self.first)
+        response = self.client.get(reverse('checkout'))
+        self.assertRedirects(response, reverse('view_cart'), fetch_redirect_response=False)
+        self.assertFalse(StockHold.objects.filter(user=self.first).exists())
+
+
+@outbox.task
+def failing_test_task(message):
+    raise RuntimeError(message)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        outbox.reset_metrics()
+        self.user = User.objects.create_user('buyer', email='buyer@example.com')
+        self.cart = Cart.objects.create(user=self.user)
+        self.product, = make_products(1, stock=2)
+
+    def checkout(self, quantity):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=quantity)
+        return place_order(self.user, self.cart, shipping_address='1 Main St', payment_method='cash_on_delivery')
+
+    def test_confirmation_is_queued_with_the_order(self):
+        order = self.checkout(1)
+        job = OutboxJob.objects.get(task='send_order_confirmation')
+        self.assertEqual(job.payload, {'order_id': order.id})
+        self.assertEqual(mail.outbox, [])
+
+        out = io.StringIO()
+        call_command('run_outbox_worker', once=True, threads=1, stdout=out)
+        # The confirmation and the sales rollup update
+        self.assertIn('Ran 2 jobs', out.getvalue())
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+        self.assertIn(f'#{order.id}', mail.outbox[0].subject)
+        self.assertFalse(OutboxJob.objects.exists())
+        self.assertEqual(outbox.metrics()['succeeded'], 2)
+
+    def test_no_job_when_checkout_rolls_back(self):
+        with self.assertRaises(OutOfStockError):
+            self.checkout(3)
+        self.assertFalse(OutboxJob.objects.exists())
+
+    def test_claims_are_exclusive(self):
+        job = outbox.enqueue('send_order_confirmation', order_id=0)
+        self.assertEqual(outbox.claim(), [job])
+        self.assertEqual(outbox.claim(), [])
+        self.assertEqual(outbox.metrics()['running'], 1)
+
+    def test_a_job_that_outlived_its_lease_rolls_back(self):
+        self.checkout(1)
+        OutboxJob.objects.exclude(task='record_sales').delete()
+        stale, = outbox.claim()
+        OutboxJob.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        fresh, = outbox.claim()
+        with self.assertLogs('Commerce.outbox', 'WARNING'):
+            self.assertEqual(outbox.run([stale]), 0)
+        self.assertFalse(DailySales.objects.exists())
+        self.assertEqual(outbox.run([fresh]), 1)
+        self.assertEqual(DailySales.objects.get(category=None, product=None).orders, 1)
+        self.assertFalse(OutboxJob.objects.exists())
+
+    def test_failures_back_off_then_stop(self):
+        job = outbox.enqueue('failing_test_task', message='smtp down')
+        for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+            with self.assertLogs('Commerce.outbox', 'WARNING'):
+                self.assertEqual(outbox.run(outbox.claim()), 0)
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertEqual(job.last_error, 'RuntimeError: smtp down')
+            if attempt < outbox.MAX_ATTEMPTS:
+                self.assertGreater(job.run_after, timezone.now())
+                self.assertEqual(outbox.claim(), [])
+                OutboxJob.objects.update(run_after=timezone.now())
+        self.assertIsNotNone(job.failed_at)
+        self.assertEqual(outbox.claim(), [])
+        metrics = outbox.metrics()
+        self.assertEqual((metrics['dead'], metrics['retried'], metrics['failed']), (1, outbox.MAX_ATTEMPTS - 1, 1))
+
+
+class InProcessOutboxTests(TransactionTestCase):
+    def test_jobs_run_once_committed(self):
+        user = User.objects.create_user('buyer', email='buyer@example.com')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=make_products(1)[0])
+        place_order(user, cart, shipping_address='1 Main St', payment_method='cash_on_delivery')
+        deadline = time.monotonic() + 10
+        while OutboxJob.objects.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(OutboxJob.objects.exists())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class KeysetPaginationTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        make_products(7)
+        # Give several products the same timestamp so ties fall back to id.
+        Product.objects.filter(id__in=Product.objects.values('id')[:4]).update(created_at=timezone.now())
+
+    def test_walks_forward_and_back(self):
+        paginator = KeysetPaginator(Product.objects.all(), page_size=3)
+        expected = list(Product.objects.order_by('-created_at', '-id'))
+
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_cursor))
+        self.assertEqual([p for page in pages for p in page], expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.page(before=pages[-1].previous_cursor)
+        self.assertEqual(back.object_list, pages[-2].object_list)
+
+    def test_page_size_is_capped_and_bad_cursor_ignored(self):
+        paginator = KeysetPaginator(Product.objects.all(), page_size=2, max_page_size=5)
+        self.assertEqual(len(paginator.page(page_size='500')), 5)
+        self.assertEqual(len(paginator.page(after='not-a-cursor')), 2)
+
+    def test_listing_links(self):
+        response = self.client.get(reverse('product_list'), {'page_size': 3})
+        self.assertEqual(len(response.context['products']), 3)
+        self.assertContains(response, 'after=')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Parses SQLite EXPLAIN QUERY PLAN output')
+class IndexUsageTests(ClearCacheMixin, TestCase):
+    HOT_TABLES = {'Commerce_product', 'Commerce_order', 'auth_user'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = make_products(30)
+        cls.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        cls.customer = User.objects.create_user('customer', password='pass12345')
+        stats.rebuild()
+        for _ in range(5):
+            order = Order.objects.create(user=cls.customer, total_amount=5, shipping_address='a', payment_method='m')
+            OrderItem.objects.create(order=order, product=cls.products[0], quantity=1, price=5)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_hot_queries_use_their_indexes(self):
+        self.client.force_login(self.staff)
+        expected = {
+            reverse('home'): ['product_instock_created_idx'],
+            reverse('admin_dashboard'): ['order_created_idx', 'user_customer_joined_idx', 'product_low_stock_idx'],
+            reverse('product_list'): ['product_instock_created_idx'],
+            reverse('product_list_by_category', args=[self.products[0].category_id]): ['product_instock_cat_idx'],
+            reverse('customer_list'): ['user_customer_joined_idx'],
+            reverse('user_order_history', args=[self.customer.id]): ['order_user_created_idx'],
+            reverse('order_history'): ['order_created_idx'],
+            reverse('order_history') + '?status=pending': ['order_status_created_idx'],
+        }
+        for url, indexes in expected.items():
+            with self.subTest(url=url), CaptureQueriesContext(connection) as ctx:
+                self.client.get(url)
+                steps = []
+                for query in ctx.captured_queries:
+                    sql = query['sql']
+                    if sql.startswith('SELECT') and (' WHERE ' in sql or ' ORDER BY ' in sql):
+                        plan = self.plan(sql)
+                        # No hot table is read without an index
+                        self.assertEqual([step for step in plan if step.startswith('SCAN ')
+                                          and step.split()[1] in self.HOT_TABLES and ' USING ' not in step], [], sql)
+                        steps += plan
+                for index in indexes:
+                    self.assertTrue(any(f'USING INDEX {index}' in step or f'USING COVERING INDEX {index}' in step
+                                        for step in steps), f'{index} unused: {steps}')
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.alice = User.objects.create_user('alice', password='pass12345')
+        self.bob = User.objects.create_user('bob', password='pass12345')
+
+    def order(self, user, amount):
+        return Order.objects.create(user=user, total_amount=Decimal(amount), shipping_address='a', payment_method='m')
+
+    def snapshot(self):
+        customers = {s.user_id: (s.total_orders, s.total_spent) for s in CustomerStats.objects.all()}
+        return stats.dashboard_counters(), customers
+
+    def test_incremental_counters_match_rebuild(self):
+        self.order(self.alice, '10.00')
+        cancelled = self.order(self.alice, '5.00')
+        self.order(self.bob, '7.50').delete()
+        self.order(self.bob, '2.00')
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        self.bob.is_staff = True
+        self.bob.save()
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental[0], {
+            'total_orders': 3, 'total_revenue': Decimal('12.00'), 'total_customers': 1, 'today_orders': 3,
+        })
+        self.assertEqual(incremental[1][self.alice.id], (2, Decimal('10.00')))
+        stats.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_promoting_a_user_loaded_without_is_staff(self):
+        before = stats.dashboard_counters()['total_customers']
+        for username, is_staff, change in (('alice', False, 0), ('bob', True, -1)):
+            user = User.objects.only('username').get(username=username)
+            user.is_staff = is_staff
+            user.save()
+            self.assertEqual(stats.dashboard_counters()['total_customers'], before + change)
+
+    def test_dashboard_query_count_is_constant(self):
+        self.client.force_login(self.staff)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('admin_dashboard'))
+        for i in range(20):
+            self.order(User.objects.create_user(f'c{i}'), '3.00')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(response.context['total_orders'], 20)
+        self.assertEqual(response.context['total_revenue'], Decimal('60.00'))
+
+    def test_only_todays_order_counter_is_kept(self):
+        old = self.order(self.alice, '4.00')
+        Order.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=3))
+        old.refresh_from_db()
+        stats.rebuild()
+        StoreStat.objects.create(key=stats.day_key(timezone.localdate() - timedelta(days=1)), value=2)
+        self.order(self.bob, '1.00')
+        # Deleting an earlier day's order leaves no counter behind for that day
+        old.delete()
+        out = io.StringIO()
+        call_command('prune_stats', stdout=out)
+        self.assertIn('Pruned 1 day counters', out.getvalue())
+        days = StoreStat.objects.filter(key__startswith=stats.DAY_PREFIX).values_list('key', 'value')
+        self.assertEqual(list(days), [(stats.day_key(timezone.localdate()), 1)])
+        self.assertEqual(stats.dashboard_counters()['today_orders'], 1)
+        self.assertEqual(stats.rebuild()[stats.day_key(timezone.localdate())], 1)
+        self.assertEqual(StoreStat.objects.filter(key__startswith=stats.DAY_PREFIX).count(), 1)
+
+
+class CustomerStatsTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user('alice', password='pass12345')
+
+    def order(self, amount, days_ago=0):
+        order = Order.objects.create(user=self.customer, total_amount=Decimal(amount),
+                                     shipping_address='a', payment_method='m')
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+        order.refresh_from_db()
+        return order
+
+    def test_last_order_follows_creation_and_deletion(self):
+        older = Order.objects.create(user=self.customer, total_amount=4, shipping_address='a', payment_method='m')
+        newer = Order.objects.create(user=self.customer, total_amount=6, shipping_address='a', payment_method='m')
+        self.assertEqual(CustomerStats.objects.get(user=self.customer).last_order_at, newer.created_at)
+        newer.delete()
+        row = CustomerStats.objects.get(user=self.customer)
+        self.assertEqual((row.total_orders, row.total_spent, row.last_order_at), (1, 4, older.created_at))
+
+    def test_drift_is_detected_and_repaired(self):
+        self.order('8.00', days_ago=3)
+        # A queryset update bypasses the signals
+        Order.objects.update(status='cancelled')
+        self.assertEqual([user_id for user_id, _, _ in stats.customer_drift()], [self.customer.id])
+        stats.repair_customers(stats.customer_drift())
+        self.assertEqual(list(stats.customer_drift()), [])
+        self.assertEqual(CustomerStats.objects.get(user=self.customer).total_spent, 0)
+
+    def test_repair_rereads_totals_changed_since_the_scan(self):
+        other = User.objects.create_user('bob')
+        self.order('8.00')
+        Order.objects.create(user=other, total_amount=3, shipping_address='a', payment_method='m')
+        CustomerStats.objects.update(total_orders=0)
+        drift = list(stats.customer_drift())
+        self.order('2.00')
+        self.assertEqual(stats.repair_customers(drift, batch_size=1), 2)
+        self.assertEqual(list(stats.customer_drift()), [])
+        self.assertEqual(CustomerStats.objects.get(user=self.customer).total_orders, 2)
+
+    def test_customer_list_reads_stats(self):
+        staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.order('8.00')
+        self.client.force_login(staff)
+        response = self.client.get(reverse('customer_list'))
+        customer, = response.context['customers']
+        self.assertEqual((customer.total_orders, customer.total_spent), (1, Decimal('8.00')))
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Kitchen')
+        self.kettle = Product.objects.create(name='Electric Kettle', description='Boils water fast',
+                                             price=20, category=category, stock=5)
+        self.mug = Product.objects.create(name='Travel Mug', description='Keeps your kettle tea hot',
+                                          price=8, category=category, stock=5)
+
+    def test_ranked_prefix_matches(self):
+        self.assertEqual(search.search('kett'), [self.kettle, self.mug])
+        self.assertEqual(search.search('kettle hot'), [self.mug])
+        self.assertEqual(search.search('?!'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.mug.name = 'Thermal Flask'
+        self.mug.save()
+        self.assertEqual(search.search('flask'), [self.mug])
+        self.kettle.delete()
+        self.assertEqual(search.search('kettle'), [self.mug])
+
+    def test_storefront_view_hides_out_of_stock(self):
+        Product.objects.filter(id=self.mug.id).update(stock=0)
+        response = self.client.get(reverse('product_search'), {'q': 'kettle'})
+        self.assertEqual(response.context['products'], [self.kettle])
+
+    def test_missing_index_is_probed_again(self):
+        name = connection.settings_dict['NAME']
+        # As if the table had been missing when this process last looked
+        self.enterContext(mock.patch.dict(search._fts_available, {name: time.monotonic() + 60}))
+        self.assertFalse(search.uses_fts())
+        search._fts_available[name] = time.monotonic() - 1
+        self.assertTrue(search.uses_fts())
+        with self.assertNumQueries(0):
+            self.assertTrue(search.uses_fts())
+
+
+class CatalogCacheTests(TestCase):
+    def cache_config(self):
+        return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalog-tests'}
+
+    def setUp(self):
+        self.enterContext(self.settings(CACHES={'default': self.cache_config()}))
+        cache.clear()
+        catalog_cache.reset_counters()
+        self.product, = make_products(1, stock=5)
+
+    def test_reads_are_cached_and_counted(self):
+        catalog_cache.product(self.product.id)
+        catalog_cache.listing()
+        with self.assertNumQueries(0):
+            cached = catalog_cache.product(self.product.id)
+            catalog_cache.listing()
+        self.assertEqual(cached, self.product)
+        counters = catalog_cache.counters()
+        self.assertEqual((counters['product_hits'], counters['product_misses']), (1, 1))
+        self.assertEqual((counters['listing_hits'], counters['listing_misses']), (1, 1))
+
+    def test_saves_invalidate_product_and_listing(self):
+        self.assertEqual(catalog_cache.listing()['total'], 1)
+        catalog_cache.categories()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed'
+            self.product.save()
+            Product.objects.create(name='New', description='desc', price=1, category=self.product.category, stock=1)
+        self.assertEqual(catalog_cache.product(self.product.id).name, 'Renamed')
+        self.assertEqual(catalog_cache.listing()['total'], 2)
+        self.assertEqual(catalog_cache.categories()[0].product_count, 2)
+        self.assertEqual(catalog_cache.counters()['hits'], 0)
+
+    def test_checkout_invalidates_stock(self):
+        user = User.objects.create_user('buyer')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        self.assertEqual(catalog_cache.product(self.product.id).stock, 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user, cart, shipping_address='a', payment_method='cash_on_delivery')
+        self.assertEqual(catalog_cache.product(self.product.id).stock, 4)
+
+
+class FileCatalogCacheTests(CatalogCacheTests):
+    def cache_config(self):
+        location = self.enterContext(tempfile.TemporaryDirectory())
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+
+
+def jpeg_upload(width=1200, height=800, color='red', name='photo.jpg'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class CatalogSnapshotTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        fruit, tools = Category.objects.create(name='Fruit'), Category.objects.create(name='Tools')
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', description='desc', price=Decimal(price), stock=stock, calories=calories,
+                    category=fruit if i % 2 else tools,
+                    created_at=timezone.now() - timedelta(hours=i))
+            for i, (price, stock, calories) in enumerate([
+                ('5.00', 3, 120), ('12.50', 0, None), ('12.50', 8, 300), ('60.00', 1, 50),
+                ('250.00', 2, None), ('9.99', 5, 800), ('40.00', 0, 10), ('99.00', 4, 200),
+            ])
+        ])
+        self.fruit, self.tools = fruit, tools
+        self.all_filters = [
+            catalog_snapshot.Filters(),
+            catalog_snapshot.Filters(sort='price', in_stock=False),
+            catalog_snapshot.Filters(category_id=fruit.id, sort='-price'),
+            catalog_snapshot.Filters(min_price=Decimal('10'), max_price=Decimal('60'), in_stock=False),
+            catalog_snapshot.Filters(max_calories=200, sort='price'),
+        ]
+
+    def assertMatchesOrm(self, snapshot):
+        for filters in self.all_filters:
+            with self.subTest(filters=filters):
+                expected = list(catalog_snapshot.queryset(filters).values_list('id', flat=True))
+                self.assertEqual(snapshot.select(filters), (expected, len(expected)))
+                self.assertEqual(snapshot.select(filters, offset=1, limit=2), (expected[1:3], len(expected)))
+                self.assertEqual(snapshot.facet_counts(filters), catalog_snapshot.orm_facet_counts(filters))
+
+    @skipUnless(catalog_snapshot.numpy, 'NumPy is not installed')
+    def test_numpy_matches_orm(self):
+        self.assertMatchesOrm(catalog_snapshot.CatalogSnapshot.load())
+
+    def test_pure_python_matches_orm(self):
+        with mock.patch.object(catalog_snapshot, 'numpy', None):
+            self.assertMatchesOrm(catalog_snapshot.CatalogSnapshot.load())
+
+    def test_facet_counts(self):
+        counts = catalog_snapshot.CatalogSnapshot.load().facet_counts(catalog_snapshot.Filters(max_price=Decimal('50')))
+        self.assertEqual(counts['categories'], {self.fruit.id: 1, self.tools.id: 2})
+        self.assertEqual(counts['prices'], [2, 1, 0, 2, 0, 1])
+        self.assertEqual((counts['in_stock'], counts['all']), (3, 5))
+
+    def test_follows_catalog_changes(self):
+        cheapest = catalog_snapshot.Filters(sort='price')
+        self.assertEqual(catalog_snapshot.select(cheapest, limit=1), ([self.products[0].id], 6))
+        product = self.products[5]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = Decimal('1.00')
+            product.save()
+            new = Product.objects.create(name='New', description='desc', price=Decimal('0.50'), stock=1,
+                                         category=self.fruit)
+        self.assertEqual(catalog_snapshot.select(cheapest, limit=2), ([new.id, product.id], 7))
+        # Checkout's stock update bypasses the signals but bumps the versions
+        Product.objects.filter(pk=product.pk).update(stock=0, updated_at=timezone.now())
+        catalog_cache.invalidate_products([(product.pk, product.category_id)])
+        self.assertNotIn(product.id, catalog_snapshot.select(cheapest)[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].delete()
+        self.assertEqual(catalog_snapshot.select(cheapest)[1], 5)
+
+    def test_drops_deleted_products_when_the_count_is_unchanged(self):
+        everything = catalog_snapshot.Filters(in_stock=False)
+        self.assertEqual(catalog_snapshot.select(everything)[1], 8)
+        gone = self.products[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            gone.delete()
+            new = Product.objects.create(name='New', description='desc', price=Decimal('1.00'), stock=1,
+                                         category=self.fruit)
+        ids, total = catalog_snapshot.select(everything)
+        self.assertEqual(total, 8)
+        self.assertIn(new.id, ids)
+        self.assertNotIn(gone.id, ids)
+        self.assertEqual(catalog_snapshot.facet_counts(everything),
+                         catalog_snapshot.orm_facet_counts(everything))
+
+    def test_refresh_swaps_in_a_copy_without_holding_the_lock(self):
+        everything = catalog_snapshot.Filters(in_stock=False)
+        published = catalog_snapshot._current()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='New', description='desc', price=Decimal('1.00'), stock=1,
+                                   category=self.fruit)
+        refreshed = catalog_snapshot._refreshed
+
+        def unlocked(*args):
+            self.assertFalse(catalog_snapshot._lock.locked())
+            return refreshed(*args)
+
+        with mock.patch.object(catalog_snapshot, '_refreshed', unlocked):
+            self.assertEqual(catalog_snapshot.select(everything)[1], 9)
+        # A read still using the old snapshot is not disturbed
+        self.assertEqual(len(published), 8)
+        self.assertIsNot(catalog_snapshot._current(), published)
+
+    def test_filtered_listing_view(self):
+        url = reverse('product_list_by_category', args=[self.tools.id])
+        for enabled in (True, False):
+            with self.subTest(snapshot=enabled), self.settings(CATALOG_SNAPSHOT=enabled):
+                response = self.client.get(url, {'sort': '-price', 'availability': 'all', 'page_size': 2})
+                self.assertEqual([product.id for product in response.context['products']],
+                                 [self.products[4].id, self.products[6].id])
+                self.assertEqual(response.context['total_products'], 4)
+                response = self.client.get(url + response.context['page'].next_url)
+                self.assertEqual([product.name for product in response.context['products']],
+                                 ['Product 2', 'Product 0'])
+                self.assertFalse(response.context['page'].has_next())
+                response = self.client.get(url + response.context['page'].previous_url)
+                self.assertEqual(len(response.context['products']), 2)
+
+    def test_facets_come_from_one_cached_query(self):
+        filters = catalog_snapshot.Filters(max_price=Decimal('50'))
+        with self.assertNumQueries(1):
+            counts = catalog_snapshot.facets(filters)
+        self.assertEqual(counts, catalog_snapshot.CatalogSnapshot.load().facet_counts(filters))
+        # Category and availability are applied to the cached rows
+        with self.assertNumQueries(0):
+            counts = catalog_snapshot.facets(filters._replace(category_id=self.fruit.id, in_stock=False))
+        self.assertEqual(counts['prices'], [1, 1, 0, 2, 0, 0])
+        # Checkout's stock update bumps the versions the rows are cached under
+        Product.objects.filter(pk=self.products[5].pk).update(stock=0)
+        catalog_cache.invalidate_products([(self.products[5].pk, self.fruit.id)])
+        self.assertEqual(catalog_snapshot.facets(filters)['categories'], {self.tools.id: 2})
+
+    def test_facet_navigation(self):
+        response = self.client.get(reverse('product_list'), {'max_price': '50'})
+        facets = response.context['facets']
+        self.assertEqual(facets['categories'], [(self.fruit, 1), (self.tools, 2)])
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual([price['count'] for price in facets['prices']], [2, 1, 0, 2, 0, 1])
+        self.assertEqual((facets['in_stock'], facets['all']), (3, 5))
+        # Facet links combine with the filters already applied
+        content = response.content.decode()
+        self.assertIn(f'{reverse("product_list_by_category", args=[self.fruit.id])}?max_price=50', content)
+        self.assertIn('?max_price=24.99&amp;min_price=10', content)
+        self.assertIn('?max_price=50&amp;availability=all', content)
+
+        response = self.client.get(reverse('product_list_by_category', args=[self.fruit.id]),
+                                   {'min_price': '10', 'max_price': '24.99', 'availability': 'all'})
+        self.assertEqual([product.id for product in response.context['products']], [self.products[1].id])
+        self.assertEqual(response.context['facets']['categories'], [(self.fruit, 1), (self.tools, 1)])
+        self.assertTrue(response.context['facets']['prices'][1]['active'])
+
+    def test_bad_filters_show_the_plain_listing(self):
+        response = self.client.get(reverse('product_list'), {'max_price': 'cheap'})
+        self.assertEqual(response.context['total_products'], 6)
+
+
+class FragmentCacheTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        catalog_cache.reset_counters()
+        self.products = make_products(12)
+
+    def render_listing(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def card_counts(self):
+        counters = catalog_cache.counters()
+        return counters.get('card1_hits', 0), counters.get('card1_misses', 0)
+
+    def test_cards_are_stitched_from_cache(self):
+        first = self.render_listing()
+        self.assertEqual(self.card_counts(), (0, 12))
+        self.assertEqual(self.render_listing(), first)
+        self.assertEqual(self.card_counts(), (12, 12))
+        self.assertEqual(first.count('class="card h-100 product-card"'), 12)
+
+    def test_saves_replace_only_their_fragments(self):
+        self.render_listing()
+        product = self.products[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = Decimal('9.99')
+            product.save()
+        self.assertIn('GH₵ 9.99', self.render_listing())
+        self.assertEqual(self.card_counts(), (11, 13))
+
+    def test_category_nav_follows_renames(self):
+        category = self.products[0].category
+        self.assertIn('General', self.client.get(reverse('home')).content.decode())
+        with self.captureOnCommitCallbacks(execute=True):
+            category.name = 'Groceries'
+            category.save()
+        content = self.client.get(reverse('home')).content.decode()
+        self.assertIn('Groceries', content)
+        self.assertNotIn('General', content)
+
+
+class ConditionalGetTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = make_products(3)
+        self.product = self.products[0]
+
+    def test_product_detail_revalidates(self):
+        url = reverse('product_detail', args=[self.product.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('4.00')
+            self.product.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_listing_changes_when_a_product_leaves(self):
+        for url in (reverse('home'), reverse('product_list'),
+                    reverse('product_list_by_category', args=[self.product.category_id])):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.products.pop().delete()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertGreaterEqual(Category.objects.get().updated_at, self.product.updated_at)
+
+    def test_viewer_is_part_of_the_validator(self):
+        url = reverse('product_list')
+        anonymous = self.client.get(url)['ETag']
+        self.client.get(reverse('add_to_cart', args=[self.product.id]), follow=True)
+        guest = self.client.get(url)
+        self.assertNotEqual(guest['ETag'], anonymous)
+        self.assertFalse(guest.has_header('Last-Modified'))
+
+        user = User.objects.create_user('shopper')
+        self.client.force_login(user)
+        response = self.client.get(url)
+        self.assertNotEqual(response['ETag'], guest['ETag'])
+        self.assertIn('private', response['Cache-Control'])
+        with self.assertNumQueries(3):  # session, user and the cart badge
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_missing_product_is_not_cached(self):
+        response = self.client.get(reverse('product_detail', args=[self.product.id + 100]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.customer = User.objects.create_user('customer', email='customer@example.com')
+        products = make_products(2)
+        self.orders = []
+        for day, status in ((1, 'shipped'), (2, 'pending'), (3, 'shipped')):
+            order = Order.objects.create(user=self.customer, total_amount=Decimal('7.50'), status=status,
+                                         shipping_address='1 Road,\nAccra', payment_method='cash_on_delivery')
+            Order.objects.filter(pk=order.pk).update(created_at=datetime(2026, 3, day, 12, tzinfo=dt_timezone.utc))
+            OrderItem.objects.create(order=order, product=products[0], quantity=3, price=Decimal('2.50'))
+            self.orders.append(order)
+        self.client.force_login(self.staff)
+
+    def export(self, dataset, **params):
+        response = self.client.get(reverse('export_data', args=[dataset]), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_orders_csv_with_filters(self):
+        response, body = self.export('orders', status='shipped', date_from='2026-03-02', date_to='2026-03-03')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="orders_2026-03-02_2026-03-03_shipped.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([row['id'] for row in rows], [str(self.orders[2].id)])
+        self.assertEqual(rows[0]['shipping_address'], '1 Road,\nAccra')
+        self.assertEqual(rows[0]['total_amount'], '7.50')
+        self.assertEqual(rows[0]['created_at'], '2026-03-03T12:00:00+00:00')
+
+    def test_order_items_jsonl(self):
+        _, body = self.export('order_items', format='jsonl')
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual((records[0]['order_id'], records[0]['quantity'], records[0]['line_total']),
+                         (self.orders[0].id, 3, '7.50'))
+
+    def test_customers(self):
+        _, body = self.export('customers')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([(row['username'], row['total_orders'], row['total_spent']) for row in rows],
+                         [('customer', '3', '22.50')])
+
+    def test_rows_stream_in_chunks(self):
+        export = exports.Export('order_items', chunk_size=1)
+        chunks = list(export)
+        self.assertEqual((len(chunks), export.rows), (2, 3))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('export_data', args=['payments'])).status_code, 404)
+        response = self.client.get(reverse('export_data', args=['orders']),
+                                   {'date_from': '2026-03-03', 'date_to': '2026-03-01'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get(reverse('export_data', args=['orders'])).status_code, 302)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.jsonl')
+            out = io.StringIO()
+            call_command('export_data', 'orders', path, status=['pending'], stdout=out)
+            with open(path) as file:
+                self.assertEqual([json.loads(line)['id'] for line in file], [self.orders[1].id])
+        self.assertIn('Exported 1 orders rows', out.getvalue())
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.customer = User.objects.create_user('customer')
+        self.cart = Cart.objects.create(user=self.customer)
+        self.fruit = make_products(2, category=Category.objects.create(name='Fruit'))
+        self.tools = make_products(1, category=Category.objects.create(name='Tools'))
+
+    def checkout(self, *lines):
+        for product, quantity in lines:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+        order = place_order(self.customer, self.cart, shipping_address='1 Road', payment_method='cash_on_delivery')
+        self.run_jobs()
+        return order
+
+    def run_jobs(self):
+        outbox.run(outbox.claim())
+
+    def rollups(self, model=DailySales):
+        return sorted((str(row.bucket), row.category_id or 0, row.product_id or 0, row.orders, row.units, row.revenue)
+                      for row in model.objects.exclude(orders=0))
+
+    def assertMatchesRebuild(self):
+        hourly, daily = self.rollups(HourlySales), self.rollups()
+        analytics.rebuild()
+        self.assertEqual((self.rollups(HourlySales), self.rollups()), (hourly, daily))
+
+    def test_checkout_updates_every_level(self):
+        self.checkout((self.fruit[0], 2), (self.fruit[1], 1), (self.tools[0], 1))
+        self.checkout((self.fruit[0], 1))
+        today = timezone.localdate()
+        store = DailySales.objects.get(bucket=today, category=None, product=None)
+        self.assertEqual((store.orders, store.units, store.revenue), (2, 5, Decimal('12.50')))
+        fruit = DailySales.objects.get(bucket=today, category=self.fruit[0].category, product=None)
+        self.assertEqual((fruit.orders, fruit.units), (2, 4))
+        product = HourlySales.objects.get(product=self.fruit[0])
+        self.assertEqual((product.orders, product.units, product.revenue), (2, 3, Decimal('7.50')))
+        self.assertEqual(product.bucket, analytics.hour_of(timezone.now()))
+        self.assertMatchesRebuild()
+
+    def test_cancelling_and_deleting_take_sales_back(self):
+        order = self.checkout((self.fruit[0], 2), (self.tools[0], 1))
+        self.checkout((self.fruit[1], 1))
+        order.status = 'cancelled'
+        order.save()
+        self.run_jobs()
+        self.assertEqual(DailySales.objects.get(category=None, product=None).orders, 1)
+        self.assertMatchesRebuild()
+
+        order.status = 'pending'
+        order.save()
+        self.run_jobs()
+        self.assertEqual(DailySales.objects.get(category=None, product=None).orders, 2)
+        order.delete()
+        self.run_jobs()
+        self.assertEqual(DailySales.objects.get(category=None, product=None).units, 1)
+        self.assertMatchesRebuild()
+
+    def test_orders_made_outside_checkout_are_only_taken_back_once_added(self):
+        order = Order.objects.create(user=self.customer, total_amount=Decimal('5.00'), shipping_address='1 Road',
+                                     payment_method='cash_on_delivery')
+        OrderItem.objects.create(order=order, product=self.fruit[0], quantity=2, price=self.fruit[0].price)
+        order.status = 'cancelled'
+        order.save()
+        self.run_jobs()
+        self.assertFalse(DailySales.objects.exists())
+        self.assertMatchesRebuild()
+
+        # Reinstating it adds it, so cancelling it again takes it away
+        order.status = 'pending'
+        order.save()
+        self.run_jobs()
+        self.assertEqual(DailySales.objects.get(category=None, product=None).units, 2)
+        order.status = 'cancelled'
+        order.save()
+        order.delete()
+        self.run_jobs()
+        self.assertEqual(DailySales.objects.get(category=None, product=None).units, 0)
+        self.assertMatchesRebuild()
+
+    def test_lines_of_deleted_products_are_skipped(self):
+        CartItem.objects.create(cart=self.cart, product=self.tools[0], quantity=1)
+        place_order(self.customer, self.cart, shipping_address='1 Road', payment_method='cash_on_delivery')
+        self.tools[0].delete()
+        self.run_jobs()
+        self.assertFalse(DailySales.objects.exists())
+        self.assertFalse(OutboxJob.objects.filter(task='record_sales').exists())
+
+    def test_report_view(self):
+        for day, lines in ((1, [(self.fruit[0], 2)]), (3, [(self.tools[0], 4), (self.fruit[1], 1)])):
+            order = self.checkout(*lines)
+            Order.objects.filter(pk=order.pk).update(created_at=datetime(2026, 3, day, 9, 30, tzinfo=dt_timezone.utc))
+        analytics.rebuild()
+        self.client.force_login(self.staff)
+        url = reverse('sales_report')
+
+        report = self.client.get(url, {'date_from': '2026-03-01', 'date_to': '2026-03-04'}).context['report']
+        self.assertEqual([entry['orders'] for entry in report['series']], [1, 0, 1, 0])
+        self.assertEqual(report['totals'], {'orders': 2, 'units': 7, 'revenue': Decimal('17.50')})
+        self.assertEqual([(row['name'], row['total_units']) for row in report['categories']],
+                         [('Tools', 4), ('Fruit', 3)])
+        self.assertEqual(report['products'][0]['product_id'], self.tools[0].id)
+
+        report = self.client.get(url, {'date_from': '2026-03-03', 'date_to': '2026-03-03',
+                                       'granularity': 'hour'}).context['report']
+        self.assertEqual(len(report['series']), 24)
+        self.assertEqual(report['series'][9]['units'], 5)
+
+        self.assertEqual(self.client.get(url, {'date_from': '2026-03-03', 'date_to': '2026-03-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'date_from': '2026-01-01', 'date_to': '2026-03-01',
+                                               'granularity': 'hour'}).status_code, 400)
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_rebuild_command(self):
+        self.checkout((self.fruit[0], 1), (self.tools[0], 1))
+        out = io.StringIO()
+        call_command('rebuild_sales_rollups', stdout=out)
+        self.assertIn('Rebuilt 5 hourly and 5 daily rollup rows', out.getvalue())
+
+
+class StaticAssetTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(self.settings(STATIC_ROOT=self.enterContext(tempfile.TemporaryDirectory()),
+                                        MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def stylesheet_url(self):
+        html = self.client.get(reverse('home')).content.decode()
+        match = re.search(r'href="(/static/css/base\.[0-9a-f]{12}\.css)"', html)
+        self.assertIsNotNone(match)
+        return match.group(1)
+
+    def test_collectstatic_hashes_and_compresses(self):
+        url = self.stylesheet_url()
+        path = os.path.join(settings.STATIC_ROOT, url[len('/static/'):])
+        self.assertLess(os.path.getsize(path + '.gz'), os.path.getsize(path))
+        self.assertEqual(assets.brotli is not None, os.path.exists(path + '.br'))
+
+    def test_hashed_asset_is_immutable_and_precompressed(self):
+        url = self.stylesheet_url()
+        with self.assertNumQueries(0):
+            response = self.client.get(url, headers={'accept-encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], assets.IMMUTABLE)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'.navbar', body)
+
+        plain = self.client.get(url, headers={'accept-encoding': 'gzip;q=0, identity'})
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(plain.streaming_content), body)
+
+    def test_unhashed_and_missing_files(self):
+        response = self.client.get('/static/css/base.css')
+        self.assertEqual(response['Cache-Control'], assets.REVALIDATE)
+        not_modified = self.client.get('/static/css/base.css', headers={'if-modified-since': response['Last-Modified']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get('/static/css/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+    def test_media(self):
+        derived = default_storage.save(images.derived_name('abc', 160, 'jpg'), SimpleUploadedFile('x', b'jpeg'))
+        other = default_storage.save('uploads/note.txt', SimpleUploadedFile('x', b'hello'))
+        self.assertEqual(self.client.get(f'/media/{derived}')['Cache-Control'], assets.IMMUTABLE)
+        self.assertEqual(self.client.get(f'/media/{other}')['Cache-Control'], assets.REVALIDATE)
+
+    def test_asset_report_command(self):
+        out = io.StringIO()
+        call_command('asset_report', stdout=out)
+        row = next(line for line in out.getvalue().splitlines() if line.startswith('home '))
+        html, inline, count, raw, sent, before, first, repeat = map(int, row.split()[1:9])
+        self.assertEqual((inline, count, repeat), (0, 1, html))
+        self.assertLess(sent, raw)
+        self.assertLess(first, before)
+
+
+class ProductImageTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(self.settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.category = Category.objects.create(name='Photos')
+
+    def create(self, upload):
+        product = Product.objects.create(name='Pictured', description='desc', price=1, category=self.category,
+                                         stock=1, image=upload)
+        # Derivation is an outbox job that runs once the save commits
+        self.assertIsNone(product.image_srcset)
+        with self.captureOnCommitCallbacks(execute=True):
+            outbox.run(outbox.claim())
+        product.refresh_from_db()
+        return product
+
+    def test_upload_is_kept_when_derivation_rolls_back(self):
+        product = Product.objects.create(name='Pictured', description='desc', price=1, category=self.category,
+                                         stock=1, image=jpeg_upload())
+        name = product.image.name
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                outbox.run(outbox.claim())
+                raise RuntimeError('rolled back')
+        product.refresh_from_db()
+        self.assertEqual(product.image.name, name)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_upload_builds_derivatives(self):
+        product = self.create(jpeg_upload())
+        self.assertEqual(product.image_widths, [160, 320, 640, 1024])
+        self.assertTrue(product.image.name.startswith('products/originals/'))
+        for width in product.image_widths:
+            for ext in images.FORMATS:
+                with default_storage.open(images.derived_name(product.image_hash, width, ext)) as file:
+                    self.assertEqual(Image.open(file).width, width)
+        product.refresh_from_db()
+        self.assertEqual(product.image_widths, [160, 320, 640, 1024])
+        self.assertIn('320w', product.image_srcset['webp'])
+        self.assertTrue(product.image_srcset['src'].endswith('/640.jpg'))
+
+    def test_small_images_are_not_upscaled(self):
+        self.assertEqual(self.create(jpeg_upload(100, 80)).image_widths, [100])
+
+    def test_reuploads_share_one_original(self):
+        first = self.create(jpeg_upload(name='a.jpg'))
+        second = self.create(jpeg_upload(name='b.jpg'))
+        self.assertEqual(first.image.name, second.image.name)
+        _, files = default_storage.listdir('products')
+        self.assertEqual(files, [])
+        self.assertEqual(len(default_storage.listdir('products/originals')[1]), 1)
+
+    def test_templates_use_srcset(self):
+        self.create(jpeg_upload())
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '1024w')
+
+    def test_backfill_command(self):
+        names = [default_storage.save('products/old.jpg', jpeg_upload(color='blue')),
+                 default_storage.save('products/old.jpg', jpeg_upload(color='blue'))]
+        Product.objects.bulk_create([
+            Product(name=f'Old {i}', description='desc', price=1, category=self.category, stock=1, image=name)
+            for i, name in enumerate(names)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('build_image_derivatives', workers=1, stdout=io.StringIO())
+        products = list(Product.objects.all())
+        self.assertEqual({product.image.name for product in products}, {products[0].image.name})
+        self.assertTrue(all(product.image_widths == [160, 320, 640, 1024] for product in products))
+        self.assertEqual(default_storage.listdir('products')[1], [])
+
+
+class ProductImportTests(ClearCacheMixin, TestCase):
+    FEED = (
+        'sku,name,description,price,stock,category,calories\n'
+        'A-1,Oat milk,Barista oat milk,3.20,40,Groceries,120\n'
+        'A-2,Rye bread,Dark rye,not-a-price,5,Groceries,\n'
+        'A-3,Desk lamp,LED lamp,19.99,7,Lighting,\n'
+        ',No sku,desc,1.00,1,Groceries,\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        Category.objects.create(name='Groceries')
+
+    def run_import(self, feed, fmt='csv', **kwargs):
+        errors = {}
+        result = product_io.import_products(
+            product_io.read_rows(io.StringIO(feed), fmt), on_error=lambda line, e: errors.update({line: e}), **kwargs
+        )
+        return result, errors
+
+    def test_validates_rows_and_resolves_categories(self):
+        result, errors = self.run_import(self.FEED, batch_size=2)
+        self.assertEqual((result.created, result.updated, result.invalid), (1, 0, 3))
+        self.assertEqual(sorted(errors), [3, 4, 5])
+        self.assertIn('price', errors[3])
+        self.assertIn('category', errors[4])
+        self.assertIn('sku', errors[5])
+        self.assertEqual(Product.objects.get(sku='A-1').category.name, 'Groceries')
+
+    def test_reimport_updates_by_sku(self):
+        self.run_import(self.FEED, create_categories=True)
+        feed = self.FEED.replace('3.20,40', '3.50,0').replace('not-a-price', '2.10')
+        # Category map, then count + upsert + two FTS statements in one savepoint per batch
+        with self.assertNumQueries(7):
+            result, errors = self.run_import(feed, create_categories=True)
+        self.assertEqual((result.created, result.updated, result.invalid), (1, 2, 1))
+        self.assertEqual(Product.objects.filter(sku__isnull=False).count(), 3)
+        milk = Product.objects.get(sku='A-1')
+        self.assertEqual((milk.price, milk.stock), (Decimal('3.50'), 0))
+        self.assertEqual(Category.objects.filter(name='Lighting').count(), 1)
+        self.assertEqual([product.sku for product in search.search('rye')], ['A-2'])
+
+    def test_export_round_trips(self):
+        self.run_import(self.FEED, create_categories=True)
+        for fmt in product_io.FORMATS:
+            with self.subTest(fmt=fmt):
+                stream = io.StringIO()
+                self.assertEqual(product_io.export_products(stream, fmt), 2)
+                result, errors = self.run_import(stream.getvalue(), fmt)
+                self.assertEqual((result.created, result.updated, errors), (0, 2, {}))
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write(self.FEED)
+        self.addCleanup(os.unlink, feed.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_products', feed.name, create_categories=True, stdout=out, stderr=err)
+        self.assertIn('2 created', out.getvalue())
+        self.assertIn('line 3: price', err.getvalue())
+
+    def test_command_reads_stdin_without_closing_it(self):
+        stdin = io.StringIO(self.FEED)
+        with mock.patch('sys.stdin', stdin):
+            call_command('import_products', '-', create_categories=True, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(stdin.closed)
+        self.assertEqual(Product.objects.filter(sku__in=['A-1', 'A-3']).count(), 2)
+
+
+class QueryBudgetTests(ClearCacheMixin, TestCase):
+    """Every view in Commerce.urls declares a query budget and stays within it"""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.customer = User.objects.create_user('customer', password='pass12345')
+        self.products = make_products(30)
+        for product in self.products[:3]:
+            Product.objects.filter(pk=product.pk).update(stock=5)
+        self.category = self.products[0].category
+        self.cart = Cart.objects.create(user=self.customer)
+        for product in self.products[:6]:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+        for i in range(6):
+            order = Order.objects.create(user=self.customer, total_amount=Decimal('5.00'),
+                                         shipping_address='1 Road', payment_method='cash_on_delivery')
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=1, price=product.price)
+                                           for product in self.products[i:i + 3]])
+        self.order = order
+        # A customer's first order, and (with the day counter gone) the day's first too
+        self.newcomer = User.objects.create_user('newcomer', password='pass12345')
+        CartItem.objects.create(cart=Cart.objects.create(user=self.newcomer), product=self.products[7], quantity=1)
+        StoreStat.objects.filter(key__startswith='orders:').delete()
+
+    def assertWithinBudget(self, response):
+        request = response.wsgi_request
+        budget = request.resolver_match.func.query_budget
+        profile = request.query_profile
+        self.assertLess(response.status_code, 400)
+        self.assertLessEqual(profile.query_count, budget, '\n'.join(
+            f'{count}x {sql}' for sql, count in profile.statements.most_common()
+        ))
+        return profile
+
+    def cases(self):
+        """(user, method, url name, url args, POST data); method 'json' POSTs the data as JSON"""
+        product, order = self.products[0], self.order
+        item = self.cart.items.first()
+        checkout = {'shipping_address': '1 Road', 'phone_number': '0240000000', 'payment_method': 'cash_on_delivery'}
+        return [
+            (None, 'get', 'home', [], None),
+            (None, 'get', 'product_list', [], None),
+            (None, 'get', 'product_list_by_category', [self.category.id], None),
+            (None, 'get', 'product_list', [], {'min_price': '1', 'sort': '-price', 'availability': 'all'}),
+            (None, 'get', 'product_detail', [product.id], None),
+            (None, 'get', 'product_search', [], {'q': 'product'}),
+            (self.customer, 'get', 'home', [], None),
+            (self.customer, 'get', 'product_list', [], None),
+            (self.customer, 'get', 'product_detail', [self.products[1].id], None),
+            (self.customer, 'get', 'product_search', [], {'q': 'product'}),
+            (None, 'get', 'register', [], None),
+            (None, 'post', 'register', [], {'username': 'new', 'email': 'new@example.com',
+                                            'password1': 'Xy7!long-pass', 'password2': 'Xy7!long-pass'}),
+            (None, 'get', 'login', [], None),
+            (None, 'post', 'login', [], {'username': 'customer', 'password': 'pass12345'}),
+            (self.customer, 'get', 'view_cart', [], None),
+            (None, 'get', 'add_to_cart', [product.id], None),
+            (None, 'post', 'update_cart_item', [product.id], {'quantity': 3}),
+            (None, 'get', 'view_cart', [], None),
+            (None, 'get', 'remove_from_cart', [product.id], None),
+            (None, 'json', 'cart_api', [], {'operations': [{'op': 'add', 'product': product.id}]}),
+            (self.customer, 'json', 'cart_api', [], {'operations': [
+                {'op': 'add', 'product': self.products[20].id, 'quantity': 2},
+                {'op': 'set', 'product': self.products[1].id, 'quantity': 5},
+                {'op': 'remove', 'product': self.products[2].id},
+            ]}),
+            (self.customer, 'post', 'add_to_cart', [self.products[10].id], {'quantity': 2}),
+            (self.customer, 'post', 'add_to_cart', [product.id], {'quantity': 1}),
+            (self.customer, 'post', 'update_cart_item', [item.id], {'quantity': 3}),
+            (self.customer, 'get', 'checkout', [], None),
+            (self.customer, 'get', 'order_success', [order.id], None),
+            (self.customer, 'post', 'remove_from_cart', [item.id], None),
+            (self.newcomer, 'post', 'checkout', [], checkout),
+            (self.customer, 'post', 'checkout', [], checkout),
+            (self.customer, 'get', 'logout', [], None),
+            (self.staff, 'get', 'admin_dashboard', [], None),
+            (self.staff, 'get', 'admin_products', [], None),
+            (self.staff, 'get', 'admin_product_add', [], None),
+            (self.staff, 'get', 'admin_product_edit', [product.id], None),
+            (self.staff, 'post', 'admin_product_edit', [product.id],
+             {'name': 'Edited', 'description': 'desc', 'price': '3.00', 'stock': 4, 'category': self.category.id}),
+            (self.staff, 'get', 'customer_list', [], None),
+            (self.staff, 'get', 'user_order_history', [self.customer.id], None),
+            (self.staff, 'get', 'order_history', [], None),
+            (self.staff, 'post', 'update_order_status', [order.id], {'status': 'shipped'}),
+            (self.staff, 'get', 'export_data', ['order_items'], {'format': 'jsonl', 'status': 'pending'}),
+            (self.staff, 'get', 'sales_report', [], {'granularity': 'hour', 'date_from': '2026-03-01',
+                                                           'date_to': '2026-03-02'}),
+            (self.staff, 'get', 'admin_categories', [], None),
+            (self.staff, 'post', 'admin_categories', [], {'name': 'New category', 'description': ''}),
+            (self.staff, 'post', 'admin_product_delete', [self.products[-1].id], None),
+            (self.staff, 'post', 'admin_category_delete', [Category.objects.create(name='Empty').id], None),
+            (self.staff, 'get', 'admin_performance', [], None),
+        ]
+
+    def test_every_view_declares_a_budget(self):
+        missing = [pattern.name for pattern in urls.urlpatterns
+                   if getattr(pattern.callback, 'query_budget', None) is None]
+        self.assertEqual(missing, [])
+
+    def test_views_stay_within_budget(self):
+        covered = set()
+        for user, method, name, args, data in self.cases():
+            with self.subTest(view=name, method=method):
+                self.client.logout()
+                if user:
+                    self.client.force_login(user)
+                if method == 'json':
+                    response = self.client.post(reverse(name, args=args), data, content_type='application/json')
+                else:
+                    response = getattr(self.client, method)(reverse(name, args=args), data)
+                self.assertWithinBudget(response)
+                covered.add(response.wsgi_request.resolver_match.url_name)
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns} - covered, set())
+
+    def test_report(self):
+        profiling.reset()
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.client.force_login(self.staff)
+        rows = {row['view']: row for row in self.client.get(reverse('admin_performance')).json()['views']}
+        self.assertEqual(rows['home']['requests'], 2)
+        self.assertEqual(rows['home']['budget'], urls.views.home.query_budget)
+        self.assertGreater(rows['home']['avg_template_ms'], 0)
+        self.assertEqual(rows['home']['over_budget'], 0)
+
+
+ASYNC_URLCONF = ModuleType('async_urls')
+ASYNC_URLCONF.urlpatterns = urls.with_async_views(urls.urlpatterns)
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="[^"]+"')
+
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+class AsyncViewTests(ClearCacheMixin, TestCase):
+    """The async views render what their sync twins do, within the same budgets"""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.customer = User.objects.create_user('customer', password='pass12345')
+        self.products = make_products(30)
+        self.category = self.products[0].category
+
+    def cases(self):
+        """(user, url name, url args)"""
+        return [
+            (None, 'home', []),
+            (None, 'product_list', []),
+            (None, 'product_list_by_category', [self.category.id]),
+            (self.customer, 'product_detail', [self.products[3].id]),
+            (self.staff, 'admin_dashboard', []),
+        ]
+
+    def content(self, response):
+        return CSRF_TOKEN.sub('', response.content.decode())
+
+    def aget(self, url):
+        return async_to_sync(self.async_client.get)(url)
+
+    def test_async_views_match_sync_views(self):
+        for user, name, args in self.cases():
+            with self.subTest(view=name):
+                url = reverse(name, args=args)
+                for client in (self.client, self.async_client):
+                    client.logout()
+                    if user:
+                        client.force_login(user)
+                response = self.aget(url)
+                match = response.asgi_request.resolver_match
+                self.assertIn(match.func, urls.ASYNC_VIEWS.values())
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(response.asgi_request.query_profile.query_count, match.func.query_budget)
+                with self.settings(ROOT_URLCONF='DjangoProject3.urls'):
+                    expected = self.client.get(url)
+                self.assertEqual(self.content(response), self.content(expected))
+
+    def test_filtered_listing(self):
+        url = reverse('product_list_by_category', args=[self.category.id]) + '?sort=price&max_price=10'
+        response = self.aget(url)
+        self.assertEqual(response.status_code, 200)
+        with self.settings(ROOT_URLCONF='DjangoProject3.urls'):
+            expected = self.client.get(url)
+        self.assertEqual(self.content(response), self.content(expected))
+
+    def test_not_found_and_staff_only(self):
+        response = self.aget(reverse('product_detail', args=[self.products[-1].id + 1]))
+        self.assertEqual(response.status_code, 404)
+        response = self.aget(reverse('product_list_by_category', args=[self.category.id + 1]))
+        self.assertEqual(response.status_code, 404)
+        self.async_client.force_login(self.customer)
+        response = self.aget(reverse('admin_dashboard'))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+
+class OrderSummaryTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.customer = User.objects.create_user('customer', password='pass12345')
+        self.products = make_products(4)
+        self.client.force_login(self.staff)
+
+    def add_orders(self, count):
+        orders = Order.objects.bulk_create([
+            Order(user=self.customer, total_amount=Decimal('10.00'), shipping_address='1 Road',
+                  payment_method='cash_on_delivery')
+            for _ in range(count)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, price=Decimal('2.50'))
+            for order in orders for product in self.products
+        ])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_orders(self):
+        for url in [reverse('order_history') + '?page_size=100', reverse('user_order_history', args=[self.customer.id])]:
+            with self.subTest(url=url):
+                Order.objects.all().delete()
+                self.add_orders(5)
+                few, _ = self.count_queries(url)
+                self.add_orders(95)
+                many, response = self.count_queries(url)
+                self.assertEqual(few, many)
+                self.assertContains(response, '+2 more', count=100)
+
+    def test_summaries_are_annotated(self):
+        self.add_orders(1)
+        order, = order_summaries.summarize(order_summaries.with_summaries(Order.objects.all(), preview=2))
+        self.assertEqual((order.item_count, order.item_quantity, order.items_total), (4, 8, Decimal('20.00')))
+        self.assertEqual((len(order.preview_items), order.remaining_items), (2, 2))
+        self.assertEqual(order.preview_items[0].get_total_price(), Decimal('5.00'))
+
+
+class BenchmarkTests(ClearCacheMixin, TestCase):
+    def test_generate(self):
+        counts = benchmarks.generate(products=40, customers=6, orders=30, categories=3, days=30)
+        self.assertEqual(counts['carts'], 1)
+        self.assertEqual((Product.objects.count(), Order.objects.count()), (40, 30))
+        self.assertTrue(self.client.login(username=benchmarks.username(0), password=benchmarks.PASSWORD))
+        oldest = Order.objects.order_by('created_at').first().created_at
+        self.assertLess(oldest, timezone.now() - timedelta(days=1))
+        self.assertEqual(list(stats.customer_drift()), [])
+        self.assertEqual(stats.dashboard_counters()['total_orders'], 30)
+
+    def test_summarize(self):
+        result = benchmarks.summarize([i / 1000 for i in range(1, 101)], elapsed=2, queries=[3, 5])
+        self.assertEqual((result['p50_ms'], result['p95_ms'], result['p99_ms']), (50.0, 95.0, 99.0))
+        self.assertEqual((result['throughput_rps'], result['queries']), (50.0, 4.0))
+
+    def test_bench_views_command(self):
+        benchmarks.generate(products=20, customers=3, orders=5, categories=2)
+        out = io.StringIO()
+        call_command('bench_views', iterations=2, view=['home', 'checkout'], stdout=out)
+        self.assertIn('checkout (place order)', out.getvalue())
+        self.assertNotIn('admin_dashboard', out.getvalue())
+        self.assertEqual(Order.objects.count(), 5)
+
+    def test_bench_exports_command(self):
+        benchmarks.generate(products=10, customers=3, orders=12, categories=2)
+        out = io.StringIO()
+        call_command('bench_exports', dataset=['orders', 'customers'], memory=True, stdout=out)
+        self.assertIn('orders jsonl: 12 rows', out.getvalue())
+        self.assertIn('customers csv: 3 rows', out.getvalue())
+        self.assertEqual(Order.objects.count(), 12)
+
+    def test_bench_analytics_command(self):
+        benchmarks.generate(products=10, customers=3, orders=20, categories=2, days=10)
+        out = io.StringIO()
+        call_command('bench_analytics', days=[1, 30], repeat=2, stdout=out)
+        self.assertIn('30d rollups', out.getvalue())
+        self.assertIn('30d order lines', out.getvalue())
+        self.assertEqual(DailySales.objects.filter(category=None, product=None).aggregate(Sum('orders'))['orders__sum'],
+                         Order.objects.exclude(status='cancelled').count())
+
+    def test_bench_catalog_snapshot_command(self):
+        out = io.StringIO()
+        call_command('bench_catalog_snapshot', products=[300], queries=4, python=True, stdout=out)
+        self.assertIn('300 snapshot page', out.getvalue())
+        self.assertIn('300 orm facets', out.getvalue())
+        self.assertIn('300 products: snapshot', out.getvalue())
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_bench_fragments_command(self):
+        out = io.StringIO()
+        call_command('bench_fragments', products=15, iterations=2, stdout=out)
+        self.assertIn('warm: p50', out.getvalue())
+        self.assertIn('card hit rate 100%', out.getvalue())
+        self.assertEqual(Product.objects.count(), 0)
@@ -0,0 +1,43 @@
+"""Single-statement INSERT ... ON CONFLICT DO UPDATE for counters and cart lines.
+
+Django's bulk_create(update_conflicts=True) can only overwrite a column
+with the inserted value. Counters need to add to the stored row instead,
+so a concurrent writer's increment is never lost and a missing row costs
+no extra round trip to create.
+"""
+from django.db import connection
+
+
+def increments(*columns):
+    """``updates`` for upsert() that add the inserted values to the stored ones"""
+    return {column: f'{{old}}."{column}" + {{new}}."{column}"' for column in columns}
+
+
+def upsert(model, rows, conflict, updates, where=None):
+    """Insert ``rows`` (dicts of field values), or apply ``updates`` to the ones already there, in one query.
+
+    ``conflict`` lists the fields of the unique constraint to upsert on, and
+    ``where`` is its condition (SQL) when it is a partial one. ``updates``
+    maps column names to SQL over the stored row (``old``) and the row being
+    inserted (``new``).
+    """
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    targets = [model._meta.get_field(name).column for name in conflict]
+    placeholders = ', '.join([f'({", ".join(["%s"] * len(fields))})'] * len(rows))
+    params = [field.get_db_prep_save(row[field.name], connection) for row in rows for field in fields]
+    target = f'({", ".join(quote(column) for column in targets)})'
+    if where:
+        target += f' WHERE {where}'
+    assignments = ', '.join(
+        f'{quote(column)} = {expression.format(old=table, new="excluded")}' for column, expression in updates.items()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) VALUES {placeholders} '
+            f'ON CONFLICT {target} DO UPDATE SET {assignments}',
+            params,
+        )
@@ -1,24 +1,29 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import URLPattern, path
 from django.contrib.auth import views as auth_views
 from . import views
+from .profiling import query_budget
 
 urlpatterns = [
     # ========== MAIN SITE URLS ==========
     path('', views.home, name='home'),
     path('register/', views.register, name='register'),
-    path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
+    # Includes merging the guest cart into the user's Cart
+    path('login/', query_budget(15)(auth_views.LoginView.as_view(template_name='login.html')), name='login'),
     path('logout/', views.custom_logout, name='logout'),
 
     # Products
     path('products/', views.product_list, name='product_list'),
     path('products/category/<int:category_id>/', views.product_list, name='product_list_by_category'),
     path('product/<int:product_id>/', views.product_detail, name='product_detail'),
+    path('search/', views.product_search, name='product_search'),
 
     # Cart
     path('cart/', views.view_cart, name='view_cart'),
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('cart/update/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
+    path('cart/api/', views.cart_api, name='cart_api'),
 
     # Checkout
     path('checkout/', views.checkout, name='checkout'),
@@ -42,7 +47,36 @@ urlpatterns = [
     path('admin/orders/', views.order_history, name='order_history'),
     path('manage/orders/<int:order_id>/update-status/', views.update_order_status, name='update_order_status'),
 
+    # Exports: orders, order_items or customers
+    path('manage/exports/<slug:dataset>/', views.export_data, name='export_data'),
+
+    # Sales analytics from the hourly and daily rollups
+    path('manage/sales/', views.sales_report, name='sales_report'),
+
     path('manage/categories/', views.admin_categories, name='admin_categories'),
     path('manage/categories/<int:category_id>/delete/', views.admin_category_delete, name='admin_category_delete'),
 
+    # Performance
+    path('manage/performance/', views.admin_performance, name='admin_performance'),
+
 ]
+
+# Async twins of the read-heavy views, served instead when ASYNC_VIEWS is on
+# (the default under DjangoProject3.asgi). Sync views under ASGI all share
+# one thread, so the sync set stays the WSGI default.
+ASYNC_VIEWS = {
+    views.home: views.ahome,
+    views.product_list: views.aproduct_list,
+    views.product_detail: views.aproduct_detail,
+    views.admin_dashboard: views.aadmin_dashboard,
+}
+
+
+def with_async_views(patterns):
+    return [URLPattern(pattern.pattern, ASYNC_VIEWS.get(pattern.callback, pattern.callback),
+                       pattern.default_args, pattern.name)
+            for pattern in patterns]
+
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = with_async_views(urlpatterns)
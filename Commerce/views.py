@@ -1,13 +1,23 @@
+import asyncio
+import json
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
-from .models import Product, Category, Cart, CartItem, Order, OrderItem, User
-from .forms import UserRegisterForm, CheckoutForm, ProductForm
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from .models import Product, Category, Cart, CartItem, Order, OrderItem, User, CustomerStats
+from .forms import UserRegisterForm, CheckoutForm, ExportForm, ProductFilterForm, ProductForm, SalesReportForm
+from .cart import GuestCart, apply_cart_changes, get_cart_summary, parse_operations, summary_json
+from .checkout import place_order, hold_cart, CheckoutError
+from .pagination import KeysetPage, KeysetPaginator
+from . import analytics, catalog_cache, catalog_snapshot, dashboard, exports, order_summaries, profiling, search, stats
+from .profiling import query_budget
+from .conditional import conditional, listing_page, product_page
 from django.contrib.auth import logout as auth_logout
-from django.db.models import Sum, Count, Max, Q
-from datetime import date
+from django.db.models import Count, Sum, F
 from functools import wraps
 
 
@@ -15,50 +25,163 @@ from functools import wraps
 def staff_required(view_func):
     """Decorator to ensure user is staff member"""
 
-    def wrapper(request, *args, **kwargs):
-        if not request.user.is_authenticated:
+    def check(request, user):
+        if not user.is_authenticated:
             messages.error(request, 'Please log in to access this page.')
             return redirect('login')
-        if not request.user.is_staff:
+        if not user.is_staff:
             messages.error(request, 'Access denied. Admin privileges required.')
             return redirect('home')
-        return view_func(request, *args, **kwargs)
+        return None
+
+    if iscoroutinefunction(view_func):
+        async def async_wrapper(request, *args, **kwargs):
+            return check(request, await request.auser()) or await view_func(request, *args, **kwargs)
+        return async_wrapper
+
+    def wrapper(request, *args, **kwargs):
+        return check(request, request.user) or view_func(request, *args, **kwargs)
 
     return wrapper
 
 
 # ========== MAIN SITE VIEWS ==========
+# home, product_list, product_detail and admin_dashboard have async twins
+# (a-prefixed) that Commerce.urls routes to when served over ASGI.
+# Rendering stays sync: context processors and templates may hit the DB.
+
+async def arender(request, template_name, context):
+    # Share the user that auser() loaded instead of loading it again in render
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@query_budget(6)
+@conditional(listing_page)
 def home(request):
-    categories = Category.objects.all()
-    featured_products = Product.objects.filter(stock__gt=0).distinct()[:8]
     return render(request, 'home.html', {
+        'categories': catalog_cache.categories(),
+        'featured_products': catalog_cache.featured_products(),
+    })
+
+
+@query_budget(6)
+@conditional(listing_page)
+async def ahome(request):
+    categories, featured_products = await asyncio.gather(
+        catalog_cache.acategories(), catalog_cache.afeatured_products()
+    )
+    return await arender(request, 'home.html', {
         'categories': categories,
         'featured_products': featured_products,
     })
 
 
-def product_list(request, category_id=None):
-    category = None
-    categories = Category.objects.all()
-    products = Product.objects.filter(stock__gt=0)
+def _listing_args(request):
+    return {
+        'after': request.GET.get('after'),
+        'before': request.GET.get('before'),
+        'page_size': request.GET.get('page_size'),
+    }
 
-    if category_id:
-        category = get_object_or_404(Category, id=category_id)
-        products = products.filter(category=category)
 
-    products = products.distinct()
-    return render(request, 'product_list.html', {
-        'products': products,
+def _facets(categories, filters, counts):
+    """Facet links for product_list: category, price bucket and availability counts under the other filters"""
+    prices = []
+    for (low, high), upper, count in zip(catalog_snapshot.price_ranges(), (*catalog_snapshot.PRICE_EDGES, None),
+                                         counts['prices']):
+        prices.append({'min': low, 'max': high, 'upper': upper, 'count': count,
+                       'active': (low, high) == (filters.min_price, filters.max_price)})
+    return {
+        'categories': [(cat, counts['categories'].get(cat.id, 0)) for cat in categories],
+        'total': sum(counts['categories'].values()),
+        'prices': prices,
+        'in_stock': counts['in_stock'],
+        'all': counts['all'],
+        'include_out_of_stock': not filters.in_stock,
+    }
+
+
+def _product_list_context(request, category_id, categories, listing, form, filters, counts):
+    category = None
+    if category_id:
+        category = next((cat for cat in categories if cat.id == category_id), None)
+        if category is None:
+            raise Http404('No Category matches the given query.')
+
+    page = KeysetPage(listing['rows'], request.GET, listing['next_cursor'], listing['previous_cursor'])
+    return {
+        'products': page,
+        'page': page,
+        'total_products': listing['total'],
         'categories': categories,
-        'category': category
-    })
+        'category': category,
+        'filter_form': form,
+        'facets': _facets(categories, filters, counts),
+    }
 
 
+@query_budget(6)
+@conditional(listing_page)
+def product_list(request, category_id=None):
+    categories = catalog_cache.categories()
+    form = ProductFilterForm(request.GET)
+    filters = form.filters(category_id)
+    if filters:
+        listing = catalog_snapshot.listing(filters, **_listing_args(request))
+    else:
+        listing = catalog_cache.listing(category_id, **_listing_args(request))
+    filters = filters or catalog_snapshot.Filters(category_id=category_id)
+    counts = catalog_snapshot.facets(filters)
+    return render(request, 'product_list.html',
+                  _product_list_context(request, category_id, categories, listing, form, filters, counts))
+
+
+@query_budget(6)
+@conditional(listing_page)
+async def aproduct_list(request, category_id=None):
+    form = ProductFilterForm(request.GET)
+    filters = form.filters(category_id)
+    if filters:
+        listing = sync_to_async(catalog_snapshot.listing)(filters, **_listing_args(request))
+    else:
+        listing = catalog_cache.alisting(category_id, **_listing_args(request))
+    filters = filters or catalog_snapshot.Filters(category_id=category_id)
+    categories, listing, counts = await asyncio.gather(catalog_cache.acategories(), listing,
+                                                       catalog_snapshot.afacets(filters))
+    context = _product_list_context(request, category_id, categories, listing, form, filters, counts)
+    return await arender(request, 'product_list.html', context)
+
+
+@query_budget(4)
+@conditional(product_page)
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    product = catalog_cache.product(product_id)
+    if product is None:
+        raise Http404('No Product matches the given query.')
     return render(request, 'product_detail.html', {'product': product})
 
 
+@query_budget(4)
+@conditional(product_page)
+async def aproduct_detail(request, product_id):
+    product = await catalog_cache.aproduct(product_id)
+    if product is None:
+        raise Http404('No Product matches the given query.')
+    return await arender(request, 'product_detail.html', {'product': product})
+
+
+@query_budget(5)
+def product_search(request):
+    query = request.GET.get('q', '').strip()
+    products = search.search(query, queryset=Product.objects.filter(stock__gt=0)) if query else []
+    return render(request, 'search_results.html', {
+        'products': products,
+        'query': query,
+    })
+
+
+@query_budget(12)
 def register(request):
     if request.user.is_authenticated:
         messages.info(request, 'You are already logged in!')
@@ -81,18 +204,35 @@ def register(request):
     return render(request, 'register_fixed.html', {'form': form})
 
 
-@login_required
+# Anonymous visitors get a GuestCart in a signed cookie, which costs no
+# database writes and is merged into their Cart when they log in.
+
+@query_budget(5)
 def view_cart(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items_count = cart.items.count()
+    if request.user.is_authenticated:
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        cart_items_count = get_cart_summary(request, cart).line_count
+    else:
+        cart = GuestCart.from_request(request)
+        cart_items_count = cart.summary.line_count
     return render(request, 'cart.html', {
         'cart': cart,
         'cart_items_count': cart_items_count
     })
 
 
-@login_required
+@query_budget(8)
 def add_to_cart(request, product_id):
+    if not request.user.is_authenticated:
+        product = catalog_cache.product(product_id)
+        if product is None:
+            raise Http404('No Product matches the given query.')
+        if GuestCart.from_request(request).add(product.id):
+            messages.success(request, f'{product.name} added to cart!')
+        else:
+            messages.error(request, 'Your cart is full. Log in to add more products.')
+        return redirect('view_cart')
+
     product = get_object_or_404(Product, id=product_id)
     cart, created = Cart.objects.get_or_create(user=request.user)
 
@@ -109,19 +249,34 @@ def add_to_cart(request, product_id):
     return redirect('view_cart')
 
 
-@login_required
+@query_budget(5)
 def remove_from_cart(request, item_id):
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    cart_item.delete()
+    if not request.user.is_authenticated:
+        # Guest cart lines are addressed by product id
+        GuestCart.from_request(request).remove(item_id)
+    else:
+        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+        cart_item.delete()
     messages.success(request, 'Item removed from cart!')
     return redirect('view_cart')
 
 
-@login_required
+@query_budget(5)
 def update_cart_item(request, item_id):
+    if request.method == 'POST':
+        try:
+            quantity = int(request.POST.get('quantity', 1))
+        except ValueError:
+            messages.error(request, 'Quantity must be a whole number.')
+            return redirect('view_cart')
+
+    if not request.user.is_authenticated:
+        if request.method == 'POST':
+            GuestCart.from_request(request).update(item_id, quantity)
+        return redirect('view_cart')
+
     cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     if request.method == 'POST':
-        quantity = int(request.POST.get('quantity', 1))
         if quantity > 0:
             cart_item.quantity = quantity
             cart_item.save()
@@ -130,11 +285,40 @@ def update_cart_item(request, item_id):
     return redirect('view_cart')
 
 
+@query_budget(12)
+@require_POST
+def cart_api(request):
+    """Apply a batch of cart operations and return the recomputed cart as JSON.
+
+    Body: {"operations": [{"op": "add" | "set" | "remove", "product": id, "quantity": n}, ...]}
+    """
+    try:
+        changes = parse_operations(json.loads(request.body).get('operations'))
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    unknown = set(changes) - set(Product.objects.filter(id__in=list(changes)).values_list('id', flat=True))
+    if unknown:
+        return JsonResponse({'error': f'Unknown products: {sorted(unknown)}'}, status=400)
+
+    rejected = []
+    if request.user.is_authenticated:
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        apply_cart_changes(cart, changes)
+        summary = get_cart_summary(request, cart)
+    else:
+        guest_cart = GuestCart.from_request(request)
+        rejected = guest_cart.apply(changes)
+        summary = guest_cart.summary
+    return JsonResponse({**summary_json(summary), 'rejected': rejected})
+
+
+@query_budget(19)
 @login_required
 def checkout(request):
     cart = get_object_or_404(Cart, user=request.user)
+    summary = get_cart_summary(request, cart)
 
-    if not cart.items.exists():
+    if not summary.lines:
         messages.error(request, 'Your cart is empty!')
         return redirect('view_cart')
 
@@ -142,36 +326,25 @@ def checkout(request):
         form = CheckoutForm(request.POST)
         if form.is_valid():
             try:
-                with transaction.atomic():
-                    shipping_address = form.cleaned_data['shipping_address']
-                    payment_method = form.cleaned_data['payment_method']
-
-                    order = Order.objects.create(
-                        user=request.user,
-                        total_amount=cart.get_total_price(),
-                        shipping_address=shipping_address,
-                        payment_method=payment_method,
-                        status='pending'
-                    )
-
-                    for cart_item in cart.items.all():
-                        OrderItem.objects.create(
-                            order=order,
-                            product=cart_item.product,
-                            quantity=cart_item.quantity,
-                            price=cart_item.product.price
-                        )
-                        cart_item.product.stock -= cart_item.quantity
-                        cart_item.product.save()
-
-                    cart.items.all().delete()
-                    messages.success(request, 'Order placed successfully!')
-                    return redirect('order_success', order_id=order.id)
+                order = place_order(
+                    request.user, cart,
+                    shipping_address=form.cleaned_data['shipping_address'],
+                    payment_method=form.cleaned_data['payment_method'],
+                )
+                messages.success(request, 'Order placed successfully!')
+                return redirect('order_success', order_id=order.id)
+            except CheckoutError as e:
+                messages.error(request, str(e))
             except Exception as e:
                 messages.error(request, f'An error occurred while processing your order: {str(e)}')
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
+        try:
+            hold_cart(request.user, summary.lines)
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect('view_cart')
         form = CheckoutForm()
 
     return render(request, 'checkout.html', {
@@ -180,12 +353,14 @@ def checkout(request):
     })
 
 
+@query_budget(5)
 @login_required
 def order_success(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
     return render(request, 'order_success.html', {'order': order})
 
 
+@query_budget(5)
 def custom_logout(request):
     auth_logout(request)
     messages.success(request, 'Successfully logged out.')
@@ -193,55 +368,31 @@ def custom_logout(request):
 
 
 # ========== ADMIN VIEWS ==========
+@query_budget(10)
 @login_required
 @staff_required
 def admin_dashboard(request):
     """Admin dashboard view - Overview with quick stats"""
     try:
-        # Basic statistics
-        total_orders = Order.objects.count()
-        total_revenue = Order.objects.aggregate(total=Sum('total_amount'))['total'] or 0
-        total_customers = User.objects.filter(is_staff=False).count()
-        total_products = Product.objects.count()
-
-        # Recent data
-        recent_orders = Order.objects.select_related('user').order_by('-created_at')[:10]
-        recent_users = User.objects.filter(is_staff=False).order_by('-date_joined')[:5]
-
-        # Top customers with order stats
-        top_customers = User.objects.filter(
-            order__isnull=False
-        ).annotate(
-            total_orders=Count('order'),
-            total_spent=Sum('order__total_amount')
-        ).order_by('-total_spent')[:5]
-
-        # Additional stats
-        categories = Category.objects.all()
-        active_carts = Cart.objects.count()
-        today_orders = Order.objects.filter(created_at__date=date.today()).count()
-        low_stock_products = Product.objects.filter(stock__lt=10)[:5]
-        context = {
-            'total_orders': total_orders,
-            'total_revenue': total_revenue,
-            'total_customers': total_customers,
-            'total_products': total_products,
-            'recent_orders': recent_orders,
-            'recent_users': recent_users,
-            'top_customers': top_customers,
-            'categories': categories,
-            'active_carts': active_carts,
-            'today_orders': today_orders,
-            'low_stock_products': low_stock_products,
-        }
-        return render(request, 'admin/admin_dashboard.html', context)
-
+        return render(request, 'admin/admin_dashboard.html', dashboard.context())
     except Exception as e:
         messages.error(request, f'Error loading dashboard: {str(e)}')
     return redirect('home')
 
 
+@query_budget(10)
+@login_required
+@staff_required
+async def aadmin_dashboard(request):
+    try:
+        context = await dashboard.acontext()
+        return await arender(request, 'admin/admin_dashboard.html', context)
+    except Exception as e:
+        messages.error(request, f'Error loading dashboard: {str(e)}')
+    return redirect('home')
+
 
+@query_budget(8)
 @login_required
 @staff_required
 def admin_products(request):
@@ -257,13 +408,12 @@ def admin_products(request):
     # Search functionality
     search_query = request.GET.get('search')
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        products = search.filter_products(products, search_query)
 
+    page = KeysetPaginator(products, page_size=50).page_from_request(request)
     context = {
-        'products': products,
+        'products': page,
+        'page': page,
         'categories': categories,
         'total_products': products.count(),
         'low_stock_products': products.filter(stock__lt=10).count(),
@@ -272,6 +422,7 @@ def admin_products(request):
     return render(request, 'admin/admin_products.html', context)
 
 
+@query_budget(9)
 @login_required
 @staff_required
 def admin_product_edit(request, product_id=None):
@@ -301,6 +452,7 @@ def admin_product_edit(request, product_id=None):
         return render(request, 'admin/product_edit.html', context)
 
 
+@query_budget(11)
 @login_required
 @staff_required
 def admin_product_delete(request, product_id):
@@ -312,34 +464,41 @@ def admin_product_delete(request, product_id):
     return redirect('admin_products')
 
 
+@query_budget(5)
 @login_required
 @staff_required
 def customer_list(request):
     """View all customers with order statistics"""
 
+    # Totals come from the CustomerStats row joined in, not a GROUP BY over orders
     customers = User.objects.filter(is_staff=False).annotate(
-        total_orders=Count('order'),
-        total_spent=Sum('order__total_amount'),
-        last_order_date=Max('order__created_at')
-    ).order_by('-date_joined')
+        total_orders=F('stats__total_orders'),
+        total_spent=F('stats__total_spent'),
+        last_order_date=F('stats__last_order_at')
+    )
 
+    page = KeysetPaginator(customers, field='date_joined', page_size=50).page_from_request(request)
     context = {
-        'customers': customers,
+        'customers': page,
+        'page': page,
     }
     return render(request, 'admin/customer_list.html', context)
 
 
+@query_budget(8)
 @login_required
 @staff_required
 def user_order_history(request, user_id):
     """View detailed order history for a specific user"""
     user_profile = get_object_or_404(User, id=user_id)
-    orders = Order.objects.filter(user=user_profile).select_related('user').prefetch_related(
-        'items__product').order_by('-created_at')
-
-    # Calculate user statistics
-    total_orders = orders.count()
-    total_spent = orders.aggregate(total=Sum('total_amount'))['total'] or 0
+    orders = order_summaries.with_summaries(Order.objects.filter(user=user_profile).order_by('-created_at'),
+                                            preview=order_summaries.PREVIEW_ITEMS)
+    order_summaries.summarize(orders)
+
+    # User statistics are materialized in CustomerStats
+    customer_stats = CustomerStats.objects.filter(user=user_profile).first()
+    total_orders = customer_stats.total_orders if customer_stats else 0
+    total_spent = customer_stats.total_spent if customer_stats else 0
     avg_order_value = total_spent / total_orders if total_orders > 0 else 0
 
     context = {
@@ -352,11 +511,12 @@ def user_order_history(request, user_id):
     return render(request, 'admin/user_order_history.html', context)
 
 
+@query_budget(8)
 @login_required
 @staff_required
 def order_history(request):
     """View all orders with filtering"""
-    orders = Order.objects.select_related('user').prefetch_related('items__product').order_by('-created_at')
+    orders = Order.objects.select_related('user')
 
     # Status filter
     status_filter = request.GET.get('status')
@@ -367,8 +527,12 @@ def order_history(request):
     total_orders = orders.count()
     total_revenue = orders.aggregate(total=Sum('total_amount'))['total'] or 0
 
+    # The order detail modals list every item, so prefetch them all
+    page = KeysetPaginator(order_summaries.with_summaries(orders), page_size=50).page_from_request(request)
+    order_summaries.summarize(page)
     context = {
-        'orders': orders,
+        'orders': page,
+        'page': page,
         'total_orders': total_orders,
         'total_revenue': total_revenue,
         'status_choices': Order.STATUS_CHOICES,
@@ -377,11 +541,51 @@ def order_history(request):
     return render(request, 'order_history.html', context)
 
 
+# Session and user; the rows themselves are read while the response streams
+@query_budget(2)
+@login_required
+@staff_required
+def export_data(request, dataset):
+    """Stream orders, order lines or customers as CSV or JSON lines"""
+    if dataset not in exports.DATASETS:
+        raise Http404('Unknown export')
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(' '.join(message for errors in form.errors.values() for message in errors))
+    export = exports.Export(
+        dataset, form.cleaned_data['format'] or 'csv',
+        date_from=form.cleaned_data['date_from'], date_to=form.cleaned_data['date_to'],
+        statuses=form.cleaned_data['status'],
+    )
+    response = StreamingHttpResponse(export, content_type=export.content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export.filename}"'
+    return response
+
+
+# Session, user, the navbar cart count, and the four queries of analytics.report()
+@query_budget(7)
+@login_required
+@staff_required
+def sales_report(request):
+    """Orders, units and revenue over a date range, by day or hour, with the top categories and products"""
+    form = SalesReportForm(request.GET)
+    if not form.is_valid():
+        return render(request, 'admin/sales_report.html', {'form': form}, status=400)
+    report = analytics.report(form.cleaned_data['date_from'], form.cleaned_data['date_to'],
+                              form.cleaned_data['granularity'])
+    return render(request, 'admin/sales_report.html', {
+        'form': form,
+        'report': report,
+        'hourly': form.cleaned_data['granularity'] == 'hour',
+    })
+
+
+@query_budget(5)
 @login_required
 @staff_required
 def admin_categories(request):
     """Category management view"""
-    categories = Category.objects.all()
+    categories = Category.objects.annotate(product_count=Count('product'))
 
     if request.method == 'POST':
         # Handle category creation
@@ -398,6 +602,7 @@ def admin_categories(request):
     return render(request, 'admin/admin_categories.html', context)
 
 
+@query_budget(7)
 @login_required
 @staff_required
 def admin_category_delete(request, category_id):
@@ -409,6 +614,7 @@ def admin_category_delete(request, category_id):
     return redirect('admin_categories')
 
 
+@query_budget(5)
 @login_required
 @staff_required
 def update_order_status(request, order_id):
@@ -426,4 +632,11 @@ def update_order_status(request, order_id):
         else:
             messages.error(request, 'Invalid status selected.')
 
-    return redirect('order_history')
\ No newline at end of file
+    return redirect('order_history')
+
+@query_budget(3)
+@login_required
+@staff_required
+def admin_performance(request):
+    """Per-view query counts and timings recorded by QueryBudgetMiddleware"""
+    return JsonResponse({'views': profiling.report()})
@@ -20,12 +20,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its query counts and timings cover every other middleware
+    'Commerce.profiling.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Collected static files and media, before sessions and auth load
+    'Commerce.assets.AssetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'Commerce.cart.GuestCartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -33,7 +38,8 @@ ROOT_URLCONF = 'DjangoProject3.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus per-request render timing
+        'BACKEND': 'Commerce.profiling.ProfilingTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -54,9 +60,38 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock when a transaction starts so concurrent
+        # checkouts queue on the busy timeout instead of failing to upgrade.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # A file-backed test database lets threaded tests share it.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'reggiemercy',
+        # Room for a card fragment and a version token per product; the
+        # default of 300 entries would cull a 1,000-card listing as it renders
+        'OPTIONS': {'MAX_ENTRIES': 50_000},
+    },
+}
+
+# Catalog reads (Commerce.catalog_cache) are invalidated explicitly, so the
+# timeout only bounds how long unused entries linger.
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Filtered product listings read an in-memory columnar copy of the catalog
+# (Commerce.catalog_snapshot), about 48 MB per process for a million
+# products. Set to 0 to filter in SQL instead.
+CATALOG_SNAPSHOT = os.environ.get('DJANGO_CATALOG_SNAPSHOT', '1') == '1'
+
+# Route the storefront and dashboard to their async views (Commerce.urls).
+# DjangoProject3.asgi turns this on; WSGI servers keep the sync views.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -79,12 +114,26 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+# collectstatic writes hashed, precompressed copies here for Commerce.assets to serve
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'Commerce.assets.HashedCompressedStorage'},
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Threads per process that run Commerce.outbox jobs as soon as they commit;
+# run_outbox_worker picks up whatever they miss. 0 leaves it all to the worker.
+OUTBOX_WORKERS = int(os.environ.get('DJANGO_OUTBOX_WORKERS', '2'))
+
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'ReggieMercy <orders@reggiemercy.example>'
+
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
\ No newline at end of file
@@ -4,9 +4,6 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
-    # Your custom admin routes FIRST (before Django admin)
-    path('admin/', include('Commerce.urls')),
-
     # Django built-in admin (with a different prefix or keep as is)
     path('django-admin/', admin.site.urls),
 